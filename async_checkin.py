@@ -0,0 +1,667 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from automation import CHECKED_IN_XPATH, CHECKIN_BUTTON_XPATH
+from captcha_handler import CLICK_SCRIPT, IMAGE_SIGNATURES, CaptchaHandler
+from cdp_engine import Browser, BrowserContext, Page, Selector
+from config import Account, Config
+from human_simulator import TYPE_SCRIPT, HumanSimulator
+from metrics import RunMetrics, export_run_metrics
+from orchestrator import AccountResult, CheckInOrchestrator
+from process_memory import PeakRssSampler
+from request_policy import RequestPolicy
+from retry_policy import ABORT, MODEL_API_ERROR, PAGE_ERROR, REFRESH_CAPTCHA, RetryPolicy
+from run_log import set_account
+from session_store import SessionStore
+from wait_engine import WaitEngine, get_profile
+from webdriver_manager import CAPTCHA_IMAGE_URL_FILTER, VERIFY_URL_FILTER
+
+logger = logging.getLogger(__name__)
+
+AGE_CONFIRM_XPATH = "//div[@class='yes']/a[contains(text(), '是，我已满18岁')]"
+
+# 当前验证码图片的 URL（窗口可见时），否则为空字符串
+CAPTCHA_IMAGE_JS = """
+(() => {
+    const element = document.querySelector('.geetest_tip_img');
+    if (!element || !element.offsetParent) { return ''; }
+    const match = /url\\(["']?(.*?)["']?\\)/.exec(getComputedStyle(element).backgroundImage || '');
+    return match ? match[1] : '';
+})()
+"""
+# 点击第 n 个格子（从 0 开始），格子不存在时返回 false
+_CLICK_TILE_JS = "(() => { const e = document.getElementsByClassName('geetest_item')[%d]; if (!e) { return false; } e.click(); return true; })()"
+WIDGET_VISIBLE_JS = "(() => { const w = document.querySelector('.geetest_widget'); return !!(w && w.offsetParent); })()"
+
+
+def _xpath_js(xpath: str) -> str:
+    return (f"document.evaluate({json.dumps(xpath, ensure_ascii=False)}, document, null, "
+            f"XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue")
+
+
+def _visible_js(xpath: str) -> str:
+    return f"(() => {{ const e = {_xpath_js(xpath)}; return !!(e && e.offsetParent); }})()"
+
+
+def _click_js(xpath: str) -> str:
+    return f"(() => {{ const e = {_xpath_js(xpath)}; if (!e) {{ return false; }} e.click(); return true; }})()"
+
+
+def _write_text(path: str, text: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+class AsyncAccountRun:
+    """
+    单个账户在独立浏览器上下文中的签到流程（协程版）
+
+    步骤与 CheckInAutomation 相同：HTTP 查询 → 恢复会话/登录 → 年龄确认 → 签到 → 验证码，
+    页面操作通过共享浏览器的 CDP 连接完成，等待期间让出事件循环给其他账户。
+    """
+
+    def __init__(self, config: Config, browser: Browser, shared_handler: CaptchaHandler):
+        self.config = config
+        self.browser = browser
+        self.metrics = RunMetrics(config.sakurafrp_user)
+        self.waits = WaitEngine(get_profile(config.timing_profile))
+        self.session_store = SessionStore(config.session_dir, config.session_max_age_days)
+        self.usage: List[Dict] = []
+        self.retry = RetryPolicy.from_config(
+            config,
+            spend=self._model_spend,
+            model_outage=shared_handler.engine.router.all_open
+        )
+        self.captcha = shared_handler.for_account(config, self.metrics, self.retry)
+        self.context: Optional[BrowserContext] = None
+
+    def _model_spend(self):
+        return len(self.usage), sum(u["prompt_tokens"] + u["completion_tokens"] for u in self.usage)
+
+    async def _jitter(self, name: str):
+        low, high = getattr(self.waits.profile, name)
+        if high <= 0:
+            return
+        delay = random.uniform(low, high)
+        await asyncio.sleep(delay)
+        self.waits.record(f"jitter:{name}", delay)
+
+    async def _wait(self, page: Page, name: str, expression: str, timeout: float):
+        """等待页面条件成立并计入等待统计，超时抛出 asyncio.TimeoutError"""
+        start = time.time()
+        try:
+            return await page.wait_for(expression, timeout)
+        finally:
+            self.waits.record(name, time.time() - start)
+
+    async def run(self) -> bool:
+        set_account(self.config.sakurafrp_user)
+        try:
+            return await self._run()
+        finally:
+            if self.config.ledger_path:
+                from checkin_ledger import record_run
+                await asyncio.to_thread(record_run, self.config, self.metrics, self.captcha.last_solve)
+            logger.info(f"账户结果: {self.metrics.outcome}", extra={
+                'event': 'account_result',
+                'data': {'outcome': self.metrics.outcome, 'attempts': self.metrics.counters.get("checkin_attempts", 0)}
+            })
+            set_account(None)
+
+    async def _run(self) -> bool:
+        http_cookies = None
+        if self.config.http_probe:
+            from http_client import probe_checkin_status
+            status, http_cookies = await asyncio.to_thread(probe_checkin_status, self.config, self.session_store)
+            if status == "signed":
+                logger.info("今日已签到（HTTP 查询），跳过浏览器流程")
+                self.metrics.outcome = "already_signed"
+                return True
+
+        if self.captcha.engine.router.all_open():
+            logger.error("所有模型端点均处于熔断状态，跳过当前账户")
+            self.metrics.outcome = "model_outage"
+            return False
+
+        try:
+            with self.metrics.span("initialize"):
+                self.context = await self.browser.new_context([VERIFY_URL_FILTER, CAPTCHA_IMAGE_URL_FILTER])
+                session_restored = await self._prepare_context(http_cookies)
+        except Exception as e:
+            logger.error(f"创建浏览器上下文失败: {e}", exc_info=True)
+            self.metrics.outcome = "driver_error"
+            if self.context:
+                await self.context.close()
+            return False
+
+        page = self.context.page
+        try:
+            with self.metrics.span("login"):
+                logged_in = await self._login(page, session_restored)
+            if not logged_in:
+                logger.error("登录失败")
+                self.metrics.outcome = "login_failed"
+                return False
+
+            with self.metrics.span("navigate"):
+                await self._confirm_age(page)
+
+            if not await self._perform_checkin(page):
+                logger.error("签到失败")
+                self.metrics.outcome = self._failure_outcome()
+                await self._save_error_artifacts(page)
+                return False
+
+            logger.info("✓ 签到流程完成")
+            self.metrics.outcome = "success"
+            await self._save_session(page)
+            return True
+        except Exception as e:
+            logger.error(f"执行过程中发生错误: {e}", exc_info=True)
+            self.metrics.outcome = "error"
+            return False
+        finally:
+            self.metrics.record_usage(self.usage)
+            self.waits.log_summary()
+            logger.info(f"失败分类统计: {self.retry.summary()}")
+            self.captcha.log_image_stats()
+            await self.context.close()
+
+    def _failure_outcome(self) -> str:
+        if not self.retry.aborted:
+            return "checkin_failed"
+        if self.captcha.engine.router.all_open():
+            return "model_outage"
+        return "budget_exhausted"
+
+    async def _prepare_context(self, http_cookies) -> bool:
+        """请求屏蔽、会话恢复与 HTTP 会话注入，Cookie 只写入本账户的上下文"""
+        page = self.context.page
+        if self.config.request_blocking:
+            patterns = RequestPolicy.from_config(self.config).blocked_patterns()
+            if patterns:
+                await page.send('Network.setBlockedURLs', {'urls': patterns})
+
+        cookies, script = self.session_store.restore_payload(self.config.sakurafrp_user)
+        restored = False
+        if cookies:
+            await self.context.set_cookies(cookies)
+            if script:
+                await page.add_init_script(script)
+            logger.info(f"已恢复本地会话（{len(cookies)} 个 Cookie）")
+            restored = True
+        if http_cookies:
+            await self.context.set_cookies(http_cookies)
+            logger.info(f"已注入 HTTP 会话 Cookie（{len(http_cookies)} 个）")
+            restored = True
+        return restored
+
+    async def _save_session(self, page: Page):
+        try:
+            cookies = await self.context.get_cookies()
+            origin = await page.evaluate("location.origin")
+            items = await page.evaluate("Object.assign({}, window.localStorage)") or {}
+            await asyncio.to_thread(self.session_store.save_data, self.config.sakurafrp_user, cookies, origin, items)
+        except Exception as e:
+            logger.warning(f"保存会话失败: {e}")
+
+    async def _save_error_artifacts(self, page: Page):
+        """保存失败现场（文件名带账户哈希，避免并发账户互相覆盖）"""
+        suffix = os.path.splitext(os.path.basename(self.session_store._path(self.config.sakurafrp_user)))[0]
+        try:
+            await page.screenshot(f'error_screenshot_{suffix}.png')
+            html = await page.evaluate("document.documentElement.outerHTML")
+            await asyncio.to_thread(_write_text, f'error_page_source_{suffix}.html', html or "")
+        except Exception as e:
+            logger.warning(f"保存失败现场出错: {e}")
+
+    async def _session_valid(self, page: Page) -> bool:
+        """打开仪表板：出现签到按钮或已签到标识说明会话有效，出现登录表单说明已过期"""
+        logger.info(f"探测本地会话: {self.config.login_url}")
+        await page.goto(self.config.login_url)
+        expression = (f"(() => {{ const u = document.getElementById('username');"
+                      f" if (u && u.offsetParent) {{ return 'login'; }}"
+                      f" if ({_xpath_js(CHECKIN_BUTTON_XPATH)} || {_xpath_js(CHECKED_IN_XPATH)}) {{ return 'ok'; }}"
+                      f" return ''; }})()")
+        try:
+            return await page.wait_for(expression, 10) == 'ok'
+        except asyncio.TimeoutError:
+            logger.info("会话探测超时")
+            return False
+
+    async def _login(self, page: Page, session_restored: bool) -> bool:
+        if session_restored:
+            if await self._session_valid(page):
+                logger.info("本地会话有效，跳过登录")
+                return True
+            logger.info("本地会话已失效，执行完整登录")
+            await asyncio.to_thread(self.session_store.clear, self.config.sakurafrp_user)
+
+        logger.info(f"导航到登录页面: {self.config.login_url}")
+        await page.goto(self.config.login_url)
+        try:
+            await self._wait(page, "login_form", "(() => { const u = document.getElementById('username'),"
+                             " p = document.getElementById('password'); return !!(u && u.offsetParent && p && p.offsetParent); })()", 20)
+            logger.info("输入登录凭据...")
+            min_delay, max_delay = self.waits.profile.typing
+            for field_id, text in (('username', self.config.sakurafrp_user), ('password', self.config.sakurafrp_pass)):
+                schedule = HumanSimulator.key_schedule(text, min_delay, max_delay) if max_delay > 0 else [0.0] * len(text)
+                typed = await page.run_async_script(
+                    TYPE_SCRIPT, Selector(f'#{field_id}'), text, [round(d * 1000) for d in schedule], True,
+                    timeout=sum(schedule) + 30
+                )
+                if typed is not True:
+                    logger.error(f"输入框 {field_id} 输入结果与预期不一致")
+                    return False
+
+            logger.info("点击登录按钮...")
+            await self._wait(page, "login_button", "(() => { const b = document.getElementById('login'); return !!(b && !b.disabled); })()", 20)
+            await page.evaluate("document.getElementById('login').click()")
+            try:
+                await self._wait(page, "login_redirect", "(() => { const u = document.getElementById('username'); return !(u && u.offsetParent); })()", 20)
+            except asyncio.TimeoutError:
+                logger.warning("登录后页面未跳转，继续尝试")
+            await page.dom_ready()
+            await self._jitter("after_login")
+            logger.info("登录成功")
+            await self._save_session(page)
+            return True
+        except asyncio.TimeoutError:
+            logger.error("登录页面元素加载超时")
+            return False
+
+    async def _confirm_age(self, page: Page):
+        """处理年龄确认弹窗（如果存在）"""
+        try:
+            await page.wait_for(_visible_js(AGE_CONFIRM_XPATH), 5)
+        except asyncio.TimeoutError:
+            logger.info("未检测到年龄确认弹窗")
+            return
+        logger.info("处理年龄确认弹窗...")
+        await page.evaluate(_click_js(AGE_CONFIRM_XPATH))
+        await self._jitter("after_click")
+
+    async def _reload_after_page_error(self, page: Page) -> bool:
+        self.metrics.incr(f"failure:{PAGE_ERROR}")
+        decision = self.retry.on_failure(PAGE_ERROR)
+        if decision.action == ABORT:
+            return False
+        await asyncio.sleep(decision.delay)
+        try:
+            await page.reload()
+        except Exception as e:
+            logger.error(f"重新加载页面失败: {e}")
+            return False
+        return True
+
+    async def _perform_checkin(self, page: Page) -> bool:
+        button_or_done = (f"(() => {{ const b = {_xpath_js(CHECKIN_BUTTON_XPATH)};"
+                          f" if (b && b.offsetParent && !b.disabled) {{ return 'button'; }}"
+                          f" const d = {_xpath_js(CHECKED_IN_XPATH)}; return d && d.offsetParent ? 'done' : ''; }})()")
+        max_retries = self.config.max_retries
+        for attempt in range(1, max_retries + 1):
+            logger.info(f"验证码尝试 {attempt}/{max_retries}")
+            self.metrics.incr("checkin_attempts")
+            if attempt > 1:
+                self.metrics.incr("page_retries")
+            try:
+                try:
+                    state = await self._wait(page, "checkin_button", button_or_done, 20)
+                except asyncio.TimeoutError:
+                    logger.error("未找到签到按钮或已签到标识")
+                    if await self._reload_after_page_error(page):
+                        continue
+                    return False
+                if state == 'done':
+                    logger.info("今日已签到")
+                    return True
+
+                logger.info("点击签到按钮...")
+                page.clear_responses()
+                await page.evaluate(_click_js(CHECKIN_BUTTON_XPATH))
+                # 图片响应一到就开始识别，点击后的停顿与窗口动画和模型请求重叠
+                prefetch = asyncio.ensure_future(self._prefetch(page)) if self.config.captcha_pipeline else None
+                await self._jitter("after_click")
+
+                if await self._handle_captcha(page, prefetch):
+                    try:
+                        await self._wait(page, "checked_in", _visible_js(CHECKED_IN_XPATH), 5)
+                        logger.info("验证码验证成功，今日已签到")
+                        return True
+                    except asyncio.TimeoutError:
+                        logger.info("未检测到已签到标识，刷新页面确认")
+                elif self.retry.aborted:
+                    return False
+                await page.reload()
+            except Exception as e:
+                # CDP 命令超时抛出 asyncio.TimeoutError，与其他页面错误一样交给重试策略
+                logger.error(f"签到过程出错: {e}", exc_info=True)
+                if await self._reload_after_page_error(page):
+                    continue
+                return False
+        logger.info("已达到最大重试次数")
+        return False
+
+    async def _prefetch(self, page: Page, timeout: float = 10.0):
+        """等待验证码图片响应并提前开始识别，返回 (图片 URL, 图片, 缓存键, 识别结果, 来源, 识别任务)"""
+        with self.metrics.span("prefetch"):
+            response = await page.wait_response(
+                CAPTCHA_IMAGE_URL_FILTER, timeout, accept=lambda r: r.body.startswith(IMAGE_SIGNATURES)
+            )
+        if not response:
+            return None
+        logger.info(f"验证码图片已加载（{len(response.body)} 字节），提前开始识别: {response.url}")
+        self.metrics.incr("captcha_prefetch")
+        cache_key, result, source = await asyncio.to_thread(self.captcha._lookup_local, response.body)
+        # 流式模式边生成边点击，只能等窗口可见后再开始
+        recognition = None
+        if not result and not self.config.recognition_stream:
+            recognition = asyncio.ensure_future(self._recognize(response.url, response.body))
+        return response.url, response.body, cache_key, result, source, recognition
+
+    async def _recognize(self, img_url: str, image_bytes: Optional[bytes]):
+        """在共享识别引擎上识别，返回 TracedRecognition（用量只计入本账户）"""
+        prepared = await asyncio.to_thread(self.captcha.image_pipeline.prepare, img_url, image_bytes)
+        start = time.time()
+        trace = await asyncio.wrap_future(self.captcha.engine.recognize_traced(prepared.payload))
+        self.usage.extend(trace.usage)
+        self.captcha._record_image_stats(prepared, time.time() - start, trace.usage, trace.result)
+        return trace
+
+    async def _recognize_and_click_streaming(self, page: Page, img_url: str, image_bytes: Optional[bytes]):
+        """
+        流式识别并边生成边点击，与 CaptchaHandler._recognize_and_click_streaming 相同
+
+        标签在识别线程中到达后转交本账户的事件循环，匹配的格子一到就点击。
+        返回 (TracedRecognition, 是否已点击并提交)
+        """
+        prepared = await asyncio.to_thread(self.captcha.image_pipeline.prepare, img_url, image_bytes)
+        loop = asyncio.get_running_loop()
+        pairs: asyncio.Queue = asyncio.Queue()
+        labels, clicked = {}, set()
+        self.captcha._reset_label_decisions()
+        start = time.time()
+        stream = asyncio.wrap_future(self.captcha.engine.stream_traced(
+            prepared.payload, lambda pair: loop.call_soon_threadsafe(pairs.put_nowait, pair)
+        ))
+        # 标签与结束通知按到达顺序进入队列，None 表示流已结束
+        stream.add_done_callback(lambda _: pairs.put_nowait(None))
+        try:
+            while True:
+                pair = await pairs.get()
+                if pair is None:
+                    break
+                key, label = pair
+                labels[key] = label
+                logger.info(f"位置 {key}: {label}")
+                for position in await asyncio.to_thread(self.captcha._stream_matches, labels, clicked):
+                    if await page.evaluate(_CLICK_TILE_JS % (position - 1)):
+                        logger.info(f"已点击位置 {position}")
+                        clicked.add(position)
+                        await self._jitter("between_tiles")
+                    else:
+                        logger.error(f"点击位置 {position} 时出错: 未找到格子")
+            trace = await stream
+        finally:
+            if not stream.done():
+                stream.cancel()
+
+        self.usage.extend(trace.usage)
+        self.captcha._record_image_stats(prepared, time.time() - start, trace.usage, trace.result)
+        if not trace.result:
+            logger.error("流式输出中没有参考图标签")
+            return trace, False
+        logger.info(f"验证码识别结果: {trace.result}")
+        if not clicked:
+            logger.warning(f"未找到匹配 '{trace.result['10']}' 的格子")
+            return trace, False
+        logger.info(f"共点击了 {len(clicked)} 个匹配的格子")
+        await page.run_async_script(CLICK_SCRIPT, [], [], 3000)
+        return trace, True
+
+    async def _handle_captcha(self, page: Page, prefetch: Optional[asyncio.Future]) -> bool:
+        """验证码处理：失败按类别交给重试策略，与 CaptchaHandler.handle_geetest_captcha 相同"""
+        logger.info("开始处理 GeeTest 验证码...")
+        rounds = max(1, self.config.captcha_widget_retries)
+        try:
+            for round_index in range(1, rounds + 1):
+                if round_index > 1:
+                    logger.info(f"验证码窗口内重试 {round_index}/{rounds}")
+                    self.metrics.incr("captcha_retries")
+                self.metrics.incr("captcha_rounds")
+                outcome = await self._solve_once(page, prefetch if round_index == 1 else None)
+                self.metrics.incr(f"captcha_outcome:{outcome}")
+                if outcome in ("success", "closed"):
+                    return True
+
+                failure_class = self.retry.classify(outcome)
+                self.metrics.incr(f"failure:{failure_class}")
+                decision = self.retry.on_failure(failure_class)
+                if decision.action == ABORT:
+                    return False
+                if decision.action != REFRESH_CAPTCHA or not await self._widget_present(page):
+                    logger.warning("验证码窗口已消失或需要重新加载，刷新网页重试...")
+                    await asyncio.sleep(decision.delay)
+                    await self._jitter("captcha_exit")
+                    return False
+                if round_index < rounds:
+                    await asyncio.sleep(decision.delay)
+                    if not await self._refresh_captcha(page):
+                        return False
+            logger.warning("验证码窗口内重试次数已用完，刷新网页重试...")
+            await self._jitter("captcha_exit")
+            return False
+        finally:
+            if prefetch and not prefetch.done():
+                prefetch.cancel()
+
+    async def _widget_present(self, page: Page) -> bool:
+        """验证码窗口是否仍然显示（页面出错时视为已消失）"""
+        try:
+            return bool(await page.evaluate(WIDGET_VISIBLE_JS))
+        except Exception:
+            return False
+
+    async def _solve_once(self, page: Page, prefetch: Optional[asyncio.Future]) -> str:
+        try:
+            with self.metrics.span("get_img"):
+                try:
+                    img_url = await self._wait(page, "captcha_visible", CAPTCHA_IMAGE_JS, 20)
+                except asyncio.TimeoutError:
+                    logger.info("未检测到 GeeTest 验证码窗口")
+                    return "no_image"
+                logger.info(f"成功获取验证码图片 URL: {img_url}")
+                prefetched = await prefetch if prefetch else None
+                path = urlsplit(img_url).path
+                if prefetched and urlsplit(prefetched[0]).path == path:
+                    _, image_bytes, cache_key, result, source, recognition = prefetched
+                    self.metrics.incr("captcha_prefetch_used")
+                else:
+                    if prefetched:
+                        logger.info("预取的图片与验证码窗口不一致，重新获取")
+                        if prefetched[5]:
+                            prefetched[5].cancel()
+                    response = page.take_response(CAPTCHA_IMAGE_URL_FILTER, accept=lambda r: urlsplit(r.url).path == path)
+                    image_bytes = response.body if response else await asyncio.to_thread(self.captcha._fetch_image, img_url)
+                    recognition = None
+                    if image_bytes:
+                        cache_key, result, source = await asyncio.to_thread(self.captcha._lookup_local, image_bytes)
+                    else:
+                        cache_key, result, source = None, None, "model"
+
+            trace = None
+            if not result and self.config.recognition_stream:
+                # 流式模式：边生成边点击
+                source = "stream"
+                page.clear_responses()
+                with self.metrics.span("recognize_click"):
+                    trace, submitted = await self._recognize_and_click_streaming(page, img_url, image_bytes)
+                result = trace.result
+                if not result:
+                    logger.warning("识别失败")
+                    return "model_error" if trace.failure == MODEL_API_ERROR else "no_result"
+                if not submitted:
+                    logger.warning("点击失败")
+                    return "no_click"
+            else:
+                if not result:
+                    with self.metrics.span("recognize"):
+                        trace = await (recognition or self._recognize(img_url, image_bytes))
+                    result = trace.result
+                    if not result:
+                        logger.warning("识别失败")
+                        return "model_error" if trace.failure == MODEL_API_ERROR else "no_result"
+                logger.info(f"验证码识别结果: {result}")
+
+                positions = await asyncio.to_thread(self.captcha._match_positions, result)
+                if not positions:
+                    return "no_click"
+
+                page.clear_responses()
+                with self.metrics.span("click"):
+                    delays = self.waits.schedule("between_tiles", len(positions))
+                    report = await page.run_async_script(
+                        CLICK_SCRIPT, positions, [round(d * 1000) for d in delays], 3000
+                    ) or {}
+                if report.get("error") == "grid" or not report.get("clicked"):
+                    logger.warning("点击失败")
+                    return "no_click"
+                logger.info(f"共点击了 {report['clicked']} 个匹配的格子")
+
+            with self.metrics.span("verification"):
+                verification = await self._wait_for_verification(page, 5)
+            await asyncio.to_thread(
+                self.captcha._settle, source, result, verification, cache_key, image_bytes,
+                trace.sources if trace else None
+            )
+            return verification
+        except Exception as e:
+            logger.error(f"处理验证码时发生错误: {e}", exc_info=True)
+            return "page_error"
+
+    async def _wait_for_verification(self, page: Page, timeout: float) -> str:
+        """等待验证接口响应或验证码窗口关闭"""
+        deadline = time.monotonic() + timeout
+        start = time.time()
+        try:
+            while time.monotonic() < deadline:
+                response = await page.wait_response(VERIFY_URL_FILTER, 0.2)
+                if response:
+                    try:
+                        result = self.captcha._parse_verification_response(response.text())
+                        if result:
+                            return result
+                    except ValueError as e:
+                        logger.debug(f"解析响应时出错: {e}")
+                    continue
+                if not await page.evaluate(WIDGET_VISIBLE_JS):
+                    logger.info("验证码窗口已关闭")
+                    return "closed"
+            logger.warning(f"验证结果等待超时 ({timeout}秒)")
+            return "timeout"
+        except Exception as e:
+            logger.error(f"等待验证结果时出错: {e}", exc_info=True)
+            return "timeout"
+        finally:
+            self.waits.record("verify_response", time.time() - start)
+
+    async def _refresh_captcha(self, page: Page) -> bool:
+        """验证失败后 GeeTest 可能已自动换图，先短暂等待，未换图再点击刷新按钮"""
+        try:
+            previous = await page.evaluate(CAPTCHA_IMAGE_JS)
+            changed = f"(() => {{ const url = {CAPTCHA_IMAGE_JS.strip()}; return url && url !== {json.dumps(previous)}; }})()"
+            try:
+                await self._wait(page, "captcha_auto_refresh", changed, 1.5)
+                logger.info("验证码已自动刷新")
+                return True
+            except asyncio.TimeoutError:
+                pass
+            logger.info("正在刷新验证码...")
+            clicked = await page.evaluate("(() => { const b = document.querySelector('.geetest_refresh'); if (b) { b.click(); } return !!b; })()")
+            if not clicked:
+                logger.error("刷新验证码失败: 未找到刷新按钮")
+                return False
+            try:
+                await self._wait(page, "captcha_refresh", changed, 5)
+                return True
+            except asyncio.TimeoutError:
+                logger.error("刷新验证码失败: 图片未更新")
+                return False
+        except Exception as e:
+            logger.error(f"刷新验证码失败: {e}")
+            return False
+
+
+class AsyncCheckInEngine:
+    """
+    协程签到引擎（DRIVER_BACKEND=cdp）
+
+    只启动一个 Chrome，不经过 chromedriver，直接通过 CDP 控制；每个账户在独立的浏览器上下文中运行，
+    Cookie 与存储互相隔离。所有账户共享一个事件循环、一个浏览器与一个识别引擎，
+    同时运行的账户数不超过 CDP_MAX_CONTEXTS。
+    """
+
+    def __init__(self, config: Config, accounts: List[Account]):
+        self.config = config
+        self.accounts = accounts
+
+    def run(self) -> List[AccountResult]:
+        return asyncio.run(self._run())
+
+    async def _run(self) -> List[AccountResult]:
+        start = time.time()
+        headless = os.getenv('CI') == 'true' or os.getenv('HEADLESS', 'false').lower() == 'true'
+        concurrency = max(1, min(self.config.cdp_max_contexts, len(self.accounts)))
+        logger.info(f"共 {len(self.accounts)} 个账户，共享浏览器上下文并发数: {concurrency}")
+
+        handler = CaptchaHandler(self.config)
+        browser = None
+        sampler = None
+        try:
+            browser = await Browser.launch(self.config, headless=headless)
+            sampler = PeakRssSampler(browser.rss).start()
+            semaphore = asyncio.Semaphore(concurrency)
+            results = await asyncio.gather(
+                *(self._run_account(browser, handler, account, semaphore) for account in self.accounts)
+            )
+        except Exception as e:
+            logger.error(f"共享浏览器启动失败: {e}", exc_info=True)
+            results = [AccountResult(account.user, False, 0.0, str(e)) for account in self.accounts]
+        finally:
+            if sampler:
+                peak = sampler.stop()
+                logger.info(f"共享浏览器内存峰值: {peak / 1024 / 1024:.0f}MB"
+                            f"（{len(self.accounts)} 个账户，平均每账户 {peak / len(self.accounts) / 1024 / 1024:.0f}MB）")
+            if browser:
+                await browser.close()
+
+        CheckInOrchestrator._log_summary(results, time.time() - start)
+        export_run_metrics(
+            [r.metrics or CheckInOrchestrator._error_metrics(r) for r in results],
+            self.config.metrics_json_path,
+            self.config.metrics_textfile
+        )
+        return results
+
+    async def _run_account(self, browser: Browser, handler: CaptchaHandler, account: Account,
+                           semaphore: asyncio.Semaphore) -> AccountResult:
+        async with semaphore:
+            start = time.time()
+            run = AsyncAccountRun(self.config.for_account(account), browser, handler)
+            try:
+                success = await run.run()
+            except Exception as e:
+                logger.error(f"账户 {account.user} 执行失败: {e}", exc_info=True)
+                return AccountResult(account.user, False, time.time() - start, str(e))
+            summary = {f"wait:{name}": sum(values) for name, values in run.waits.timings.items()}
+            summary.update(run.metrics.stage_totals())
+            status = "成功" if success else "失败"
+            logger.info(f"账户 {account.user} 签到{status}，耗时 {time.time() - start:.1f}s")
+            return AccountResult(account.user, success, time.time() - start,
+                                 stages=summary, metrics=run.metrics.to_dict())
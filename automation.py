@@ -6,72 +6,216 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 from config import Config
+from metrics import RunMetrics
+from process_memory import PeakRssSampler, driver_rss
+from retry_policy import ABORT, PAGE_ERROR, RetryPolicy
+from run_log import set_account
+from wait_engine import WaitEngine, get_profile
 
 logger = logging.getLogger(__name__)
 
+CHECKIN_BUTTON_XPATH = "//button[./span[contains(text(),'点击这里签到')]]"
+CHECKED_IN_XPATH = "//p[contains(., '今天已经签到过啦')]"
+
 
 class CheckInAutomation:
     """签到自动化主类"""
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, driver_manager=None, captcha_handler=None):
+        """driver_manager/captcha_handler 可由常驻模式传入，跨账户复用已启动的浏览器与识别引擎"""
         self.config = config
-        try:
-            from webdriver_manager import WebDriverManager
-        except ImportError:
-            from webdriver_manager import WebDriverManager  # 如果模块名不同
-        self.driver_manager = WebDriverManager(config)
-        try:
-            from captcha_handler import CaptchaHandler
-        except ImportError:
-            from captcha_handler import CaptchaHandler  # 如果模块名不同
-        self.captcha_handler = CaptchaHandler(config)
+        if driver_manager is None:
+            try:
+                from webdriver_manager import WebDriverManager
+            except ImportError:
+                from webdriver_manager import WebDriverManager  # 如果模块名不同
+            driver_manager = WebDriverManager(config)
+        driver_manager.config = config
+        self.driver_manager = driver_manager
+        if captcha_handler is None:
+            try:
+                from captcha_handler import CaptchaHandler
+            except ImportError:
+                from captcha_handler import CaptchaHandler  # 如果模块名不同
+            captcha_handler = CaptchaHandler(config)
+        captcha_handler.config = config
+        captcha_handler.image_stats = []
+        captcha_handler.last_solve = None
+        self.captcha_handler = captcha_handler
+        self._usage_start = len(captcha_handler.engine.usage)
         try:
             from human_simulator import HumanSimulator
         except ImportError:
             from human_simulator import HumanSimulator  # 如果模块名不同
         self.simulator = HumanSimulator()
+        self.waits = WaitEngine(get_profile(config.timing_profile))
+        self.metrics = RunMetrics(config.sakurafrp_user)
+        self.captcha_handler.waits = self.waits
+        self.captcha_handler.metrics = self.metrics
+        # 每个账户独立的重试预算：耗时、模型请求次数与 token
+        self.retry = RetryPolicy.from_config(
+            config,
+            spend=self._model_spend,
+            model_outage=captcha_handler.engine.router.all_open
+        )
+        self.captcha_handler.retry = self.retry
         self.max_retries = config.max_retries
     
-    def run(self):
-        """执行签到流程"""
+    def _model_spend(self):
+        usage = self.captcha_handler.engine.usage[self._usage_start:]
+        return len(usage), sum(u["prompt_tokens"] + u["completion_tokens"] for u in usage)
+    
+    def run(self) -> bool:
+        """执行签到流程，返回是否签到成功（结果写入签到台账）"""
+        set_account(self.config.sakurafrp_user)
+        try:
+            return self._run()
+        finally:
+            self._record_ledger()
+            # 结构化的结果记录，邮件报告据此判断成功与否
+            logger.info(f"账户结果: {self.metrics.outcome}", extra={
+                'event': 'account_result',
+                'data': {'outcome': self.metrics.outcome, 'attempts': self.metrics.counters.get("checkin_attempts", 0)}
+            })
+            set_account(None)
+    
+    def _run(self) -> bool:
+        # 先用 HTTP 查询签到状态，今日已签到时无需启动浏览器
+        http_cookies = None
+        if self.config.http_probe:
+            status, http_cookies = self._probe_over_http()
+            if status == "signed":
+                logger.info("今日已签到（HTTP 查询），跳过浏览器流程")
+                logger.info("✓ 签到流程完成")
+                self.metrics.outcome = "already_signed"
+                return True
+        
+        # 所有模型端点都在熔断中时不启动浏览器，留给下一次运行
+        if self.captcha_handler.engine.router.all_open():
+            logger.error("所有模型端点均处于熔断状态，跳过当前账户")
+            self.metrics.outcome = "model_outage"
+            return False
+        
         # GitHub Actions 环境自动使用 headless 模式
         headless = os.getenv('CI') == 'true' or os.getenv('HEADLESS', 'false').lower() == 'true'
         
-        driver = self.driver_manager.initialize(headless=headless)
+        with self.metrics.span("initialize"):
+            driver = self.driver_manager.initialize(headless=headless)
         if not driver:
             logger.error("WebDriver 初始化失败，无法继续")
-            return
+            self.metrics.outcome = "driver_error"
+            return False
+        
+        # 注入 HTTP 登录得到的会话，浏览器不再重复登录
+        if http_cookies:
+            self.driver_manager.inject_cookies(http_cookies)
         
+        self.captcha_handler.network = self.driver_manager.network
         wait = WebDriverWait(driver, 20)
+        rss_sampler = PeakRssSampler(lambda: driver_rss(driver)).start()
         
         try:
             # 步骤1: 登录
-            if not self._login(driver, wait):
+            with self.metrics.span("login"):
+                logged_in = self._login(driver, wait)
+            if not logged_in:
                 logger.error("登录失败")
-                return
+                self.metrics.outcome = "login_failed"
+                return False
             
             # 步骤2: 跳转到 处理年龄
-            if not self._navigate_to_sakurafrp(driver, wait):
+            with self.metrics.span("navigate"):
+                navigated = self._navigate_to_sakurafrp(driver, wait)
+            if not navigated:
                 logger.error("跳转到 SakuraFrp 失败")
-                return
+                self.metrics.outcome = "navigate_failed"
+                return False
             
             # 步骤3: 执行签到
             if not self._perform_checkin(driver, wait):
                 logger.error("签到失败")
+                self.metrics.outcome = self._failure_outcome()
                 driver.save_screenshot('error_screenshot.png')
                 with open('error_page_source.html', 'w', encoding='utf-8') as f:
                     f.write(driver.page_source)
-                return
+                return False
             
             logger.info("✓ 签到流程完成")
+            self.metrics.outcome = "success"
+            self.driver_manager.save_session()
+            return True
             
         except Exception as e:
             logger.error(f"执行过程中发生错误: {e}", exc_info=True)
+            self.metrics.outcome = "error"
+            return False
         finally:
+            self.metrics.peak_rss = rss_sampler.stop()
+            logger.info(f"浏览器进程树内存峰值: {self.metrics.peak_rss / 1024 / 1024:.0f}MB")
+            self.metrics.record_usage(self.captcha_handler.engine.usage[self._usage_start:])
+            self.waits.log_summary()
+            logger.info(f"失败分类统计: {self.retry.summary()}")
+            self.captcha_handler.log_image_stats()
+            self.driver_manager.log_network_report()
             logger.info("脚本执行完毕，浏览器保持打开状态供检查")
     
+    def _failure_outcome(self) -> str:
+        """签到失败的结果：重试策略放弃时区分模型不可用与预算耗尽"""
+        if not self.retry.aborted:
+            return "checkin_failed"
+        if self.captcha_handler.engine.router.all_open():
+            return "model_outage"
+        return "budget_exhausted"
+    
+    def _reload_after_page_error(self, driver) -> bool:
+        """页面错误交给重试策略：等待退避时间后重新加载，策略放弃时返回 False"""
+        self.metrics.incr(f"failure:{PAGE_ERROR}")
+        decision = self.retry.on_failure(PAGE_ERROR)
+        if decision.action == ABORT:
+            return False
+        if decision.delay:
+            time.sleep(decision.delay)
+        try:
+            driver.refresh()
+            self.waits.dom_ready(driver)
+        except Exception as e:
+            logger.error(f"重新加载页面失败: {e}")
+            return False
+        return True
+    
+    def _record_ledger(self):
+        """把本次运行的结果、尝试次数、阶段耗时与验证码结果写入签到台账"""
+        if not self.config.ledger_path:
+            return
+        from checkin_ledger import record_run
+        
+        record_run(self.config, self.metrics, self.captcha_handler.last_solve)
+    
+    def timing_summary(self) -> dict:
+        """各阶段耗时合计（秒）：阶段 span 与等待类别"""
+        summary = {f"wait:{name}": sum(values) for name, values in self.waits.timings.items()}
+        summary.update(self.metrics.stage_totals())
+        return summary
+    
+    def _probe_over_http(self):
+        """
+        通过 HTTP 查询签到状态（优先复用本地会话，过期时用 HTTP 登录）
+        
+        返回 (状态, 可注入浏览器的 Cookie)，Cookie 仅在 HTTP 会话已登录时返回
+        """
+        from http_client import probe_checkin_status
+        
+        return probe_checkin_status(self.config, self.driver_manager.session_store)
+    
     def _login(self, driver, wait: WebDriverWait) -> bool:
-        """执行登录"""
-        login_url = "https://www.natfrp.com/user/"
+        """执行登录（本地会话有效时跳过）"""
+        if self.driver_manager.session_restored:
+            if self._session_valid(driver):
+                logger.info("本地会话有效，跳过登录")
+                return True
+            logger.info("本地会话已失效，执行完整登录")
+            self.driver_manager.clear_session()
+        
+        login_url = self.config.login_url
         logger.info(f"导航到登录页面: {login_url}")
         driver.get(login_url)
         
@@ -81,18 +225,22 @@ class CheckInAutomation:
             password_input = wait.until(EC.visibility_of_element_located((By.ID, 'password')))
             
             logger.info("输入登录凭据...")
-            username_input.clear()
-            self.simulator.type_text(username_input, self.config.sakurafrp_user)
-            password_input.clear()
-            self.simulator.type_text(password_input, self.config.sakurafrp_pass)
+            min_delay, max_delay = self.waits.profile.typing
+            self.simulator.type_text(username_input, self.config.sakurafrp_user, min_delay, max_delay, clear=True)
+            self.simulator.type_text(password_input, self.config.sakurafrp_pass, min_delay, max_delay, clear=True)
             
             # 点击登录按钮
             login_button = wait.until(EC.element_to_be_clickable((By.ID, 'login')))
             logger.info("点击登录按钮...")
             driver.execute_script("arguments[0].click();", login_button)
             
-            self.simulator.random_sleep(3, 5)
+            # 等待登录表单消失（跳转到仪表板）
+            if not self.waits.gone(driver, (By.ID, 'username'), "login_redirect"):
+                logger.warning("登录后页面未跳转，继续尝试")
+            self.waits.dom_ready(driver)
+            self.waits.jitter("after_login")
             logger.info("登录成功")
+            self.driver_manager.save_session()
             return True
             
         except TimeoutException:
@@ -102,6 +250,28 @@ class CheckInAutomation:
             logger.error(f"登录过程出错: {e}", exc_info=True)
             return False
     
+    def _session_valid(self, driver) -> bool:
+        """
+        探测恢复的会话是否仍然有效
+        
+        打开仪表板后，出现登录表单说明会话已过期；出现签到按钮或已签到标识说明会话有效。
+        探测本身就停留在签到所需的页面上，无需额外加载。
+        """
+        logger.info(f"探测本地会话: {self.config.login_url}")
+        driver.get(self.config.login_url)
+        try:
+            WebDriverWait(driver, 10).until(EC.any_of(
+                EC.visibility_of_element_located((By.ID, 'username')),
+                EC.presence_of_element_located((By.XPATH, CHECKIN_BUTTON_XPATH)),
+                EC.presence_of_element_located((By.XPATH, CHECKED_IN_XPATH)),
+            ))
+        except TimeoutException:
+            logger.info("会话探测超时")
+            return False
+        
+        login_forms = driver.find_elements(By.ID, 'username')
+        return not any(element.is_displayed() for element in login_forms)
+    
     def _navigate_to_sakurafrp(self, driver, wait: WebDriverWait) -> bool:
         """跳转到 SakuraFrp 仪表板"""
         try:
@@ -124,7 +294,7 @@ class CheckInAutomation:
                 )
                 logger.info("处理年龄确认弹窗...")
                 age_confirm.click()
-                self.simulator.random_sleep(2, 3)
+                self.waits.jitter("after_click")
             except TimeoutException:
                 logger.info("未检测到年龄确认弹窗")
             
@@ -143,46 +313,61 @@ class CheckInAutomation:
         """执行签到操作"""
         for attempt in range(1, self.max_retries+1):
             logger.info(f"验证码尝试 {attempt}/{self.max_retries}")
+            self.metrics.incr("checkin_attempts")
+            if attempt > 1:
+                self.metrics.incr("page_retries")
             try:
                 # 查找签到按钮
                 check_in_button = None
                 try:
                     check_in_button = wait.until(
-                        EC.element_to_be_clickable(
-                            (By.XPATH, "//button[./span[contains(text(),'点击这里签到')]]")
-                        )
+                        EC.element_to_be_clickable((By.XPATH, CHECKIN_BUTTON_XPATH))
                     )
                     logger.info("找到签到按钮")
                 except TimeoutException:
                     # 检查是否已签到
                     try:
                         WebDriverWait(driver, 2).until(
-                            EC.visibility_of_element_located(
-                                (By.XPATH, "//p[contains(., '今天已经签到过啦')]")
-                            )
+                            EC.visibility_of_element_located((By.XPATH, CHECKED_IN_XPATH))
                         )
                         logger.info("今日已签到")
                         return True
                     except TimeoutException:
                         logger.error("未找到签到按钮或已签到标识")
+                        if self._reload_after_page_error(driver):
+                            continue
                         return False
                 
                 # 点击签到按钮
                 if check_in_button:
                     logger.info("点击签到按钮...")
-                    driver.execute_script("arguments[0].click();", check_in_button)
-                    self.simulator.random_sleep(2, 4)
+                    # 验证码图片一加载就开始识别，点击后的停顿与窗口动画和模型请求重叠
+                    self.captcha_handler.click_and_prefetch(
+                        driver, lambda: driver.execute_script("arguments[0].click();", check_in_button)
+                    )
+                    self.waits.jitter("after_click")
                     
-                    # 处理验证码
+                    # 处理验证码（失败时在验证码窗口内重试，窗口消失才重新加载页面）
                     captcha_result = self.captcha_handler.handle_geetest_captcha(driver, wait)
+                    if captcha_result:
+                        try:
+                            self.waits.visible(driver, (By.XPATH, CHECKED_IN_XPATH), "checked_in", timeout=5)
+                            logger.info("验证码验证成功，今日已签到")
+                            return True
+                        except TimeoutException:
+                            logger.info("未检测到已签到标识，刷新页面确认")
+                    elif self.retry.aborted:
+                        return False
                     driver.refresh()
-                    time.sleep(5)
+                    self.waits.dom_ready(driver)
                     continue
 
                 return False
                 
             except Exception as e:
                 logger.error(f"签到过程出错: {e}", exc_info=True)
+                if self._reload_after_page_error(driver):
+                    continue
                 return False
         logger.info("已达到最大重试次数")
         return False
\ No newline at end of file
@@ -0,0 +1 @@
+"""离线基准测试：本地模拟站点 + 模拟模型，测量签到流程各阶段耗时与吞吐量"""
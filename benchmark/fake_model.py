@@ -0,0 +1,172 @@
+"""
+本地模拟的 OpenAI 兼容视觉模型
+
+按模拟站点的调色板识别九宫格颜色并返回标签，可配置延迟、抖动、错误率、
+识别准确率与“格式不规范输出”的比例，支持 stream=true 的 SSE 流式响应。
+"""
+import base64
+import io
+import json
+import random
+import threading
+import time
+import urllib.request
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from PIL import Image
+
+from benchmark.stub_site import PALETTE
+
+
+@dataclass
+class ModelBehavior:
+    """模拟模型的行为参数"""
+    latency: float = 1.5          # 平均响应延迟（秒）
+    jitter: float = 0.5           # 延迟的随机浮动（秒）
+    error_rate: float = 0.0       # 返回 HTTP 500 的比例
+    accuracy: float = 1.0         # 每个格子识别正确的概率
+    malformed_rate: float = 0.0   # 用代码块与说明文字包裹答案的比例
+
+
+def _nearest_label(color) -> str:
+    return min(PALETTE, key=lambda name: sum((a - b) ** 2 for a, b in zip(PALETTE[name], color)))
+
+
+def _load_image(url: str) -> Image.Image:
+    if url.startswith('data:'):
+        data = base64.b64decode(url.split(',', 1)[1])
+    else:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            data = response.read()
+    return Image.open(io.BytesIO(data)).convert('RGB')
+
+
+def recognize_image(url: str, accuracy: float) -> Dict[str, str]:
+    """按格子中心颜色识别：上方正方形为九宫格，下方左侧为参考图"""
+    img = _load_image(url)
+    width, height = img.size
+    tile = width / 3
+    labels = {}
+    for index in range(9):
+        row, col = divmod(index, 3)
+        label = _nearest_label(img.getpixel((int((col + 0.5) * tile), int((row + 0.5) * tile))))
+        if random.random() > accuracy:
+            label = random.choice([name for name in PALETTE if name != label])
+        labels[str(index + 1)] = label
+    labels["10"] = _nearest_label(img.getpixel((int(tile / 2), int(width + (height - width) / 2))))
+    return labels
+
+
+class FakeModelState:
+    """模拟模型的计数器"""
+
+    def __init__(self, behavior: ModelBehavior):
+        self.behavior = behavior
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.latencies = []
+
+    def count(self, key: str, latency: Optional[float] = None):
+        with self.lock:
+            self.counters[key] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """处理 /v1/chat/completions 请求"""
+    state: FakeModelState = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        behavior = self.state.behavior
+        start = time.time()
+        delay = max(0.0, random.uniform(behavior.latency - behavior.jitter, behavior.latency + behavior.jitter))
+
+        if random.random() < behavior.error_rate:
+            time.sleep(delay / 2)
+            self.state.count('errors')
+            self._send_json(500, {'error': {'message': 'simulated upstream error', 'type': 'server_error'}})
+            return
+
+        image_url = next(
+            part['image_url']['url']
+            for message in request.get('messages', []) if isinstance(message.get('content'), list)
+            for part in message['content'] if part.get('type') == 'image_url'
+        )
+        labels = recognize_image(image_url, behavior.accuracy)
+        # 流式提示词要求参考图放在最前
+        if '参考图放在最前' in json.dumps(request.get('messages', []), ensure_ascii=False):
+            labels = {"10": labels.pop("10"), **labels}
+        content = json.dumps(labels, ensure_ascii=False)
+        if random.random() < behavior.malformed_rate:
+            content = f"识别结果如下：\n```json\n{content}\n```\n以上。"
+            self.state.count('malformed')
+        usage = {'prompt_tokens': 850, 'completion_tokens': len(content), 'total_tokens': 850 + len(content)}
+
+        if request.get('stream'):
+            self._stream(request.get('model', ''), content, usage, delay)
+        else:
+            time.sleep(delay)
+            self._send_json(200, {
+                'id': 'chatcmpl-bench',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', ''),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': usage,
+            })
+        self.state.count('requests', time.time() - start)
+
+    def _stream(self, model: str, content: str, usage: Dict, delay: float):
+        """以 SSE 分块输出，首块前等待一半延迟，其余延迟均摊到各块"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(payload: Dict):
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        chunks = [content[i:i + 8] for i in range(0, len(content), 8)]
+        time.sleep(delay / 2)
+        for chunk in chunks:
+            event({'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                   'model': model, 'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}]})
+            time.sleep(delay / 2 / len(chunks))
+        event({'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+               'model': model, 'choices': [], 'usage': usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_model(behavior: ModelBehavior, host: str = "127.0.0.1", port: int = 0):
+    """在后台线程启动模拟模型，返回 (server, state)"""
+    state = FakeModelState(behavior)
+    handler = type('BoundFakeModelHandler', (FakeModelHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="fake-model", daemon=True).start()
+    return server, state
@@ -0,0 +1,162 @@
+"""
+离线基准测试入口
+
+启动本地模拟站点与模拟模型，用真实的 CheckInOrchestrator 对 N 个账户、M 个工作进程
+执行完整签到流程（需要本机 Chrome 与 chromedriver），输出各阶段耗时与吞吐量。
+
+用法:
+    python -m benchmark.run --accounts 8 --workers 4 --latency 1.5 --error-rate 0.1
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict
+
+from benchmark.fake_model import ModelBehavior, start_fake_model
+from benchmark.stub_site import start_stub_site
+from metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="SakuraFrp 签到离线基准测试")
+    parser.add_argument("--accounts", type=int, default=4, help="账户数量")
+    parser.add_argument("--workers", type=int, default=2, help="工作进程数")
+    parser.add_argument("--latency", type=float, default=1.5, help="模拟模型平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.5, help="模拟模型延迟浮动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟模型返回 500 的比例")
+    parser.add_argument("--accuracy", type=float, default=1.0, help="每个格子识别正确的概率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="格式不规范输出的比例")
+    parser.add_argument("--open-delay", type=int, default=300, help="验证码窗口打开动画时长（毫秒）")
+    parser.add_argument("--profile", default="fast", help="TIMING_PROFILE（human/fast）")
+    parser.add_argument("--stream", action="store_true", help="启用流式识别")
+    parser.add_argument("--no-http-probe", action="store_true", help="关闭 HTTP 状态查询，走浏览器登录")
+    parser.add_argument("--json", dest="json_path", help="将结果写入 JSON 文件")
+    return parser.parse_args()
+
+
+def _configure_env(args, site_url: str, model_url: str, workdir: str, password: str):
+    """
+    用环境变量把签到流程指向本地服务
+
+    会话、缓存、台账、路由状态、同义词表与运行日志全部写入临时目录，基准测试的模拟结果
+    不会混入正式运行的状态文件。
+    """
+    accounts_file = os.path.join(workdir, "accounts.json")
+    with open(accounts_file, "w", encoding="utf-8") as f:
+        json.dump([{"user": f"bench{i}", "pass": password} for i in range(args.accounts)], f)
+
+    os.environ.update({
+        "LOGIN_URL": f"{site_url}/user/",
+        "BASE_URL": f"{model_url}/v1",
+        "API_KEY": "bench",
+        "MODEL": "fake-vision",
+        "ACCOUNTS_FILE": accounts_file,
+        "MAX_WORKERS": str(args.workers),
+        "SESSION_DIR": os.path.join(workdir, "sessions"),
+        "CAPTCHA_CACHE_PATH": os.path.join(workdir, "captcha_cache.sqlite3"),
+        "TILE_INDEX_PATH": os.path.join(workdir, "tile_index.sqlite3"),
+        "LEDGER_PATH": os.path.join(workdir, "checkin_ledger.sqlite3"),
+        "ROUTER_STATE_PATH": os.path.join(workdir, "model_router.sqlite3"),
+        "LABEL_SYNONYMS_PATH": os.path.join(workdir, "label_synonyms.sqlite3"),
+        "LOG_FILE": os.path.join(workdir, "checkin.jsonl"),
+        "TIMING_PROFILE": args.profile,
+        "RECOGNITION_STREAM": "true" if args.stream else "false",
+        "HTTP_PROBE": "false" if args.no_http_probe else "true",
+        "HEADLESS": "true",
+        "METRICS_JSON": os.path.join(workdir, "run_summary.json"),
+        "METRICS_TEXTFILE": "-",
+    })
+    # 使用系统 PATH 中的 chromedriver
+    os.environ.setdefault("CI", "true")
+
+
+def _stage_report(results) -> Dict[str, Dict[str, float]]:
+    """按阶段汇总各账户的耗时"""
+    stages = defaultdict(list)
+    for result in results:
+        for name, seconds in result.stages.items():
+            stages[name].append(seconds)
+    return {
+        name: {
+            "total": sum(values),
+            "mean": statistics.mean(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+        }
+        for name, values in sorted(stages.items())
+    }
+
+
+def main():
+    args = _parse_args()
+    password = "bench"
+    site, site_state = start_stub_site(password=password, open_delay_ms=args.open_delay)
+    model, model_state = start_fake_model(ModelBehavior(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        accuracy=args.accuracy, malformed_rate=args.malformed_rate
+    ))
+    site_url = f"http://127.0.0.1:{site.server_address[1]}"
+    model_url = f"http://127.0.0.1:{model.server_address[1]}"
+    logger.info(f"模拟站点: {site_url}，模拟模型: {model_url}")
+
+    with tempfile.TemporaryDirectory(prefix="checkin-bench-") as workdir:
+        _configure_env(args, site_url, model_url, workdir, password)
+        from config import Config
+        from orchestrator import CheckInOrchestrator
+
+        config = Config.from_env()
+        accounts = config.load_accounts()
+        start = time.time()
+        results = CheckInOrchestrator(config, accounts).run()
+        elapsed = time.time() - start
+
+    site.shutdown()
+    model.shutdown()
+
+    durations = [r.duration for r in results]
+    succeeded = sum(1 for r in results if r.success)
+    report = {
+        "accounts": len(results),
+        "workers": args.workers,
+        "succeeded": succeeded,
+        "wall_time": elapsed,
+        "throughput_per_min": len(results) / elapsed * 60 if elapsed else 0.0,
+        "account_p50": percentile(durations, 0.5),
+        "account_p95": percentile(durations, 0.95),
+        "stages": _stage_report(results),
+        "site": dict(site_state.counters),
+        "model": {
+            **model_state.counters,
+            "latency_p50": percentile(model_state.latencies, 0.5),
+        },
+    }
+
+    lines = [
+        f"账户 {report['accounts']}，工作进程 {report['workers']}，成功 {succeeded}/{len(results)}",
+        f"总耗时 {elapsed:.1f}s，吞吐量 {report['throughput_per_min']:.2f} 账户/分钟",
+        f"单账户耗时 p50 {report['account_p50']:.1f}s，p95 {report['account_p95']:.1f}s",
+        "",
+        f"{'阶段':<24}{'合计(s)':>10}{'平均(s)':>10}{'p50(s)':>10}{'p95(s)':>10}",
+    ]
+    for name, stats in report["stages"].items():
+        lines.append(f"{name:<24}{stats['total']:>10.2f}{stats['mean']:>10.2f}"
+                     f"{stats['p50']:>10.2f}{stats['p95']:>10.2f}")
+    lines.append("")
+    lines.append(f"站点计数: {json.dumps(report['site'], ensure_ascii=False)}")
+    lines.append(f"模型计数: {json.dumps(report['model'], ensure_ascii=False)}")
+    logger.info("基准测试结果:\n" + "\n".join(lines))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+本地模拟的 SakuraFrp 仪表板与 GeeTest 九宫格验证码
+
+页面保留签到流程依赖的全部 DOM 钩子：username/password/login、年龄确认弹窗、
+“点击这里签到”按钮、geetest_tip_img、geetest_item、geetest_commit、geetest_refresh，
+以及 JSONP 形式的 ajax.php 验证响应。验证码图片与验证接口的路径中包含
+static.geetest.com 与 api.geevisit.com/ajax.php，与真实站点使用相同的网络过滤规则。
+"""
+import io
+import json
+import random
+import secrets
+import threading
+from collections import Counter
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+# 物品名称与对应的颜色（模拟模型通过颜色识别物品）
+PALETTE = {
+    "苹果": (220, 40, 40),
+    "气球": (240, 200, 30),
+    "小狗": (150, 90, 40),
+    "汽车": (40, 90, 220),
+    "雨伞": (130, 40, 180),
+    "青蛙": (40, 170, 60),
+}
+TILE = 100
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>登录</title></head><body>
+<form method="post" action="/login">
+  <input type="hidden" name="csrf" value="%(csrf)s">
+  <input id="username" name="username" type="text">
+  <input id="password" name="password" type="password">
+  <button id="login" type="submit">登录</button>
+</form>
+</body></html>"""
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SakuraFrp</title>
+<style>
+  .geetest_widget { display: none; }
+  .geetest_widget.open { display: block; }
+  .geetest_tip_img { width: 150px; height: 200px; background-size: cover; }
+  .geetest_item { display: inline-block; width: 60px; height: 60px; background: #eee; margin: 2px; }
+  .geetest_item.geetest_selected { outline: 2px solid #09f; }
+</style></head><body>
+%(age)s
+<div id="checkin">%(checkin)s</div>
+<div class="geetest_widget">
+  <div class="geetest_tip_img"></div>
+  <div class="geetest_grid">%(items)s</div>
+  <div class="geetest_commit geetest_disable">确认</div>
+  <div class="geetest_refresh">刷新</div>
+</div>
+<script>
+(function() {
+  var widget = document.querySelector('.geetest_widget');
+  var commit = document.querySelector('.geetest_commit');
+  var cid = null;
+  var selected = {};
+
+  function loadCaptcha() {
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', '/captcha/new');
+    xhr.onload = function() {
+      var data = JSON.parse(xhr.responseText);
+      cid = data.cid;
+      selected = {};
+      document.querySelectorAll('.geetest_item').forEach(function(item) {
+        item.classList.remove('geetest_selected');
+      });
+      commit.classList.add('geetest_disable');
+      var img = new Image();
+      img.onload = function() {
+        document.querySelector('.geetest_tip_img').style.backgroundImage = 'url("' + data.url + '")';
+      };
+      img.src = data.url;
+    };
+    xhr.send();
+  }
+
+  var button = document.getElementById('checkin-button');
+  if (button) {
+    button.addEventListener('click', function() {
+      // 模拟验证码窗口的打开动画
+      setTimeout(function() { widget.classList.add('open'); loadCaptcha(); }, %(open_delay)d);
+    });
+  }
+
+  document.querySelectorAll('.geetest_item').forEach(function(item, index) {
+    item.addEventListener('click', function() {
+      var position = index + 1;
+      if (selected[position]) { delete selected[position]; item.classList.remove('geetest_selected'); }
+      else { selected[position] = true; item.classList.add('geetest_selected'); }
+      if (Object.keys(selected).length) { commit.classList.remove('geetest_disable'); }
+      else { commit.classList.add('geetest_disable'); }
+    });
+  });
+
+  document.querySelector('.geetest_refresh').addEventListener('click', loadCaptcha);
+
+  commit.addEventListener('click', function() {
+    if (commit.classList.contains('geetest_disable')) { return; }
+    var callback = 'geetest_' + Date.now();
+    window[callback] = function(result) {
+      if (result.data.result === 'success') {
+        widget.classList.remove('open');
+        document.getElementById('checkin').innerHTML = '<p>今天已经签到过啦</p>';
+      } else {
+        setTimeout(loadCaptcha, 300);
+      }
+    };
+    var script = document.createElement('script');
+    script.src = '/api.geevisit.com/ajax.php?callback=' + callback + '&cid=' + cid +
+                 '&answer=' + Object.keys(selected).join(',');
+    document.body.appendChild(script);
+  });
+
+  var age = document.querySelector('.yes a');
+  if (age) {
+    age.addEventListener('click', function() {
+      document.cookie = 'age_ok=1; path=/';
+      document.getElementById('age').remove();
+    });
+  }
+})();
+</script>
+</body></html>"""
+
+AGE_DIALOG = '<div id="age"><div class="yes"><a href="javascript:void(0)">是，我已满18岁</a></div></div>'
+CHECKIN_BUTTON = '<button id="checkin-button"><span>点击这里签到</span></button>'
+CHECKED_IN = '<p>今天已经签到过啦</p>'
+
+
+def render_captcha(labels, reference: str) -> bytes:
+    """绘制验证码图片：上方 3×3 九宫格，下方左侧为参考图"""
+    img = Image.new('RGB', (TILE * 3, TILE * 4), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for index, label in enumerate(labels):
+        row, col = divmod(index, 3)
+        color = PALETTE[label]
+        x, y = col * TILE, row * TILE
+        draw.rectangle((x, y, x + TILE - 1, y + TILE - 1), fill=color)
+        # 加一点随机纹理，避免每张图完全相同
+        for _ in range(12):
+            px, py = x + random.randint(5, TILE - 10), y + random.randint(5, TILE - 10)
+            draw.rectangle((px, py, px + 4, py + 4), fill=tuple(min(255, c + 30) for c in color))
+    draw.rectangle((0, TILE * 3, TILE - 1, TILE * 4 - 1), fill=PALETTE[reference])
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class StubState:
+    """模拟站点的全部状态（线程安全）"""
+
+    def __init__(self, password: str, open_delay_ms: int, age_dialog: bool):
+        self.password = password
+        self.open_delay_ms = open_delay_ms
+        self.age_dialog = age_dialog
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, str] = {}
+        self.signed: Set[str] = set()
+        self.captchas: Dict[str, Set[int]] = {}
+        self.images: Dict[str, bytes] = {}
+        self.counters = Counter()
+
+    def new_captcha(self) -> str:
+        labels = [random.choice(list(PALETTE)) for _ in range(9)]
+        reference = random.choice(labels)
+        cid = secrets.token_hex(6)
+        with self.lock:
+            self.captchas[cid] = {i + 1 for i, label in enumerate(labels) if label == reference}
+            self.images[cid] = render_captcha(labels, reference)
+            self.counters['captchas'] += 1
+        return cid
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟站点请求处理"""
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _user(self) -> Optional[str]:
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        sid = cookie['sid'].value if 'sid' in cookie else None
+        return self.state.sessions.get(sid)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        state = self.state
+        state.counters[f"GET {url.path.split('/')[1] if '/' in url.path else url.path}"] += 1
+
+        if url.path in ('/user', '/user/'):
+            user = self._user()
+            if not user:
+                html = LOGIN_PAGE % {'csrf': secrets.token_hex(8)}
+            else:
+                cookie = SimpleCookie(self.headers.get('Cookie', ''))
+                show_age = state.age_dialog and 'age_ok' not in cookie
+                html = DASHBOARD_PAGE % {
+                    'age': AGE_DIALOG if show_age else '',
+                    'checkin': CHECKED_IN if user in state.signed else CHECKIN_BUTTON,
+                    'items': ''.join('<div class="geetest_item"></div>' for _ in range(9)),
+                    'open_delay': state.open_delay_ms,
+                }
+            self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+        elif url.path == '/captcha/new':
+            cid = state.new_captcha()
+            host = self.headers.get('Host')
+            body = json.dumps({'cid': cid, 'url': f"http://{host}/static.geetest.com/captcha/{cid}.png"})
+            self._send(200, body.encode('utf-8'), 'application/json')
+
+        elif url.path.startswith('/static.geetest.com/captcha/'):
+            cid = url.path.rsplit('/', 1)[-1].split('.')[0]
+            image = state.images.get(cid)
+            if image is None:
+                self._send(404, b'', 'text/plain')
+            else:
+                self._send(200, image, 'image/png')
+
+        elif url.path == '/api.geevisit.com/ajax.php':
+            callback = query.get('callback', ['geetest_0'])[0]
+            cid = query.get('cid', [''])[0]
+            answer = {int(p) for p in query.get('answer', [''])[0].split(',') if p.isdigit()}
+            with state.lock:
+                correct = state.captchas.pop(cid, None)
+                success = correct is not None and answer == correct
+                state.counters['verify_success' if success else 'verify_fail'] += 1
+                user = self._user()
+                if success and user:
+                    state.signed.add(user)
+            result = {'status': 'success', 'data': {'result': 'success' if success else 'fail'}}
+            body = f"{callback}({json.dumps(result)})"
+            self._send(200, body.encode('utf-8'), 'application/javascript')
+
+        else:
+            self._send(404, b'', 'text/plain')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        state = self.state
+        if url.path != '/login':
+            self._send(404, b'', 'text/plain')
+            return
+
+        state.counters['login'] += 1
+        user = form.get('username', [''])[0]
+        if not user or form.get('password', [''])[0] != state.password:
+            html = LOGIN_PAGE % {'csrf': secrets.token_hex(8)}
+            self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+            return
+
+        sid = secrets.token_hex(16)
+        with state.lock:
+            state.sessions[sid] = user
+        self._send(302, b'', 'text/plain', {
+            'Set-Cookie': f'sid={sid}; Path=/; HttpOnly',
+            'Location': '/user/',
+        })
+
+
+def start_stub_site(password: str = "bench", open_delay_ms: int = 300, age_dialog: bool = True,
+                    host: str = "127.0.0.1", port: int = 0):
+    """在后台线程启动模拟站点，返回 (server, state)"""
+    state = StubState(password, open_delay_ms, age_dialog)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="stub-site", daemon=True).start()
+    return server, state
@@ -0,0 +1,153 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ImageKey:
+    """验证码图片的哈希键"""
+    sha256: str
+    phash: Optional[int] = None
+    matched: Optional[str] = None  # 命中的缓存条目（感知哈希命中时与 sha256 不同）
+
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """计算 64 位差值哈希（dHash），重新编码或轻微缩放后仍保持接近"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.debug(f"计算感知哈希失败: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+class CaptchaCache:
+    """
+    验证码识别结果的持久化缓存（按图片哈希寻址，LRU 淘汰）
+
+    协程引擎中多个账户在工作线程中共用同一个连接，读写都在锁内完成，各账户的事务不会交错。
+    """
+
+    def __init__(self, path: str, max_entries: int = 2000, max_distance: int = 6):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS captcha_cache ("
+            " sha256 TEXT PRIMARY KEY,"
+            " phash TEXT,"
+            " result TEXT NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " near_misses INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(captcha_cache)")}
+        if "near_misses" not in columns:
+            self.conn.execute("ALTER TABLE captcha_cache ADD COLUMN near_misses INTEGER NOT NULL DEFAULT 0")
+        self.conn.commit()
+
+    @staticmethod
+    def key(image_bytes: bytes) -> ImageKey:
+        """计算图片的精确哈希与感知哈希"""
+        return ImageKey(hashlib.sha256(image_bytes).hexdigest(), perceptual_hash(image_bytes))
+
+    def get(self, key: ImageKey) -> Optional[Dict]:
+        """
+        查找识别结果：先精确匹配，再按感知哈希的汉明距离匹配
+
+        近似命中后验证失败过的条目，允许的距离按失败次数减半，只匹配更接近的图片。
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT sha256, result FROM captcha_cache WHERE sha256 = ?", (key.sha256,)
+            ).fetchone()
+
+            if row is None and key.phash is not None:
+                best = None
+                for sha256, phash, result, near_misses in self.conn.execute(
+                    "SELECT sha256, phash, result, near_misses FROM captcha_cache WHERE phash IS NOT NULL"
+                ):
+                    distance = bin(int(phash, 16) ^ key.phash).count('1')
+                    if distance <= self.max_distance >> near_misses and (best is None or distance < best[0]):
+                        best = (distance, sha256, result)
+                if best:
+                    logger.info(f"验证码缓存感知哈希命中，距离 {best[0]}")
+                    row = best[1:]
+
+            if row is None:
+                return None
+
+            key.matched = row[0]
+            self.conn.execute(
+                "UPDATE captcha_cache SET hits = hits + 1, last_used = ? WHERE sha256 = ?",
+                (time.time(), row[0])
+            )
+            self.conn.commit()
+            return json.loads(row[1])
+
+    def put(self, key: ImageKey, result: Dict):
+        """保存已验证成功的识别结果，超出容量时淘汰最久未使用的条目"""
+        with self.lock:
+            now = time.time()
+            phash = f"{key.phash:016x}" if key.phash is not None else None
+            self.conn.execute(
+                "INSERT OR REPLACE INTO captcha_cache (sha256, phash, result, hits, created, last_used)"
+                " VALUES (?, ?, ?, 0, ?, ?)",
+                (key.sha256, phash, json.dumps(result, ensure_ascii=False), now, now)
+            )
+            self.conn.execute(
+                "DELETE FROM captcha_cache WHERE sha256 IN ("
+                " SELECT sha256 FROM captcha_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+            logger.info("已缓存验证成功的识别结果")
+
+    def invalidate(self, key: ImageKey):
+        """
+        记录命中结果验证失败
+
+        精确命中时删除该条目；感知哈希近似命中时命中的是另一张已验证过的图片，只记录一次
+        近似未命中（降低该条目的近似匹配范围），不删除它。
+        """
+        with self.lock:
+            if not key.matched:
+                return
+            if key.matched == key.sha256:
+                self.conn.execute("DELETE FROM captcha_cache WHERE sha256 = ?", (key.sha256,))
+                logger.info("缓存的识别结果验证失败，已删除")
+            else:
+                self.conn.execute(
+                    "UPDATE captcha_cache SET near_misses = near_misses + 1 WHERE sha256 = ?", (key.matched,)
+                )
+                logger.info("感知哈希近似命中的结果验证失败，缩小该条目的近似匹配范围")
+            self.conn.commit()
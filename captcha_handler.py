@@ -1,31 +1,188 @@
+import copy
 import logging
 import os
-import time
-import random
 import json
 import re
-from typing import Optional, Dict
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Dict
+from urllib.parse import urlsplit
 
+import requests
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
-from openai import OpenAI
+from captcha_cache import CaptchaCache
 from config import Config
+from image_pipeline import ImagePipeline
+from label_canon import LabelCanonicalizer
+from metrics import RunMetrics
+from model_router import ModelRouter
+from recognition_engine import RecognitionEngine, endpoints_from_config
+from retry_policy import ABORT, MODEL_API_ERROR, REFRESH_CAPTCHA, RetryPolicy
+from tile_index import TileIndex
+from wait_engine import WaitEngine, get_profile
+from webdriver_manager import CAPTCHA_IMAGE_URL_FILTER, VERIFY_URL_FILTER
 
 logger = logging.getLogger(__name__)
 
+# 常见图片格式的文件头，用于从 static.geetest.com 的响应中区分验证码图片与脚本、样式
+IMAGE_SIGNATURES = (b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'RIFF')
+
+# 在页面内完成整个点击与提交：按预先生成的间隔依次点击格子，用 MutationObserver 等待确认按钮
+# 去掉 geetest_disable 后立即点击（超时仍尝试点击），返回每一步相对开始的时间（毫秒）。
+CLICK_SCRIPT = """
+const [positions, delays, commitTimeout, done] = arguments;
+const start = performance.now();
+const steps = [];
+const mark = (step, extra) => steps.push(Object.assign({step: step, t: Math.round(performance.now() - start)}, extra || {}));
+const items = Array.from(document.getElementsByClassName('geetest_item')).slice(0, 9);
+if (items.length < 9) {
+    done({error: 'grid', found: items.length, steps: steps});
+    return;
+}
+let clicked = 0;
+let index = 0;
+function clickNext() {
+    if (index >= positions.length) {
+        waitCommit();
+        return;
+    }
+    const position = positions[index];
+    try {
+        items[position - 1].click();
+        clicked++;
+        mark('click', {position: position});
+    } catch (e) {
+        mark('click_error', {position: position, error: String(e)});
+    }
+    setTimeout(clickNext, delays[index++]);
+}
+const enabled = (button) => !button.classList.contains('geetest_disable');
+function commit(button, state) {
+    if (button) {
+        button.click();
+        mark('commit', {state: state});
+    } else {
+        mark('no_commit');
+    }
+    done({clicked: clicked, committed: !!button, state: state, steps: steps});
+}
+function waitCommit() {
+    const button = document.getElementsByClassName('geetest_commit')[0];
+    if (!button || enabled(button)) {
+        commit(button, button ? 'enabled' : 'missing');
+        return;
+    }
+    mark('wait_commit');
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        if (enabled(button)) {
+            observer.disconnect();
+            clearTimeout(timer);
+            commit(button, 'enabled');
+        }
+    });
+    observer.observe(button, {attributes: true, attributeFilter: ['class']});
+    timer = setTimeout(() => {
+        observer.disconnect();
+        commit(button, 'forced');
+    }, commitTimeout);
+}
+clickNext();
+"""
+
+
+@dataclass
+class PendingRecognition:
+    """已在后台开始的模型识别"""
+    prepared: Any
+    usage_start: int
+    started: float
+    future: Any
+    finished: Optional[float] = None
+
+
+@dataclass
+class PrefetchedCaptcha:
+    """点击签到后提前捕获的验证码图片及其识别（可能仍在进行中）"""
+    url: str
+    image_bytes: bytes
+    cache_key: Any
+    result: Optional[Dict]
+    source: str
+    pending: Optional[PendingRecognition] = None
+
 
 class CaptchaHandler:
     """验证码处理器"""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, waits: Optional[WaitEngine] = None):
         self.config = config
-        self.client = OpenAI(
-            base_url=config.base_url,
-            api_key=config.api_key
+        self.waits = waits or WaitEngine(get_profile(config.timing_profile))
+        self.network = None  # 由 CheckInAutomation 在浏览器启动后绑定
+        self.metrics = RunMetrics(config.sakurafrp_user)
+        self.retry = RetryPolicy.from_config(config)  # 由 CheckInAutomation 按账户替换
+        endpoints = endpoints_from_config(config)
+        router = ModelRouter(
+            [endpoint.name for endpoint in endpoints],
+            state_path=config.router_state_path,
+            breaker_errors=config.router_breaker_errors,
+            breaker_cooldown=config.router_breaker_cooldown,
+            default_latency=config.recognition_timeout / 3
+        )
+        self.engine = RecognitionEngine(
+            endpoints,
+            mode=config.recognition_mode,
+            timeout=config.recognition_timeout,
+            hedge_delay=config.hedge_delay,
+            hedge_percentile=config.hedge_percentile,
+            votes=config.recognition_votes,
+            router=router
+        )
+        self.http = requests.Session()
+        self.cache = CaptchaCache(config.captcha_cache_path, config.captcha_cache_size)
+        self.tile_index = TileIndex(config.tile_index_path, config.tile_index_threshold)
+        self.image_pipeline = ImagePipeline(
+            mode=config.image_mode,
+            max_side=config.image_max_side,
+            fmt=config.image_format,
+            quality=config.image_quality,
+            crop=config.image_crop
         )
+        self.labels = LabelCanonicalizer(
+            config.label_synonyms_path,
+            similarity=config.label_similarity,
+            embedding_model=config.label_embedding_model,
+            embedding_threshold=config.label_embedding_threshold
+        )
+        self._match_decisions = []  # 本轮点击依据的 (格子标签, 参考图标签, 依据)
+        self._logged_pairs = set()
+        self.image_stats = []
+        self.last_solve = None  # 最近一次提交的识别结果与验证结果，写入签到台账
+        self.last_click_steps = []  # 最近一次页面内点击与提交的各步耗时
+        self._prefetched: Optional[PrefetchedCaptcha] = None
 
+    def for_account(self, config: Config, metrics: RunMetrics, retry: RetryPolicy) -> 'CaptchaHandler':
+        """
+        复制出账户独立的处理器，识别引擎、缓存、格子索引与同义词表仍然共享
+        
+        供协程引擎在同一进程中并发处理多个账户，每个账户的指标、重试预算与点击依据互不干扰。
+        """
+        handler = copy.copy(self)
+        handler.config = config
+        handler.metrics = metrics
+        handler.retry = retry
+        handler.network = None
+        handler.image_stats = []
+        handler.last_solve = None
+        handler.last_click_steps = []
+        handler._match_decisions = []
+        handler._logged_pairs = set()
+        handler._prefetched = None
+        return handler
+    
     def get_img(self, wait: WebDriverWait):
         try:
             # 获取验证码图片
@@ -49,82 +206,319 @@ class CaptchaHandler:
                 logger.info("未检测到 GeeTest 验证码窗口")
                 return False
     
+    def click_and_prefetch(self, driver, click: Callable[[], Any], timeout: float = 10.0):
+        """
+        点击签到按钮，并在验证码图片加载完成后立即开始识别（CAPTCHA_PIPELINE）
+        
+        图片请求通常在验证码窗口动画结束前就已完成。这里监听图片响应，一到达就查缓存或提交给模型，
+        之后的人类停顿、窗口动画与模型请求并行；_solve_once 等窗口可见后再取识别结果点击。
+        窗口先于图片响应出现或超时未捕获时，退回顺序流程。
+        """
+        self._discard_prefetch()
+        if not self.network or not self.config.captcha_pipeline:
+            click()
+            return
+        
+        self.network.reset()
+        click()
+        captured = {}
+        
+        def image_or_widget(d):
+            response = self.network.poll(CAPTCHA_IMAGE_URL_FILTER)
+            if response and response.body.startswith(IMAGE_SIGNATURES):
+                captured['response'] = response
+                return True
+            return bool(EC.visibility_of_element_located((By.CLASS_NAME, "geetest_tip_img"))(d))
+        
+        with self.metrics.span("prefetch"):
+            try:
+                self.waits.until(driver, "captcha_image", image_or_widget, timeout)
+            except TimeoutException:
+                logger.info("未捕获到验证码图片响应，按顺序流程处理")
+                return
+            response = captured.get('response')
+            if not response:
+                logger.info("验证码窗口先于图片响应出现，按顺序流程处理")
+                return
+            
+            logger.info(f"验证码图片已加载（{len(response.body)} 字节），提前开始识别: {response.url}")
+            self.metrics.incr("captcha_prefetch")
+            cache_key, result, source = self._lookup_local(response.body)
+            pending = None
+            # 流式模式边生成边点击，只能等窗口可见后再开始
+            if not result and not self.config.recognition_stream:
+                try:
+                    pending = self._start_recognition(response.url, response.body)
+                except Exception as e:
+                    logger.warning(f"提前识别未能开始: {e}")
+            self._prefetched = PrefetchedCaptcha(response.url, response.body, cache_key, result, source, pending)
+    
+    def _take_prefetch(self, img_url: str) -> Optional[PrefetchedCaptcha]:
+        """取出与当前验证码图片一致的预取结果，不一致时丢弃"""
+        prefetched = self._prefetched
+        if not prefetched:
+            return None
+        self._prefetched = None
+        if urlsplit(prefetched.url).path != urlsplit(img_url).path:
+            logger.info("预取的图片与验证码窗口不一致，重新获取")
+            if prefetched.pending:
+                prefetched.pending.future.cancel()
+            return None
+        self.metrics.incr("captcha_prefetch_used")
+        return prefetched
+    
+    def _discard_prefetch(self):
+        if self._prefetched and self._prefetched.pending:
+            self._prefetched.pending.future.cancel()
+        self._prefetched = None
+    
     def handle_geetest_captcha(self, driver, wait: WebDriverWait) -> bool:
-        """处理 GeeTest 九宫格验证码（带重试机制）"""
+        """
+        处理 GeeTest 九宫格验证码（带重试机制）
+        
+        每次失败按类别交给重试策略决定：在验证码窗口内换图重试、返回 False 交给上层重新加载页面，
+        或放弃当前账户（self.retry.aborted 为真）。
+        """
         logger.info("开始处理 GeeTest 验证码...")
         
+        rounds = max(1, self.config.captcha_widget_retries)
+        for round_index in range(1, rounds + 1):
+            if round_index > 1:
+                logger.info(f"验证码窗口内重试 {round_index}/{rounds}")
+                self.metrics.incr("captcha_retries")
+            
+            self.metrics.incr("captcha_rounds")
+            outcome = self._solve_once(driver, wait)
+            self.metrics.incr(f"captcha_outcome:{outcome}")
+            if outcome in ("success", "closed"):
+                return True
+            
+            failure_class = self.retry.classify(outcome)
+            self.metrics.incr(f"failure:{failure_class}")
+            decision = self.retry.on_failure(failure_class)
+            if decision.action == ABORT:
+                return False
+            if decision.action != REFRESH_CAPTCHA or not self._widget_present(driver):
+                logger.warning("验证码窗口已消失或需要重新加载，刷新网页重试...")
+                if decision.delay:
+                    time.sleep(decision.delay)
+                self.waits.jitter("captcha_exit")
+                return False
+            if round_index < rounds:
+                if decision.delay:
+                    time.sleep(decision.delay)
+                if not self._refresh_captcha(driver):
+                    return False
+        
+        logger.warning("验证码窗口内重试次数已用完，刷新网页重试...")
+        self.waits.jitter("captcha_exit")
+        return False
+    
+    def _solve_once(self, driver, wait: WebDriverWait) -> str:
+        """
+        识别并提交当前验证码一次
+        
+        返回值:
+            "success"/"fail"/"closed"/"timeout": 提交后的验证结果
+            "no_image": 未获取到验证码图片
+            "no_result": 模型输出无法解析
+            "model_error": 模型接口超时或报错
+            "no_click": 没有匹配的格子或未能点击
+            "page_error": 页面元素缺失或脚本异常
+        """
         try:
             # 获取验证码图片
-            img_url = self.get_img(wait)
+            with self.metrics.span("get_img"):
+                img_url = self.get_img(wait)
+                prefetched = self._take_prefetch(img_url) if img_url else None
+                if prefetched:
+                    image_bytes = prefetched.image_bytes
+                else:
+                    image_bytes = self._fetch_image(img_url) if img_url else None
             if not img_url:
-                logger.error("图片获取失败，刷新网页重试...")
-                time.sleep(2)
-                return False
-            
-            # 调用视觉模型识别
-            recognition_result = self._recognize_captcha(img_url)
-            if not recognition_result:
-                logger.warning("识别失败，刷新网页重试...")
-                time.sleep(2)
-                return False
+                logger.error("图片获取失败")
+                return "no_image"
             
-            logger.info(f"验证码识别结果: {recognition_result}")
+            # 优先查找已验证成功的识别结果，命中时跳过模型调用
+            pending = None
+            if prefetched:
+                cache_key, recognition_result, source = prefetched.cache_key, prefetched.result, prefetched.source
+                pending = prefetched.pending
+            elif image_bytes:
+                cache_key, recognition_result, source = self._lookup_local(image_bytes)
+            else:
+                cache_key, recognition_result, source = None, None, "model"
             
-            # 根据识别结果点击相应的九宫格
-            if not self._click_captcha_items(driver, recognition_result):
-                logger.warning("点击失败，刷新网页重试...")
-                time.sleep(2)
-                return False
+            # 流式模式：边生成边点击
+            if not recognition_result and self.config.recognition_stream:
+                source = "stream"
+                self._reset_verification_capture(driver)
+                with self.metrics.span("recognize_click"):
+                    recognition_result, submitted = self._recognize_and_click_streaming(driver, img_url, image_bytes)
+                if not recognition_result:
+                    logger.warning("识别失败")
+                    return self._recognition_failure()
+                if not submitted:
+                    logger.warning("点击失败")
+                    return "no_click"
+            else:
+                # 调用视觉模型识别
+                if not recognition_result:
+                    with self.metrics.span("recognize"):
+                        if pending:
+                            recognition_result = self._await_recognition(pending)
+                        else:
+                            recognition_result = self._recognize_captcha(img_url, image_bytes)
+                if not recognition_result:
+                    logger.warning("识别失败")
+                    return self._recognition_failure()
+                
+                logger.info(f"验证码识别结果: {recognition_result}")
+                
+                # 根据识别结果点击相应的九宫格
+                self._reset_verification_capture(driver)
+                with self.metrics.span("click"):
+                    clicked = self._click_captcha_items(driver, recognition_result)
+                if not clicked:
+                    logger.warning("点击失败")
+                    return "no_click"
             
-            logger.warning("验证码流程完成，刷新网页验证是否成功...")
-            time.sleep(2)
-            return True
+            with self.metrics.span("verification"):
+                verification = self._wait_for_verification_result(driver, timeout=5)
+            self._settle(source, recognition_result, verification, cache_key, image_bytes)
+            return verification
         except Exception as e:
             logger.error(f"处理验证码时发生错误: {e}", exc_info=True)
+            return "page_error"
+    
+    def _settle(self, source: str, result: Dict, verification: str, cache_key, image_bytes: Optional[bytes],
+                sources: Optional[list] = None):
+        """
+        按验证结果更新同义词表、模型路由、识别缓存与格子索引（与浏览器引擎无关，两种引擎共用）
+        
+        sources 为识别结果来自的端点，默认为识别引擎最近一次识别。
+        """
+        self.last_solve = {'source': source, 'result': result, 'verification': verification}
+        if verification not in ("success", "fail"):
+            return
+        success = verification == "success"
+        self.labels.learn(self._match_decisions, success)
+        # 模型给出的结果经过验证后反馈给路由，更新端点的成功率
+        if source in ("model", "stream"):
+            self.engine.record_verification(success, sources)
+        # 只缓存经过验证成功的识别结果
+        if cache_key:
+            if success:
+                self.cache.put(cache_key, result)
+                self.tile_index.add(image_bytes, result)
+            elif cache_key.matched:
+                self.cache.invalidate(cache_key)
+    
+    def _recognition_failure(self) -> str:
+        """区分模型接口错误与输出格式错误"""
+        return "model_error" if self.engine.last_failure == MODEL_API_ERROR else "no_result"
+    
+    def _widget_present(self, driver) -> bool:
+        """验证码窗口是否仍然显示"""
+        try:
+            widgets = driver.find_elements(By.CLASS_NAME, "geetest_widget")
+            return bool(widgets) and widgets[0].is_displayed()
+        except Exception:
             return False
-
     
-    def _recognize_captcha(self, img_url: str) -> Optional[Dict]:
-        """使用视觉模型识别验证码"""
+    def _current_img_url(self, driver) -> str:
+        """读取当前验证码图片的 background-image，不存在时返回空字符串"""
+        elements = driver.find_elements(By.CLASS_NAME, "geetest_tip_img")
+        if not elements:
+            return ""
+        return elements[0].value_of_css_property("background-image") or ""
+    
+    def _fetch_image(self, img_url: str) -> Optional[bytes]:
+        """获取验证码图片：优先使用浏览器已加载的响应，否则通过连接池下载"""
+        if self.network:
+            response = self.network.poll(img_url)
+            if response and response.body:
+                logger.info(f"从浏览器网络缓存读取验证码图片（{len(response.body)} 字节）")
+                return response.body
         try:
-            prompt = (
-                '这是一个九宫格验证码，请按从左到右、从上到下的顺序识别每个格子里的物品名称，'
-                '最后识别左下角的参考图。输出格式为JSON：{"1":"名称", "2":"名称", ..., "10":"参考图名称"}。'
-                '名称要简洁，参考图名称必须是九宫格里已有的名称。若有类似物品（如气球与热气球），请统一名称。'
-            )
-            
-            response = self.client.chat.completions.create(
-                model=self.config.model,
-                messages=[{
-                    'role': 'user',
-                    'content': [
-                        {'type': 'text', 'text': prompt},
-                        {'type': 'image_url', 'image_url': {'url': img_url}}
-                    ]
-                }],
-                stream=False
-            )
-            
-            result_content = response.choices[0].message.content
-            logger.info(f"模型原始输出: {result_content}")
-            
-            # 清理并解析 JSON
-            cleaned_str = result_content.replace("'", '"')
-            # 尝试提取 JSON 内容（处理可能包含其他文本的情况）
-            json_match = json.loads(cleaned_str) if cleaned_str.startswith('{') else None
-            
-            if not json_match:
-                logger.error("无法从模型输出中提取有效 JSON")
-                return None
-            
-            return json_match
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析失败: {e}")
+            response = self.http.get(img_url, timeout=10)
+            response.raise_for_status()
+            return response.content
+        except Exception as e:
+            logger.warning(f"下载验证码图片失败: {e}")
             return None
+    
+    def _lookup_local(self, image_bytes: bytes):
+        """查询识别缓存与本地格子索引，返回 (缓存键, 识别结果, 来源)"""
+        cache_key = self.cache.key(image_bytes)
+        result = self.cache.get(cache_key)
+        if result:
+            logger.info("命中验证码缓存，跳过模型识别")
+            self.metrics.incr("cache_hits")
+            return cache_key, result, "cache"
+        result = self.tile_index.recognize(image_bytes)
+        if result:
+            self.metrics.incr("tile_index_hits")
+            return cache_key, result, "tile_index"
+        return cache_key, None, "model"
+    
+    def _recognize_captcha(self, img_url: str, image_bytes: Optional[bytes] = None) -> Optional[Dict]:
+        """使用视觉模型识别验证码（图片在本地预处理后内联发送）"""
+        try:
+            pending = self._start_recognition(img_url, image_bytes)
+        except Exception as e:
+            logger.error(f"验证码识别失败: {e}", exc_info=True)
+            return None
+        return self._await_recognition(pending)
+    
+    def _start_recognition(self, img_url: str, image_bytes: Optional[bytes]) -> PendingRecognition:
+        """预处理图片并在识别引擎的事件循环中开始识别，不等待结果"""
+        prepared = self.image_pipeline.prepare(img_url, image_bytes)
+        pending = PendingRecognition(prepared, len(self.engine.usage), time.time(), None)
+        pending.future = self.engine.recognize_async(prepared.payload)
+        pending.future.add_done_callback(lambda _: setattr(pending, 'finished', time.time()))
+        return pending
+    
+    def _await_recognition(self, pending: PendingRecognition) -> Optional[Dict]:
+        """等待识别结果并记录图片统计（耗时按识别实际完成的时间计算）"""
+        try:
+            result = pending.future.result()
         except Exception as e:
             logger.error(f"验证码识别失败: {e}", exc_info=True)
             return None
+        latency = (pending.finished or time.time()) - pending.started
+        self._record_image_stats(pending.prepared, latency, self.engine.usage[pending.usage_start:], result)
+        return result
+    
+    def _record_image_stats(self, prepared, latency: float, usage, result):
+        """记录一次识别的图片大小、token 用量与耗时"""
+        stats = {
+            'raw_bytes': prepared.raw_bytes,
+            'sent_bytes': prepared.sent_bytes,
+            'prompt_tokens': sum(u['prompt_tokens'] for u in usage),
+            'completion_tokens': sum(u['completion_tokens'] for u in usage),
+            'latency': latency,
+            'recognized': bool(result),
+        }
+        self.image_stats.append(stats)
+        logger.info(
+            f"识别请求（{self.image_pipeline.describe()} {prepared.size}）: "
+            f"原图 {stats['raw_bytes']} 字节, 发送 {stats['sent_bytes']} 字节, "
+            f"prompt tokens {stats['prompt_tokens']}, 耗时 {latency:.2f}s"
+        )
+    
+    def log_image_stats(self):
+        """输出本次运行的识别请求统计，用于比较不同预处理参数"""
+        if not self.image_stats:
+            return
+        count = len(self.image_stats)
+        average = lambda key: sum(s[key] for s in self.image_stats) / count
+        logger.info(
+            f"识别请求统计（{self.image_pipeline.describe()}, {count} 次）: "
+            f"平均发送 {average('sent_bytes'):.0f} 字节, 平均 prompt tokens {average('prompt_tokens'):.0f}, "
+            f"平均耗时 {average('latency'):.2f}s, 识别成功 {sum(s['recognized'] for s in self.image_stats)}/{count}"
+        )
+        logger.info(f"模型路由状态: {self.engine.router.summary()}")
     
     def _click_captcha_items(self, driver, recognition_result: Dict) -> bool:
         """
@@ -138,102 +532,256 @@ class CaptchaHandler:
         第10个是参考图（左下角）
         """
         try:
-            # 获取参考图名称（第10个元素）
-            target_name = recognition_result.get("10", "").strip()
-            if not target_name:
-                logger.error("未能从识别结果中获取参考图名称")
-                return False
-            
-            logger.info(f"目标物品: {target_name}")
-            
-            # 获取所有九宫格元素（前9个）
-            grid_items = driver.find_elements(By.CLASS_NAME, "geetest_item")
-            
-            # 排除最后一个（参考图），只处理前9个
-            if len(grid_items) < 9:
-                logger.error(f"九宫格元素数量不足，只找到 {len(grid_items)} 个")
+            positions = self._match_positions(recognition_result)
+            if not positions:
                 return False
             
-            clickable_items = grid_items[:9]
-            
-            # 遍历前9个格子，找到匹配的物品并点击
-            clicked_count = 0
-            for i in range(9):
-                position = i + 1  # 位置索引从1开始
-                item_name = recognition_result.get(str(position), "").strip()
-                
-                logger.info(f"位置 {position}: {item_name}")
-                
-                # 如果当前格子的物品名称匹配参考图
-                if item_name and item_name == target_name:
-                    logger.info(f"找到匹配项！位置 {position} - {item_name}")
-                    
-                    # 点击该格子
-                    try:
-                        # 使用 JavaScript 点击，更稳定
-                        driver.execute_script("arguments[0].click();", clickable_items[i])
-                        clicked_count += 1
-                        logger.info(f"已点击位置 {position}")
-                        
-                        # 点击后短暂等待，模拟人类操作
-                        time.sleep(random.uniform(0.3, 0.6))
-                        
-                    except Exception as e:
-                        logger.error(f"点击位置 {position} 时出错: {e}")
-            
+            clicked_count = self._click_and_commit(driver, positions)
             if clicked_count == 0:
-                logger.warning(f"未找到匹配 '{target_name}' 的格子")
                 return False
-            
             logger.info(f"共点击了 {clicked_count} 个匹配的格子")
-            
-            # 点击完成后，查找并点击确认按钮
-            try:
-                # 等待确认按钮变为可用状态（移除 geetest_disable 类）
-                confirm_button = WebDriverWait(driver, 5).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, "geetest_commit"))
-                )
-                
-                # 检查按钮是否可用（没有 geetest_disable 类）
-                button_classes = confirm_button.get_attribute("class")
-                logger.info(f"确认按钮状态: {button_classes}")
-                
-                # 等待按钮变为可点击状态（最多等待3秒）
-                max_wait = 3
-                start = time.time()
-                while "geetest_disable" in confirm_button.get_attribute("class"):
-                    if time.time() - start > max_wait:
-                        logger.warning("确认按钮未激活，但仍尝试点击")
-                        break
-                    time.sleep(0.2)
-                    confirm_button = driver.find_element(By.CLASS_NAME, "geetest_commit")
-                
-                logger.info("找到确认按钮，准备点击...")
-                driver.execute_script("arguments[0].click();", confirm_button)
-                logger.info("已点击确认按钮")
-                time.sleep(1)
-            except TimeoutException:
-                logger.info("未找到确认按钮，可能自动提交")
-            
             return True
             
         except Exception as e:
             logger.error(f"点击验证码格子时发生错误: {e}", exc_info=True)
             return False
     
+    def _match_positions(self, recognition_result: Dict) -> list:
+        """找出与参考图（第10个元素）属于同一类别的格子位置，没有参考图或没有匹配时返回空列表"""
+        target_name = recognition_result.get("10", "").strip()
+        if not target_name:
+            logger.error("未能从识别结果中获取参考图名称")
+            return []
+        
+        logger.info(f"目标物品: {target_name}")
+        self._reset_label_decisions()
+        
+        # 遍历前9个格子，找出匹配参考图的位置
+        positions = []
+        for position in range(1, 10):
+            item_name = recognition_result.get(str(position), "").strip()
+            logger.info(f"位置 {position}: {item_name}")
+            if self._labels_match(item_name, target_name):
+                logger.info(f"找到匹配项！位置 {position} - {item_name}")
+                positions.append(position)
+        
+        if not positions:
+            logger.warning(f"未找到匹配 '{target_name}' 的格子")
+        return positions
+    
+    def _stream_matches(self, labels: Dict, clicked: set) -> list:
+        """流式识别中已到达且匹配参考图、尚未点击的格子位置（参考图刚到达时包括之前已到达的格子）"""
+        target_name = labels.get("10")
+        if not target_name:
+            return []
+        positions = []
+        for position in range(1, 10):
+            if position in clicked:
+                continue
+            item_name = labels.get(str(position), "")
+            if self._labels_match(item_name, target_name):
+                logger.info(f"找到匹配项！位置 {position} - {item_name}")
+                positions.append(position)
+        return positions
+    
+    def _recognize_and_click_streaming(self, driver, img_url: str, image_bytes: Optional[bytes]):
+        """
+        流式识别并边生成边点击：参考图标签到达后，每个匹配的格子标签一到就立即点击
+        
+        返回 (识别结果, 是否已点击并提交)
+        """
+        grid_items = self._grid_items(driver)
+        if not grid_items:
+            return None, False
+        
+        prepared = self.image_pipeline.prepare(img_url, image_bytes)
+        usage_start = len(self.engine.usage)
+        start = time.time()
+        labels = {}
+        clicked = set()
+        self._reset_label_decisions()
+        
+        for key, label in self.engine.stream_sync(prepared.payload):
+            labels[key] = label
+            logger.info(f"位置 {key}: {label}")
+            for position in self._stream_matches(labels, clicked):
+                if self._click_tile(driver, grid_items, position):
+                    clicked.add(position)
+        
+        result = labels if labels.get("10") else None
+        self._record_image_stats(prepared, time.time() - start, self.engine.usage[usage_start:], result)
+        if not result:
+            logger.error("流式输出中没有参考图标签")
+            return None, False
+        logger.info(f"验证码识别结果: {result}")
+        if not clicked:
+            logger.warning(f"未找到匹配 '{result['10']}' 的格子")
+            return result, False
+        
+        logger.info(f"共点击了 {len(clicked)} 个匹配的格子")
+        self._click_and_commit(driver, [])
+        return result, True
+    
+    def _grid_items(self, driver) -> list:
+        """获取九宫格的前9个格子元素，数量不足时返回空列表"""
+        grid_items = driver.find_elements(By.CLASS_NAME, "geetest_item")
+        if len(grid_items) < 9:
+            logger.error(f"九宫格元素数量不足，只找到 {len(grid_items)} 个")
+            return []
+        # 排除最后一个（参考图），只处理前9个
+        return grid_items[:9]
+    
+    def _reset_label_decisions(self):
+        self._match_decisions = []
+        self._logged_pairs = set()
+    
+    def _labels_match(self, item_name: str, target_name: str) -> bool:
+        """格子标签是否与参考图标签属于同一类别（非精确的判断会记录依据）"""
+        matched, reason = self.labels.match(item_name, target_name)
+        if reason not in ("exact", "none") and (item_name, target_name) not in self._logged_pairs:
+            self._logged_pairs.add((item_name, target_name))
+            self.metrics.incr(f"label_match:{reason}")
+            logger.info(f"标签归一化: '{item_name}' 与 '{target_name}' {'视为同类' if matched else '不视为同类'}（{reason}）")
+        if matched:
+            self._match_decisions.append((item_name, target_name, reason))
+        return matched
+    
+    def _click_tile(self, driver, grid_items: list, position: int) -> bool:
+        """点击指定位置的格子"""
+        try:
+            # 使用 JavaScript 点击，更稳定
+            driver.execute_script("arguments[0].click();", grid_items[position - 1])
+            logger.info(f"已点击位置 {position}")
+            # 点击后短暂等待，模拟人类操作
+            self.waits.jitter("between_tiles")
+            return True
+        except Exception as e:
+            logger.error(f"点击位置 {position} 时出错: {e}")
+            return False
+    
+    def _click_and_commit(self, driver, positions: list, commit_timeout: float = 3.0) -> int:
+        """
+        在一次页面内脚本中点击给定位置的格子并提交，返回成功点击的格子数
+        
+        格子之间的间隔按节奏配置预先生成；确认按钮的激活由页面内的 MutationObserver 等待，
+        没有轮询延迟。每一步的耗时记入 last_click_steps 与等待统计。脚本不可用时退回逐个点击。
+        """
+        delays = self.waits.schedule("between_tiles", len(positions))
+        try:
+            report = driver.execute_async_script(
+                CLICK_SCRIPT, positions, [round(d * 1000) for d in delays], round(commit_timeout * 1000)
+            )
+        except Exception as e:
+            logger.warning(f"页面内点击脚本失败，改为逐个点击: {e}")
+            return self._click_and_commit_fallback(driver, positions)
+        
+        report = report or {}
+        steps = report.get("steps", [])
+        self.last_click_steps = steps
+        if report.get("error") == "grid":
+            logger.error(f"九宫格元素数量不足，只找到 {report.get('found', 0)} 个")
+            return 0
+        
+        for step in steps:
+            if step["step"] == "click":
+                logger.info(f"已点击位置 {step['position']}（{step['t']}ms）")
+            elif step["step"] == "click_error":
+                logger.error(f"点击位置 {step['position']} 时出错: {step.get('error')}")
+        times = {step["step"]: step["t"] for step in steps}
+        if "commit" in times:
+            # 点击序列（含格子间隔）结束于开始等待确认按钮或直接提交的时刻
+            clicks_done = times.get("wait_commit", times["commit"])
+            self.waits.record("tile_clicks", clicks_done / 1000)
+            self.waits.record("commit_enabled", (times["commit"] - clicks_done) / 1000)
+            if report.get("state") == "forced":
+                logger.warning("确认按钮未激活，但仍尝试点击")
+            logger.info(f"已点击确认按钮（点击 {clicks_done}ms，提交 {times['commit']}ms）")
+        else:
+            logger.info("未找到确认按钮，可能自动提交")
+        return report.get("clicked", 0)
+    
+    def _click_and_commit_fallback(self, driver, positions: list) -> int:
+        """逐个点击格子后等待确认按钮激活并提交"""
+        clicked_count = 0
+        if positions:
+            grid_items = self._grid_items(driver)
+            if not grid_items:
+                return 0
+            for position in positions:
+                if self._click_tile(driver, grid_items, position):
+                    clicked_count += 1
+        if clicked_count or not positions:
+            self._commit_captcha(driver)
+        return clicked_count
+    
+    def _commit_captcha(self, driver):
+        """等待确认按钮变为可用状态（移除 geetest_disable 类）再点击"""
+        try:
+            confirm_button = self.waits.commit_enabled(driver, timeout=3)
+        except TimeoutException:
+            confirm_button = None
+            buttons = driver.find_elements(By.CLASS_NAME, "geetest_commit")
+            if buttons:
+                logger.warning("确认按钮未激活，但仍尝试点击")
+                confirm_button = buttons[0]
+        
+        if confirm_button:
+            logger.info("找到确认按钮，准备点击...")
+            driver.execute_script("arguments[0].click();", confirm_button)
+            logger.info("已点击确认按钮")
+        else:
+            logger.info("未找到确认按钮，可能自动提交")
+    
     def _refresh_captcha(self, driver) -> bool:
-        """刷新验证码"""
+        """刷新验证码（验证失败后 GeeTest 可能已自动换图，先短暂等待，未换图再点击刷新按钮）"""
         try:
+            previous = self._current_img_url(driver)
+            changed = lambda d: self._current_img_url(d) not in ("", previous)
+            try:
+                self.waits.until(driver, "captcha_auto_refresh", changed, timeout=1.5)
+                logger.info("验证码已自动刷新")
+                return True
+            except TimeoutException:
+                pass
+            
             logger.info("正在刷新验证码...")
             refresh_button = driver.find_element(By.CLASS_NAME, "geetest_refresh")
             driver.execute_script("arguments[0].click();", refresh_button)
             logger.info("已点击刷新按钮")
-            time.sleep(1.5)  # 等待新验证码加载
+            # 等待新验证码加载
+            self.waits.until(driver, "captcha_refresh", changed, timeout=5)
             return True
         except Exception as e:
             logger.error(f"刷新验证码失败: {e}")
             return False
     
+    def _reset_verification_capture(self, driver):
+        """清除之前的请求记录，只监听提交后的验证请求"""
+        try:
+            self.network.reset()
+        except Exception as e:
+            logger.debug(f"清除请求记录失败: {e}")
+    
+    def _parse_verification_response(self, response_body: str) -> Optional[str]:
+        """解析 JSONP 验证响应：geetest_xxx({"status": "success", ...})，返回 success/fail"""
+        logger.info(f"捕获到验证API响应: {response_body[:200]}")
+        json_match = re.search(r'geetest_\d+\((.*)\)', response_body)
+        if not json_match:
+            return None
+        
+        result_data = json.loads(json_match.group(1))
+        if result_data.get('status') != 'success':
+            return None
+        
+        result = result_data.get('data', {}).get('result', '')
+        if result == 'success':
+            logger.info("✓ API返回验证成功")
+            return "success"
+        if result == 'fail':
+            logger.warning("✗ API返回验证失败")
+            return "fail"
+        return None
+    
     def _wait_for_verification_result(self, driver, timeout: int = 10) -> str:
         """
         等待并检测验证结果（通过监听网络请求）
@@ -244,58 +792,31 @@ class CaptchaHandler:
             "closed": 验证码窗口已关闭
             "timeout": 超时
         """
-        try:
-            logger.info("监听验证结果...")
-            start_time = time.time()
-            
-            # 清除之前的请求记录，只监听新的请求
-            del driver.requests
-            
-            while time.time() - start_time < timeout:
-                # 检查网络请求
-                for request in driver.requests:
-                    if request.response and 'api.geevisit.com/ajax.php' in request.url:
-                        try:
-                            # 获取响应内容
-                            response_body = request.response.body.decode('utf-8')
-                            logger.info(f"捕获到验证API响应: {response_body[:200]}")
-                            
-                            # 解析 JSONP 响应：geetest_xxx({"status": "success", ...})
-                            json_match = re.search(r'geetest_\d+\((.*)\)', response_body)
-                            if json_match:
-                                json_str = json_match.group(1)
-                                result_data = json.loads(json_str)
-                                
-                                status = result_data.get('status')
-                                if status == 'success':
-                                    data = result_data.get('data', {})
-                                    result = data.get('result', '')
-                                    
-                                    if result == 'success':
-                                        logger.info("✓ API返回验证成功")
-                                        return "success"
-                                    elif result == 'fail':
-                                        logger.warning("✗ API返回验证失败")
-                                        return "fail"
-                            
-                        except Exception as e:
-                            logger.debug(f"解析响应时出错: {e}")
-                
-                # 同时检查验证码窗口是否关闭
+        def verification_settled(d):
+            # 检查网络请求
+            response = self.network.poll(VERIFY_URL_FILTER)
+            while response:
                 try:
-                    widget = driver.find_element(By.CLASS_NAME, "geetest_widget")
-                    if not widget.is_displayed():
-                        logger.info("验证码窗口已关闭")
-                        return "closed"
-                except:
-                    logger.info("验证码窗口未找到")
-                    return "closed"
-                
-                time.sleep(0.5)
+                    result = self._parse_verification_response(response.text())
+                    if result:
+                        return result
+                except Exception as e:
+                    logger.debug(f"解析响应时出错: {e}")
+                response = self.network.poll(VERIFY_URL_FILTER)
             
+            # 同时检查验证码窗口是否关闭
+            widgets = d.find_elements(By.CLASS_NAME, "geetest_widget")
+            if not widgets or not widgets[0].is_displayed():
+                logger.info("验证码窗口已关闭")
+                return "closed"
+            return False
+        
+        try:
+            logger.info("监听验证结果...")
+            return self.waits.until(driver, "verify_response", verification_settled, timeout)
+        except TimeoutException:
             logger.warning(f"验证结果等待超时 ({timeout}秒)")
             return "timeout"
-            
         except Exception as e:
             logger.error(f"等待验证结果时出错: {e}", exc_info=True)
-            return "timeout"
\ No newline at end of file
+            return "timeout"
@@ -0,0 +1,438 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from chrome_flags import LEAN_ARGS, find_headless_shell
+from config import USER_AGENT
+from network_observer import NetworkResponse
+from process_memory import process_tree_rss
+
+logger = logging.getLogger(__name__)
+
+# 未配置 CHROME_BINARY_PATH 时按顺序在 PATH 中查找
+CHROME_CANDIDATES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+
+class CdpError(Exception):
+    """CDP 命令返回错误或连接已断开"""
+
+
+class CdpConnection:
+    """
+    浏览器级 DevTools WebSocket 连接
+
+    所有页面以 flatten 模式挂在同一连接上，命令与事件通过 sessionId 区分；响应按 id 交给等待的协程，
+    事件按 (sessionId, method) 分发给注册的回调。
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self._next_id = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._listeners: Dict[tuple, List[Callable[[dict], None]]] = defaultdict(list)
+        self._reader = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def connect(cls, url: str) -> 'CdpConnection':
+        if websockets is None:
+            raise RuntimeError("DRIVER_BACKEND=cdp 需要安装 websockets")
+        ws = await websockets.connect(url, max_size=None, ping_interval=None)
+        return cls(ws)
+
+    async def send(self, method: str, params: Optional[Dict] = None,
+                   session_id: Optional[str] = None, timeout: float = 30.0) -> Dict:
+        """发送命令并等待结果"""
+        self._next_id += 1
+        message_id = self._next_id
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self.ws.send(json.dumps(message))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    def on(self, session_id: Optional[str], method: str, callback: Callable[[dict], None]):
+        """注册事件回调"""
+        self._listeners[(session_id, method)].append(callback)
+
+    def remove_session(self, session_id: str):
+        """移除某个页面的全部事件回调"""
+        for key in [key for key in self._listeners if key[0] == session_id]:
+            del self._listeners[key]
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.get(message['id'])
+                    if future and not future.done():
+                        if 'error' in message:
+                            future.set_exception(CdpError(message['error'].get('message', str(message['error']))))
+                        else:
+                            future.set_result(message.get('result', {}))
+                    continue
+                key = (message.get('sessionId'), message.get('method'))
+                for callback in list(self._listeners.get(key, ())):
+                    try:
+                        callback(message.get('params', {}))
+                    except Exception as e:
+                        logger.debug(f"处理 CDP 事件 {key[1]} 出错: {e}")
+        except Exception as e:
+            logger.debug(f"CDP 连接已关闭: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("CDP 连接已关闭"))
+
+    async def close(self):
+        self._reader.cancel()
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+
+class Selector(str):
+    """传给页面内脚本的元素参数：在页面中用 document.querySelector 解析"""
+
+
+def _js_argument(value: Any) -> str:
+    if isinstance(value, Selector):
+        return f"document.querySelector({json.dumps(str(value))})"
+    return json.dumps(value, ensure_ascii=False)
+
+
+class Page:
+    """浏览器上下文中的单个页面（flatten 会话），提供导航、脚本执行与网络响应捕获"""
+
+    def __init__(self, connection: CdpConnection, session_id: str, target_id: str):
+        self.connection = connection
+        self.session_id = session_id
+        self.target_id = target_id
+        self.url_filters: List[str] = []
+        self._pending: Dict[str, tuple] = {}
+        self._responses: List[NetworkResponse] = []
+        self._response_arrived = asyncio.Event()
+        self._body_tasks = set()
+        # 主框架当前文档的 loaderId 与已触发 DOMContentLoaded 的文档，导航等待按 loaderId 区分新旧文档
+        self._main_frame = target_id
+        self._loader_id: Optional[str] = None
+        self._dom_loaded = set()
+        self._lifecycle = asyncio.Event()
+
+    async def send(self, method: str, params: Optional[Dict] = None, timeout: float = 30.0) -> Dict:
+        return await self.connection.send(method, params, self.session_id, timeout)
+
+    async def setup(self, url_filters: List[str]):
+        """启用页面与网络事件，只读取匹配过滤规则的响应体"""
+        self.url_filters = list(url_filters)
+        self.connection.on(self.session_id, 'Network.responseReceived', self._on_response)
+        self.connection.on(self.session_id, 'Network.loadingFinished', self._on_finished)
+        self.connection.on(self.session_id, 'Network.loadingFailed', self._on_failed)
+        self.connection.on(self.session_id, 'Page.frameNavigated', self._on_frame_navigated)
+        self.connection.on(self.session_id, 'Page.lifecycleEvent', self._on_lifecycle)
+        await asyncio.gather(
+            self.send('Page.enable'),
+            self.send('Page.setLifecycleEventsEnabled', {'enabled': True}),
+            self.send('Network.enable'),
+            self.send('Network.setUserAgentOverride', {'userAgent': USER_AGENT, 'acceptLanguage': 'zh-CN,zh'}),
+        )
+
+    def _on_frame_navigated(self, params: dict):
+        frame = params.get('frame', {})
+        if not frame.get('parentId'):
+            self._main_frame = frame.get('id', self._main_frame)
+            self._loader_id = frame.get('loaderId')
+            self._lifecycle.set()
+
+    def _on_lifecycle(self, params: dict):
+        if params.get('frameId') != self._main_frame:
+            return
+        if params.get('name') == 'init':
+            self._loader_id = params.get('loaderId')
+        elif params.get('name') == 'DOMContentLoaded':
+            self._dom_loaded.add(params.get('loaderId'))
+        self._lifecycle.set()
+
+    async def _wait_lifecycle(self, ready: Callable[[], bool], timeout: float):
+        """等待主框架的导航事件使 ready() 成立，超时抛出 asyncio.TimeoutError"""
+        deadline = time.monotonic() + timeout
+        while not ready():
+            self._lifecycle.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError("等待页面导航超时")
+            try:
+                await asyncio.wait_for(self._lifecycle.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_response(self, params: dict):
+        response = params.get('response', {})
+        url = response.get('url', '')
+        if any(url_filter in url for url_filter in self.url_filters):
+            self._pending[params['requestId']] = (url, response.get('status', 0))
+
+    def _on_finished(self, params: dict):
+        pending = self._pending.pop(params.get('requestId'), None)
+        if pending:
+            task = asyncio.ensure_future(self._fetch_body(params['requestId'], *pending))
+            self._body_tasks.add(task)
+            task.add_done_callback(self._body_tasks.discard)
+
+    def _on_failed(self, params: dict):
+        self._pending.pop(params.get('requestId'), None)
+
+    async def _fetch_body(self, request_id: str, url: str, status: int):
+        try:
+            result = await self.send('Network.getResponseBody', {'requestId': request_id})
+            body = result.get('body', '')
+            data = base64.b64decode(body) if result.get('base64Encoded') else body.encode('utf-8')
+        except Exception as e:
+            logger.debug(f"读取响应体失败 ({url}): {e}")
+            data = b''
+        self._responses.append(NetworkResponse(url, status, data))
+        self._response_arrived.set()
+
+    def take_response(self, url_filter: str, accept: Optional[Callable[[NetworkResponse], bool]] = None
+                      ) -> Optional[NetworkResponse]:
+        """取出第一个匹配的响应（不阻塞）"""
+        for response in self._responses:
+            if url_filter in response.url and (accept is None or accept(response)):
+                self._responses.remove(response)
+                return response
+        return None
+
+    async def wait_response(self, url_filter: str, timeout: float,
+                            accept: Optional[Callable[[NetworkResponse], bool]] = None) -> Optional[NetworkResponse]:
+        """等待匹配的响应，超时返回 None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._response_arrived.clear()
+            response = self.take_response(url_filter, accept)
+            remaining = deadline - time.monotonic()
+            if response or remaining <= 0:
+                return response
+            try:
+                await asyncio.wait_for(self._response_arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def clear_responses(self):
+        """丢弃已捕获的响应，只关注之后的请求"""
+        self._responses.clear()
+
+    async def evaluate(self, expression: str, await_promise: bool = False, timeout: float = 30.0) -> Any:
+        """执行表达式并返回值（JSON 可序列化的部分）"""
+        result = await self.send('Runtime.evaluate', {
+            'expression': expression,
+            'returnByValue': True,
+            'awaitPromise': await_promise,
+        }, timeout=timeout)
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            raise CdpError(details.get('exception', {}).get('description') or details.get('text', '脚本执行出错'))
+        return result.get('result', {}).get('value')
+
+    async def run_async_script(self, script: str, *args: Any, timeout: float = 30.0) -> Any:
+        """
+        执行 Selenium execute_async_script 风格的脚本
+
+        脚本通过 arguments 读取参数，最后一个参数为完成回调；Selector 参数在页面中解析为元素。
+        """
+        arguments = ", ".join([_js_argument(arg) for arg in args] + ["done"])
+        expression = f"new Promise((done) => (function() {{{script}}}).apply(null, [{arguments}]))"
+        return await self.evaluate(expression, await_promise=True, timeout=timeout)
+
+    async def wait_for(self, expression: str, timeout: float, poll: float = 0.1) -> Any:
+        """轮询表达式直到返回真值，超时抛出 asyncio.TimeoutError"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                value = await self.evaluate(expression)
+            except CdpError:
+                value = None  # 导航过程中执行上下文可能暂时不可用
+            if value:
+                return value
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(expression)
+            await asyncio.sleep(poll)
+
+    async def goto(self, url: str, timeout: float = 30.0):
+        """导航并等待新文档触发 DOMContentLoaded（同文档内导航直接返回）"""
+        result = await self.send('Page.navigate', {'url': url}, timeout=timeout)
+        loader_id = result.get('loaderId')
+        if loader_id:
+            await self._wait_lifecycle(lambda: loader_id in self._dom_loaded, timeout)
+
+    async def reload(self, timeout: float = 30.0):
+        """重新加载并等待新文档（loaderId 与旧文档不同）触发 DOMContentLoaded"""
+        previous = self._loader_id
+        await self.send('Page.reload', {'ignoreCache': False}, timeout=timeout)
+        await self._wait_lifecycle(lambda: self._loader_id != previous and self._loader_id in self._dom_loaded, timeout)
+
+    async def dom_ready(self, timeout: float = 30.0):
+        """等待主框架当前文档触发 DOMContentLoaded（页面自行跳转后使用）"""
+        if self._loader_id is None:
+            await self.wait_for("['interactive', 'complete'].includes(document.readyState)", timeout)
+            return
+        await self._wait_lifecycle(lambda: self._loader_id in self._dom_loaded, timeout)
+
+    async def add_init_script(self, source: str) -> str:
+        result = await self.send('Page.addScriptToEvaluateOnNewDocument', {'source': source})
+        return result.get('identifier', '')
+
+    async def screenshot(self, path: str):
+        result = await self.send('Page.captureScreenshot', {'format': 'png'})
+        with open(path, 'wb') as f:
+            f.write(base64.b64decode(result.get('data', '')))
+
+
+class BrowserContext:
+    """独立的浏览器上下文（类似无痕窗口）：Cookie、存储与缓存与其他上下文隔离"""
+
+    def __init__(self, browser: 'Browser', context_id: str, page: Page):
+        self.browser = browser
+        self.context_id = context_id
+        self.page = page
+
+    async def set_cookies(self, cookies: List[Dict]):
+        if cookies:
+            await self.browser.connection.send('Storage.setCookies', {
+                'cookies': cookies, 'browserContextId': self.context_id
+            })
+
+    async def get_cookies(self) -> List[Dict]:
+        result = await self.browser.connection.send('Storage.getCookies', {'browserContextId': self.context_id})
+        return result.get('cookies', [])
+
+    async def close(self):
+        """关闭上下文及其页面，释放该账户的全部浏览器状态"""
+        self.browser.connection.remove_session(self.page.session_id)
+        try:
+            await self.browser.connection.send('Target.disposeBrowserContext', {'browserContextId': self.context_id})
+        except Exception as e:
+            logger.debug(f"关闭浏览器上下文失败: {e}")
+
+
+def _chrome_binary(config, headless: bool) -> Optional[str]:
+    if headless and config.browser_profile == "lean":
+        shell = find_headless_shell(config)
+        if shell:
+            return shell
+    if config.chrome_binary_path and os.path.exists(config.chrome_binary_path):
+        return config.chrome_binary_path
+    for name in CHROME_CANDIDATES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def chrome_command(config, binary: str, headless: bool, user_data_dir: str) -> List[str]:
+    """启动参数：与 Selenium 路径相同的精简配置，外加远程调试端口与临时用户目录"""
+    args = [binary, '--remote-debugging-port=0', f'--user-data-dir={user_data_dir}']
+    args += LEAN_ARGS if config.browser_profile == "lean" else ['--window-size=1280,800']
+    args += [
+        '--disable-blink-features=AutomationControlled',
+        '--no-proxy-server',
+        '--lang=zh-CN',
+        '--disable-gpu',
+        '--no-sandbox',
+        '--disable-dev-shm-usage',
+        f'--user-agent={USER_AGENT}',
+    ]
+    if headless:
+        args += ['--headless' if 'headless-shell' in os.path.basename(binary) else '--headless=new',
+                 '--disable-software-rasterizer']
+    args.append('about:blank')
+    return args
+
+
+class Browser:
+    """直接通过 CDP 控制的单个 Chrome 进程，不经过 chromedriver"""
+
+    def __init__(self, process: subprocess.Popen, connection: CdpConnection, user_data_dir: str):
+        self.process = process
+        self.connection = connection
+        self.user_data_dir = user_data_dir
+
+    @classmethod
+    async def launch(cls, config, headless: bool = True, timeout: float = 30.0) -> 'Browser':
+        binary = _chrome_binary(config, headless)
+        if not binary:
+            raise RuntimeError("未找到 Chrome，请设置 CHROME_BINARY_PATH")
+        user_data_dir = tempfile.mkdtemp(prefix="checkin-chrome-")
+        command = chrome_command(config, binary, headless, user_data_dir)
+        logger.info(f"启动共享浏览器: {binary}")
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Chrome 启动后把实际监听的端口与浏览器 WebSocket 路径写入 DevToolsActivePort
+        port_file = os.path.join(user_data_dir, 'DevToolsActivePort')
+        deadline = time.monotonic() + timeout
+        lines = []
+        while len(lines) < 2:
+            if process.poll() is not None:
+                shutil.rmtree(user_data_dir, ignore_errors=True)
+                raise RuntimeError(f"Chrome 启动失败（退出码 {process.returncode}）")
+            if time.monotonic() >= deadline:
+                process.kill()
+                shutil.rmtree(user_data_dir, ignore_errors=True)
+                raise RuntimeError("等待 Chrome 调试端口超时")
+            await asyncio.sleep(0.05)
+            try:
+                with open(port_file, encoding='utf-8') as f:
+                    lines = f.read().split()
+            except OSError:
+                lines = []
+
+        connection = await CdpConnection.connect(f"ws://127.0.0.1:{lines[0]}{lines[1]}")
+        return cls(process, connection, user_data_dir)
+
+    async def new_context(self, url_filters: List[str]) -> BrowserContext:
+        """新建隔离的浏览器上下文并在其中打开一个页面"""
+        result = await self.connection.send('Target.createBrowserContext', {'disposeOnDetach': True})
+        context_id = result['browserContextId']
+        target = await self.connection.send('Target.createTarget', {
+            'url': 'about:blank', 'browserContextId': context_id
+        })
+        attached = await self.connection.send('Target.attachToTarget', {
+            'targetId': target['targetId'], 'flatten': True
+        })
+        page = Page(self.connection, attached['sessionId'], target['targetId'])
+        await page.setup(url_filters)
+        return BrowserContext(self, context_id, page)
+
+    def rss(self) -> int:
+        """Chrome 进程树的内存占用（字节）"""
+        return process_tree_rss(self.process.pid)
+
+    async def close(self):
+        try:
+            await self.connection.send('Browser.close', timeout=5)
+        except Exception:
+            pass
+        await self.connection.close()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.process.wait, 5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# SakuraFrp 按北京时间零点重置签到
+CHECKIN_TIMEZONE = timezone(timedelta(hours=8))
+# 视为“今日已完成”的结果
+DONE_OUTCOMES = ("success", "already_signed")
+
+
+def checkin_date(timestamp: Optional[float] = None) -> str:
+    """签到日期（北京时间）"""
+    return datetime.fromtimestamp(timestamp or time.time(), CHECKIN_TIMEZONE).strftime('%Y-%m-%d')
+
+
+class CheckInLedger:
+    """按账户与日期记录签到结果，今日已完成的账户重复运行时直接跳过"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkin_ledger ("
+            " account TEXT NOT NULL,"
+            " date TEXT NOT NULL,"
+            " outcome TEXT NOT NULL,"
+            " runs INTEGER NOT NULL DEFAULT 1,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " timings TEXT,"
+            " captcha TEXT,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (account, date))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _account_key(account: str) -> str:
+        """账户键使用哈希，避免在本地文件中保存用户名"""
+        return hashlib.sha256(account.encode('utf-8')).hexdigest()[:16]
+
+    def get(self, account: str, date: Optional[str] = None) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT outcome, runs, attempts, timings, captcha, updated FROM checkin_ledger"
+            " WHERE account = ? AND date = ?",
+            (self._account_key(account), date or checkin_date())
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'outcome': row[0],
+            'runs': row[1],
+            'attempts': row[2],
+            'timings': json.loads(row[3]) if row[3] else {},
+            'captcha': json.loads(row[4]) if row[4] else None,
+            'updated': row[5],
+        }
+
+    def done_today(self, account: str) -> bool:
+        """今日是否已签到成功"""
+        entry = self.get(account)
+        return bool(entry) and entry['outcome'] in DONE_OUTCOMES
+
+    def record(self, account: str, outcome: str, attempts: int = 0,
+               timings: Optional[Dict] = None, captcha: Optional[Dict] = None):
+        """记录一次运行结果；同一天多次运行时累计次数，已成功的记录不会被后续失败覆盖"""
+        key = self._account_key(account)
+        date = checkin_date()
+        previous = self.get(account, date)
+        if previous and previous['outcome'] in DONE_OUTCOMES and outcome not in DONE_OUTCOMES:
+            logger.info("今日已有成功记录，保留原结果")
+            return
+
+        runs = (previous['runs'] + 1) if previous else 1
+        attempts += previous['attempts'] if previous else 0
+        self.conn.execute(
+            "INSERT OR REPLACE INTO checkin_ledger"
+            " (account, date, outcome, runs, attempts, timings, captcha, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, date, outcome, runs, attempts,
+             json.dumps(timings or {}, ensure_ascii=False),
+             json.dumps(captcha, ensure_ascii=False) if captcha else None,
+             time.time())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def record_run(config, metrics, captcha: Optional[Dict] = None):
+    """把一次运行的结果、尝试次数、阶段耗时与验证码结果写入签到台账（失败只记录警告）"""
+    try:
+        ledger = CheckInLedger(config.ledger_path)
+        try:
+            ledger.record(
+                config.sakurafrp_user,
+                metrics.outcome,
+                attempts=metrics.counters.get("checkin_attempts", 0),
+                timings=metrics.stage_totals(),
+                captcha=captcha
+            )
+        finally:
+            ledger.close()
+    except Exception as e:
+        logger.warning(f"写入签到台账失败: {e}")
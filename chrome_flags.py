@@ -0,0 +1,49 @@
+import logging
+import os
+import shutil
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 精简配置：关闭后台服务与扩展，限制缓存与渲染进程数，降低单个浏览器的内存占用
+LEAN_ARGS = [
+    '--window-size=800,600',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--disable-breakpad',
+    '--disable-client-side-phishing-detection',
+    '--disable-domain-reliability',
+    '--disable-hang-monitor',
+    '--disable-renderer-backgrounding',
+    '--disable-background-timer-throttling',
+    '--disable-features=Translate,OptimizationHints,MediaRouter,InterestFeedContentSuggestions,CalculateNativeWinOcclusion,IsolateOrigins',
+    # 不按站点拆分渲染进程（site-per-process 是命令行开关，不是 feature 名，放在 --disable-features 中无效）
+    '--disable-site-isolation-trials',
+    '--metrics-recording-only',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--mute-audio',
+    '--password-store=basic',
+    '--renderer-process-limit=2',
+    '--disk-cache-size=33554432',
+    '--media-cache-size=1048576',
+    '--js-flags=--max-old-space-size=256',
+]
+
+
+def find_headless_shell(config) -> Optional[str]:
+    """查找 chrome-headless-shell（配置的路径或 PATH 中），找不到时返回 None"""
+    path = config.headless_shell_path
+    if path:
+        if os.path.exists(path):
+            return path
+        logger.warning(f"CHROME_HEADLESS_SHELL_PATH 不存在: {path}")
+        return None
+    # 显式指定了 Chrome 路径时不自动替换
+    if config.chrome_binary_path:
+        return None
+    return shutil.which("chrome-headless-shell")
@@ -1,7 +1,10 @@
+import json
 import logging
 import os
-from typing import Optional
-from dataclasses import dataclass
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field, replace
+
+from run_log import setup_logging
 
 # 尝试加载 .env 文件
 try:
@@ -10,17 +13,19 @@ try:
 except ImportError:
     pass
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('checkin.log', encoding='utf-8')
-    ]
-)
+# 配置日志（控制台文本 + 轮转的 JSON lines 文件）
+setup_logging()
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+@dataclass
+class Account:
+    """单个签到账户"""
+    user: str
+    password: str
+
 
 @dataclass
 class Config:
@@ -31,7 +36,66 @@ class Config:
     api_key: str
     model: str
     chrome_binary_path: Optional[str] = None
+    browser_profile: str = "lean"
+    headless_shell_path: Optional[str] = None
+    memory_budget_mb: int = 0
+    browser_rss_estimate_mb: int = 400
     max_retries: int = 10
+    accounts_file: Optional[str] = None
+    max_workers: int = 1
+    driver_backend: str = "selenium"  # selenium 或 cdp（共享浏览器的协程引擎）
+    cdp_max_contexts: int = 4
+    session_dir: str = "sessions"
+    session_max_age_days: int = 7
+    captcha_cache_path: str = "captcha_cache.sqlite3"
+    captcha_cache_size: int = 2000
+    tile_index_path: str = "tile_index.sqlite3"
+    tile_index_threshold: float = 0.92
+    model_endpoints: List[Dict] = field(default_factory=list)
+    recognition_mode: str = "single"
+    recognition_timeout: float = 30.0
+    hedge_delay: float = 8.0
+    hedge_percentile: float = 0.9
+    recognition_votes: int = 3
+    recognition_stream: bool = False
+    timing_profile: str = "human"
+    captcha_widget_retries: int = 3
+    captcha_pipeline: bool = True
+    network_backend: str = "cdp"
+    page_load_strategy: str = "eager"
+    request_blocking: bool = True
+    block_urls: Optional[List[str]] = None
+    block_resource_types: Optional[List[str]] = None
+    block_resource_hosts: Optional[List[str]] = None
+    allow_urls: Optional[List[str]] = None
+    login_url: str = "https://www.natfrp.com/user/"
+    status_url: Optional[str] = None
+    http_probe: bool = True
+    http_timeout: float = 10.0
+    image_mode: str = "inline"
+    image_max_side: int = 512
+    image_format: str = "jpeg"
+    image_quality: int = 80
+    image_crop: bool = True
+    metrics_json_path: Optional[str] = "run_summary.json"
+    metrics_textfile: Optional[str] = "checkin_metrics.prom"
+    ledger_path: Optional[str] = "checkin_ledger.sqlite3"
+    router_state_path: Optional[str] = "model_router.sqlite3"
+    router_breaker_errors: int = 3
+    router_breaker_cooldown: float = 300.0
+    label_synonyms_path: Optional[str] = "label_synonyms.sqlite3"
+    label_similarity: float = 0.67
+    label_embedding_model: Optional[str] = None
+    label_embedding_threshold: float = 0.85
+    retry_max_seconds: float = 300.0
+    retry_max_model_requests: int = 20
+    retry_max_tokens: int = 0
+    daemon_time: str = "08:00"
+    daemon_jitter_minutes: int = 30
+    daemon_retry_minutes: int = 30
+    daemon_port: int = 8765
+    daemon_recycle_runs: int = 20
+    daemon_max_rss_mb: int = 1024
     
     @classmethod
     def from_env(cls) -> 'Config':
@@ -42,12 +106,172 @@ class Config:
                 raise ValueError(f"环境变量 {key} 未设置或为空")
             return value
         
+        def get_json_list(key: str) -> List[Dict]:
+            value = os.environ.get(key, "").strip()
+            if not value:
+                return []
+            try:
+                entries = json.loads(value)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"环境变量 {key} 不是有效的 JSON: {e}")
+            if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+                raise ValueError(f"环境变量 {key} 必须是对象数组")
+            return entries
+        
+        def get_list(key: str) -> Optional[List[str]]:
+            # 未设置时返回 None 使用默认规则，设置为空白（如 "-"）时为空列表
+            value = os.environ.get(key)
+            if value is None:
+                return None
+            return [item.strip() for item in value.split(',') if item.strip() and item.strip() != '-']
+        
+        def get_path(key: str, default: str) -> Optional[str]:
+            # 设置为 "-" 时关闭对应的输出
+            value = get_env(key, required=False) or default
+            return None if value == '-' else value
+        
+        recognition_mode = get_env("RECOGNITION_MODE", required=False) or "single"
+        if recognition_mode not in ("single", "hedge", "race", "vote"):
+            raise ValueError(f"RECOGNITION_MODE 不支持: {recognition_mode}")
+        
+        timing_profile = get_env("TIMING_PROFILE", required=False) or "human"
+        if timing_profile not in ("human", "fast"):
+            raise ValueError(f"TIMING_PROFILE 不支持: {timing_profile}")
+        
+        network_backend = get_env("NETWORK_BACKEND", required=False) or "cdp"
+        if network_backend not in ("cdp", "wire"):
+            raise ValueError(f"NETWORK_BACKEND 不支持: {network_backend}")
+        
+        page_load_strategy = get_env("PAGE_LOAD_STRATEGY", required=False) or "eager"
+        if page_load_strategy not in ("normal", "eager", "none"):
+            raise ValueError(f"PAGE_LOAD_STRATEGY 不支持: {page_load_strategy}")
+        
+        image_mode = get_env("IMAGE_MODE", required=False) or "inline"
+        if image_mode not in ("inline", "url"):
+            raise ValueError(f"IMAGE_MODE 不支持: {image_mode}")
+        image_format = (get_env("IMAGE_FORMAT", required=False) or "jpeg").lower()
+        if image_format not in ("jpeg", "webp", "png"):
+            raise ValueError(f"IMAGE_FORMAT 不支持: {image_format}")
+        
+        browser_profile = get_env("BROWSER_PROFILE", required=False) or "lean"
+        if browser_profile not in ("lean", "full"):
+            raise ValueError(f"BROWSER_PROFILE 不支持: {browser_profile}")
+        
+        driver_backend = get_env("DRIVER_BACKEND", required=False) or "selenium"
+        if driver_backend not in ("selenium", "cdp"):
+            raise ValueError(f"DRIVER_BACKEND 不支持: {driver_backend}")
+        
+        daemon_time = get_env("DAEMON_TIME", required=False) or "08:00"
+        try:
+            hour, minute = (int(part) for part in daemon_time.split(':'))
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"DAEMON_TIME 格式应为 HH:MM: {daemon_time}")
+        
+        # 提供账户文件时，单账户环境变量变为可选
+        accounts_file = get_env("ACCOUNTS_FILE", required=False)
+        
         return cls(
-            sakurafrp_user=get_env("SAKURAFRP_USER"),
-            sakurafrp_pass=get_env("SAKURAFRP_PASS"),
+            sakurafrp_user=get_env("SAKURAFRP_USER", required=not accounts_file),
+            sakurafrp_pass=get_env("SAKURAFRP_PASS", required=not accounts_file),
             base_url=get_env("BASE_URL"),
             api_key=get_env("API_KEY"),
             model=get_env("MODEL"),
             chrome_binary_path=get_env("CHROME_BINARY_PATH", required=False),
-            max_retries=int(get_env("MAX_RETRIES", required=False) or 10)
-        )
\ No newline at end of file
+            browser_profile=browser_profile,
+            headless_shell_path=get_env("CHROME_HEADLESS_SHELL_PATH", required=False) or None,
+            memory_budget_mb=int(get_env("MEMORY_BUDGET_MB", required=False) or 0),
+            browser_rss_estimate_mb=int(get_env("BROWSER_RSS_ESTIMATE_MB", required=False) or 400),
+            max_retries=int(get_env("MAX_RETRIES", required=False) or 10),
+            accounts_file=accounts_file or None,
+            max_workers=int(get_env("MAX_WORKERS", required=False) or 1),
+            driver_backend=driver_backend,
+            cdp_max_contexts=int(get_env("CDP_MAX_CONTEXTS", required=False) or 4),
+            session_dir=get_env("SESSION_DIR", required=False) or "sessions",
+            session_max_age_days=int(get_env("SESSION_MAX_AGE_DAYS", required=False) or 7),
+            captcha_cache_path=get_env("CAPTCHA_CACHE_PATH", required=False) or "captcha_cache.sqlite3",
+            captcha_cache_size=int(get_env("CAPTCHA_CACHE_SIZE", required=False) or 2000),
+            tile_index_path=get_env("TILE_INDEX_PATH", required=False) or "tile_index.sqlite3",
+            tile_index_threshold=float(get_env("TILE_INDEX_THRESHOLD", required=False) or 0.92),
+            model_endpoints=get_json_list("MODEL_ENDPOINTS"),
+            recognition_mode=recognition_mode,
+            recognition_timeout=float(get_env("RECOGNITION_TIMEOUT", required=False) or 30),
+            hedge_delay=float(get_env("HEDGE_DELAY", required=False) or 8),
+            hedge_percentile=float(get_env("HEDGE_PERCENTILE", required=False) or 0.9),
+            recognition_votes=int(get_env("RECOGNITION_VOTES", required=False) or 3),
+            recognition_stream=(get_env("RECOGNITION_STREAM", required=False) or "false").lower() == "true",
+            timing_profile=timing_profile,
+            captcha_widget_retries=int(get_env("CAPTCHA_WIDGET_RETRIES", required=False) or 3),
+            captcha_pipeline=(get_env("CAPTCHA_PIPELINE", required=False) or "true").lower() == "true",
+            network_backend=network_backend,
+            page_load_strategy=page_load_strategy,
+            request_blocking=(get_env("REQUEST_BLOCKING", required=False) or "true").lower() == "true",
+            block_urls=get_list("BLOCK_URLS"),
+            block_resource_types=get_list("BLOCK_RESOURCE_TYPES"),
+            block_resource_hosts=get_list("BLOCK_RESOURCE_HOSTS"),
+            allow_urls=get_list("ALLOW_URLS"),
+            login_url=get_env("LOGIN_URL", required=False) or "https://www.natfrp.com/user/",
+            status_url=get_env("CHECKIN_STATUS_URL", required=False) or None,
+            http_probe=(get_env("HTTP_PROBE", required=False) or "true").lower() == "true",
+            http_timeout=float(get_env("HTTP_TIMEOUT", required=False) or 10),
+            image_mode=image_mode,
+            image_max_side=int(get_env("IMAGE_MAX_SIDE", required=False) or 512),
+            image_format=image_format,
+            image_quality=int(get_env("IMAGE_QUALITY", required=False) or 80),
+            image_crop=(get_env("IMAGE_CROP", required=False) or "true").lower() == "true",
+            metrics_json_path=get_path("METRICS_JSON", "run_summary.json"),
+            metrics_textfile=get_path("METRICS_TEXTFILE", "checkin_metrics.prom"),
+            ledger_path=get_path("LEDGER_PATH", "checkin_ledger.sqlite3"),
+            router_state_path=get_path("ROUTER_STATE_PATH", "model_router.sqlite3"),
+            router_breaker_errors=int(get_env("ROUTER_BREAKER_ERRORS", required=False) or 3),
+            router_breaker_cooldown=float(get_env("ROUTER_BREAKER_COOLDOWN", required=False) or 300),
+            label_synonyms_path=get_path("LABEL_SYNONYMS_PATH", "label_synonyms.sqlite3"),
+            label_similarity=float(get_env("LABEL_SIMILARITY", required=False) or 0.67),
+            label_embedding_model=get_env("LABEL_EMBEDDING_MODEL", required=False) or None,
+            label_embedding_threshold=float(get_env("LABEL_EMBEDDING_THRESHOLD", required=False) or 0.85),
+            retry_max_seconds=float(get_env("RETRY_MAX_SECONDS", required=False) or 300),
+            retry_max_model_requests=int(get_env("RETRY_MAX_MODEL_REQUESTS", required=False) or 20),
+            retry_max_tokens=int(get_env("RETRY_MAX_TOKENS", required=False) or 0),
+            daemon_time=daemon_time,
+            daemon_jitter_minutes=int(get_env("DAEMON_JITTER_MINUTES", required=False) or 30),
+            daemon_retry_minutes=int(get_env("DAEMON_RETRY_MINUTES", required=False) or 30),
+            daemon_port=int(get_env("DAEMON_PORT", required=False) or 8765),
+            daemon_recycle_runs=int(get_env("DAEMON_RECYCLE_RUNS", required=False) or 20),
+            daemon_max_rss_mb=int(get_env("DAEMON_MAX_RSS_MB", required=False) or 1024)
+        )
+    
+    def load_accounts(self) -> List[Account]:
+        """
+        加载账户列表
+        
+        账户文件为 JSON 数组：[{"user": "用户名", "pass": "密码"}, ...]
+        未配置账户文件时，使用 SAKURAFRP_USER/SAKURAFRP_PASS 单账户
+        """
+        if not self.accounts_file:
+            return [Account(self.sakurafrp_user, self.sakurafrp_pass)]
+        
+        if not os.path.exists(self.accounts_file):
+            raise ValueError(f"账户文件 {self.accounts_file} 不存在")
+        
+        with open(self.accounts_file, 'r', encoding='utf-8') as f:
+            try:
+                entries = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"账户文件 {self.accounts_file} 不是有效的 JSON: {e}")
+        
+        accounts = []
+        for index, entry in enumerate(entries, start=1):
+            user = str(entry.get("user", "")).strip()
+            password = str(entry.get("pass", "")).strip()
+            if not user or not password:
+                raise ValueError(f"账户文件第 {index} 项缺少 user 或 pass")
+            accounts.append(Account(user, password))
+        
+        if not accounts:
+            raise ValueError(f"账户文件 {self.accounts_file} 中没有账户")
+        return accounts
+    
+    def for_account(self, account: Account) -> 'Config':
+        """生成指定账户的配置副本"""
+        return replace(self, sakurafrp_user=account.user, sakurafrp_pass=account.password)
\ No newline at end of file
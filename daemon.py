@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import queue
+import random
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from checkin_ledger import CHECKIN_TIMEZONE, CheckInLedger
+from config import Account, Config
+from metrics import export_run_metrics
+from process_memory import driver_rss
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AccountSchedule:
+    """单个账户的调度状态"""
+    account: Account
+    next_run: float
+    last_run: Optional[float] = None
+    last_outcome: Optional[str] = None
+    last_duration: Optional[float] = None
+    runs: int = 0
+
+
+class _ControlHandler(BaseHTTPRequestHandler):
+    """本地控制接口：GET /status 查看状态，POST /run?account=用户名 立即签到（省略则全部账户）"""
+    daemon: 'CheckInDaemon' = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/status':
+            self._send_json(200, self.daemon.status())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/run':
+            self._send_json(404, {'error': 'not found'})
+            return
+        user = parse_qs(url.query).get('account', [None])[0]
+        queued = self.daemon.run_now(user)
+        if not queued:
+            self._send_json(404, {'error': f'未找到账户 {user}'})
+        else:
+            self._send_json(202, {'queued': queued})
+
+
+class CheckInDaemon:
+    """
+    常驻签到服务
+
+    保持一个已启动的浏览器与识别引擎，按账户在每天的 DAEMON_TIME 附近（加随机抖动）依次签到；
+    浏览器执行 DAEMON_RECYCLE_RUNS 次或进程树内存超过 DAEMON_MAX_RSS_MB 后重启。
+    浏览器在服务启动时与每次重启后立即预热，签到时不再等待冷启动。
+    """
+
+    def __init__(self, config: Config, accounts: List[Account]):
+        self.config = config
+        self.ledger = CheckInLedger(config.ledger_path) if config.ledger_path else None
+        self.schedules = [
+            AccountSchedule(account, self._first_run(index, account))
+            for index, account in enumerate(accounts)
+        ]
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.driver_manager = None
+        self.captcha_handler = None
+        self.current: Optional[str] = None
+        self.browser_starts = 0
+        self.latest_metrics: Dict[str, Dict] = {}
+        self.server = None
+
+    def _slot(self, day: datetime) -> float:
+        """指定日期的签到时间（北京时间，与签到台账的日期一致，加随机抖动）"""
+        hour, minute = (int(part) for part in self.config.daemon_time.split(':'))
+        slot = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        jitter = random.uniform(0, self.config.daemon_jitter_minutes * 60)
+        return slot.timestamp() + jitter
+
+    def _first_run(self, index: int, account: Account) -> float:
+        """启动时今天的签到时间已过则尽快执行（台账显示今日已签到时等到明天），账户之间错开几秒"""
+        slot = self._slot(datetime.now(CHECKIN_TIMEZONE))
+        if slot > time.time():
+            return slot
+        if self.ledger and self.ledger.done_today(account.user):
+            return self._slot(datetime.now(CHECKIN_TIMEZONE) + timedelta(days=1))
+        return time.time() + index * 5
+
+    def _reschedule(self, schedule: AccountSchedule, success: bool):
+        now = datetime.now(CHECKIN_TIMEZONE)
+        if success:
+            schedule.next_run = self._slot(now + timedelta(days=1))
+            return
+        retry = time.time() + self.config.daemon_retry_minutes * 60
+        tomorrow = self._slot(now + timedelta(days=1))
+        # 失败时当天稍后重试，重试时间跨过零点则等到第二天的正常时间
+        if datetime.fromtimestamp(retry, CHECKIN_TIMEZONE).date() == now.date():
+            schedule.next_run = min(retry, tomorrow)
+        else:
+            schedule.next_run = tomorrow
+
+    def run_now(self, user: Optional[str] = None) -> List[str]:
+        """把账户加入立即执行队列，返回加入的账户"""
+        queued = []
+        for index, schedule in enumerate(self.schedules):
+            if user is None or schedule.account.user == user:
+                self.pending.put(index)
+                queued.append(schedule.account.user)
+        return queued
+
+    def status(self) -> Dict:
+        with self.lock:
+            driver = self.driver_manager.driver if self.driver_manager else None
+            return {
+                'running': self.current,
+                'browser': {
+                    'started': driver is not None,
+                    'runs': self.driver_manager.runs if self.driver_manager else 0,
+                    'starts': self.browser_starts,
+                    'rss_mb': round(driver_rss(driver) / 1024 / 1024, 1) if driver else 0,
+                },
+                'accounts': [
+                    {
+                        'user': s.account.user,
+                        'next_run': datetime.fromtimestamp(s.next_run, CHECKIN_TIMEZONE).isoformat(timespec='seconds'),
+                        'last_run': datetime.fromtimestamp(s.last_run, CHECKIN_TIMEZONE).isoformat(timespec='seconds') if s.last_run else None,
+                        'last_outcome': s.last_outcome,
+                        'last_duration': s.last_duration,
+                        'runs': s.runs,
+                    }
+                    for s in self.schedules
+                ],
+            }
+
+    def _start_control_server(self):
+        handler = type('BoundControlHandler', (_ControlHandler,), {'daemon': self})
+        try:
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.config.daemon_port), handler)
+        except OSError as e:
+            logger.warning(f"控制接口启动失败（端口 {self.config.daemon_port}）: {e}")
+            return
+        threading.Thread(target=self.server.serve_forever, name="daemon-control", daemon=True).start()
+        logger.info(f"控制接口: http://127.0.0.1:{self.config.daemon_port}/status，POST /run 立即签到")
+
+    def _next_due(self) -> Optional[int]:
+        """到期的账户索引（取最早到期的一个）"""
+        now = time.time()
+        due = [(s.next_run, index) for index, s in enumerate(self.schedules) if s.next_run <= now]
+        return min(due)[1] if due else None
+
+    def run(self):
+        """阻塞运行，直到收到 SIGINT/SIGTERM"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+        self._start_control_server()
+        self._warm_up()
+        for s in self.schedules:
+            logger.info(f"账户 {s.account.user} 下次签到: {datetime.fromtimestamp(s.next_run, CHECKIN_TIMEZONE):%Y-%m-%d %H:%M:%S}")
+
+        try:
+            while not self.stopping.is_set():
+                index = self._next_due()
+                if index is None:
+                    wait = min(s.next_run for s in self.schedules) - time.time()
+                    try:
+                        index = self.pending.get(timeout=max(0.5, min(wait, 5)))
+                    except queue.Empty:
+                        continue
+                self._run_account(self.schedules[index])
+        except KeyboardInterrupt:
+            logger.info("收到中断信号")
+        finally:
+            self.shutdown()
+
+    def _warm_up(self):
+        """创建常驻组件并启动浏览器（不绑定账户），失败时留给下一次签到重新启动"""
+        headless = os.getenv('CI') == 'true' or os.getenv('HEADLESS', 'false').lower() == 'true'
+        start = time.time()
+        with self.lock:
+            self._ensure_components(self.config)
+            if self.driver_manager.driver is not None:
+                return
+            if self.driver_manager.initialize(headless=headless, prepare=False):
+                self.browser_starts += 1
+                logger.info(f"浏览器已预热，耗时 {time.time() - start:.1f}s")
+            else:
+                logger.warning("浏览器预热失败，签到时重新启动")
+
+    def _ensure_components(self, config: Config):
+        """创建常驻的浏览器管理器与验证码处理器（延迟导入 Selenium 与 OpenAI）"""
+        if self.driver_manager is None:
+            from webdriver_manager import WebDriverManager
+            self.driver_manager = WebDriverManager(config)
+        if self.captcha_handler is None:
+            from captcha_handler import CaptchaHandler
+            self.captcha_handler = CaptchaHandler(config)
+
+    def _run_account(self, schedule: AccountSchedule):
+        from automation import CheckInAutomation
+
+        user = schedule.account.user
+        config = self.config.for_account(schedule.account)
+        logger.info(f"开始签到账户 {user}")
+        start = time.time()
+        with self.lock:
+            self.current = user
+            self._ensure_components(config)
+            if self.driver_manager.driver is None:
+                self.browser_starts += 1
+
+        success = False
+        try:
+            automation = CheckInAutomation(config, self.driver_manager, self.captcha_handler)
+            success = automation.run()
+            self.latest_metrics[user] = automation.metrics.to_dict()
+            schedule.last_outcome = automation.metrics.outcome
+        except Exception as e:
+            logger.error(f"账户 {user} 执行失败: {e}", exc_info=True)
+            schedule.last_outcome = "error"
+        finally:
+            schedule.runs += 1
+            schedule.last_run = start
+            schedule.last_duration = round(time.time() - start, 1)
+            self._reschedule(schedule, success)
+            with self.lock:
+                self.current = None
+            logger.info(
+                f"账户 {user} 签到{'成功' if success else '失败'}，耗时 {schedule.last_duration}s，"
+                f"下次签到: {datetime.fromtimestamp(schedule.next_run, CHECKIN_TIMEZONE):%Y-%m-%d %H:%M:%S}"
+            )
+            export_run_metrics(list(self.latest_metrics.values()),
+                               self.config.metrics_json_path, self.config.metrics_textfile)
+            self._maybe_recycle()
+
+    def _maybe_recycle(self):
+        """浏览器运行次数或内存超过阈值时关闭并立即重新预热"""
+        manager = self.driver_manager
+        if not manager or not manager.driver:
+            return
+        rss_mb = driver_rss(manager.driver) / 1024 / 1024
+        reason = None
+        if manager.runs >= self.config.daemon_recycle_runs:
+            reason = f"已执行 {manager.runs} 次签到"
+        elif rss_mb > self.config.daemon_max_rss_mb:
+            reason = f"内存占用 {rss_mb:.0f}MB 超过 {self.config.daemon_max_rss_mb}MB"
+        if reason:
+            logger.info(f"重启浏览器：{reason}")
+            with self.lock:
+                manager.close()
+            self._warm_up()
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+        if self.driver_manager:
+            self.driver_manager.close()
+        logger.info("常驻服务已停止")
@@ -0,0 +1,218 @@
+import logging
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import USER_AGENT, Config
+
+logger = logging.getLogger(__name__)
+
+CHECKED_IN_TEXT = "今天已经签到过啦"
+CHECKIN_BUTTON_TEXT = "点击这里签到"
+# JSON 状态接口中可能表示“今日已签到”的字段
+SIGNED_KEYS = ("signed", "is_signed", "sign_today", "checked_in")
+
+
+class _LoginFormParser(HTMLParser):
+    """提取包含 username 输入框的登录表单（action 与所有 input 的默认值）"""
+
+    def __init__(self):
+        super().__init__()
+        self.action = None
+        self.fields = {}
+        self.found = False
+        self._in_form = False
+        self._form_action = None
+        self._form_fields = {}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form':
+            self._in_form = True
+            self._form_action = attrs.get('action') or ''
+            self._form_fields = {}
+        elif tag == 'input' and (self._in_form or not self.found):
+            name = attrs.get('name') or attrs.get('id')
+            if name:
+                self._form_fields[name] = attrs.get('value') or ''
+            if attrs.get('id') == 'username' or attrs.get('name') == 'username':
+                self.found = True
+
+    def handle_endtag(self, tag):
+        if tag == 'form' and self._in_form:
+            self._in_form = False
+            if self.found and self.action is None:
+                self.action = self._form_action
+                self.fields = self._form_fields
+
+    def form_fields(self) -> Dict[str, str]:
+        """登录表单字段（页面没有 form 元素时返回收集到的所有 input）"""
+        return self.fields or self._form_fields
+
+
+def _find_signed_flag(data) -> Optional[bool]:
+    """在 JSON 中递归查找签到状态字段"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in SIGNED_KEYS and isinstance(value, bool):
+                return value
+        for value in data.values():
+            found = _find_signed_flag(value)
+            if found is not None:
+                return found
+    elif isinstance(data, list):
+        for value in data:
+            found = _find_signed_flag(value)
+            if found is not None:
+                return found
+    return None
+
+
+class NatfrpHttpClient:
+    """不启动浏览器的 HTTP 客户端：复用连接池完成登录并查询今日签到状态"""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept-Language': 'zh-CN,zh;q=0.9',
+        })
+
+    def load_cookies(self, cookies: List[Dict]):
+        """载入浏览器格式（CDP）的 Cookie"""
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''),
+                path=cookie.get('path', '/'),
+                secure=cookie.get('secure', False)
+            )
+
+    def export_cookies(self) -> List[Dict]:
+        """导出为 Network.setCookies 可用的 Cookie 列表"""
+        cookies = []
+        for cookie in self.session.cookies:
+            cookies.append({
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path or '/',
+                'secure': bool(cookie.secure),
+                'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+                'expires': cookie.expires if cookie.expires else -1,
+            })
+        return cookies
+
+    def checkin_status(self) -> str:
+        """
+        查询今日签到状态
+
+        返回值:
+            "signed": 今日已签到
+            "unsigned": 今日未签到
+            "login_required": 未登录或会话已过期
+            "unknown": 无法判断（交给浏览器流程处理）
+        """
+        status_url = self.config.status_url or self.config.login_url
+        try:
+            response = self.session.get(status_url, timeout=self.config.http_timeout)
+        except requests.RequestException as e:
+            logger.warning(f"HTTP 查询签到状态失败: {e}")
+            return "unknown"
+
+        if response.status_code in (401, 403):
+            return "login_required"
+
+        if 'json' in response.headers.get('Content-Type', ''):
+            try:
+                signed = _find_signed_flag(response.json())
+            except ValueError:
+                signed = None
+            if signed is None:
+                return "unknown"
+            return "signed" if signed else "unsigned"
+
+        html = response.text
+        if CHECKED_IN_TEXT in html:
+            return "signed"
+        if CHECKIN_BUTTON_TEXT in html:
+            return "unsigned"
+        parser = _LoginFormParser()
+        parser.feed(html)
+        if parser.found:
+            return "login_required"
+        return "unknown"
+
+    def login(self) -> bool:
+        """提交登录表单，返回是否登录成功"""
+        try:
+            page = self.session.get(self.config.login_url, timeout=self.config.http_timeout)
+            parser = _LoginFormParser()
+            parser.feed(page.text)
+            if not parser.found:
+                logger.info("HTTP 登录页面中未找到登录表单")
+                return False
+
+            fields = dict(parser.form_fields())
+            fields['username'] = self.config.sakurafrp_user
+            fields['password'] = self.config.sakurafrp_pass
+            action = urljoin(page.url, parser.action or page.url)
+            response = self.session.post(action, data=fields, timeout=self.config.http_timeout)
+        except requests.RequestException as e:
+            logger.warning(f"HTTP 登录请求失败: {e}")
+            return False
+
+        # 登录后仍返回登录表单说明凭据错误或需要额外验证
+        result_parser = _LoginFormParser()
+        result_parser.feed(response.text)
+        if response.status_code >= 400 or result_parser.found:
+            logger.info(f"HTTP 登录未成功（状态码 {response.status_code}）")
+            return False
+
+        logger.info("HTTP 登录成功")
+        return True
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+def probe_checkin_status(config: Config, session_store) -> Tuple[str, Optional[List[Dict]]]:
+    """
+    通过 HTTP 查询签到状态（优先复用本地会话，过期时用 HTTP 登录）
+
+    返回 (状态, 可注入浏览器的 Cookie)，Cookie 仅在 HTTP 会话已登录时返回
+    """
+    client = NatfrpHttpClient(config)
+    try:
+        session = session_store.load(config.sakurafrp_user)
+        if session:
+            client.load_cookies(session.get('cookies', []))
+
+        status = client.checkin_status()
+        if status == "login_required":
+            if not client.login():
+                logger.info("HTTP 登录未成功，使用浏览器流程")
+                return status, None
+            status = client.checkin_status()
+
+        logger.info(f"HTTP 签到状态: {status}")
+        authenticated = status in ("signed", "unsigned")
+        return status, client.export_cookies() if authenticated else None
+    except Exception as e:
+        logger.warning(f"HTTP 查询失败，使用浏览器流程: {e}")
+        return "unknown", None
+    finally:
+        client.close()
@@ -1,18 +1,90 @@
+import logging
 import time
 import random
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# 在页面内按预先生成的节奏逐字输入：每个字符依次触发 keydown/keypress/input/keyup，
+# 通过原生 setter 写入 value，兼容框架托管的输入框。全部输入完成后回调，只需一次 WebDriver 往返。
+TYPE_SCRIPT = """
+const [element, text, delays, clear, done] = arguments;
+const proto = element instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+const setValue = Object.getOwnPropertyDescriptor(proto, 'value').set;
+element.focus();
+if (clear) {
+    setValue.call(element, '');
+    element.dispatchEvent(new Event('input', {bubbles: true}));
+}
+const chars = Array.from(text);
+let index = 0;
+function step() {
+    if (index >= chars.length) {
+        element.dispatchEvent(new Event('change', {bubbles: true}));
+        done(element.value.endsWith(text));
+        return;
+    }
+    const key = chars[index];
+    const init = {key: key, bubbles: true, cancelable: true};
+    element.dispatchEvent(new KeyboardEvent('keydown', init));
+    element.dispatchEvent(new KeyboardEvent('keypress', init));
+    setValue.call(element, element.value + key);
+    element.dispatchEvent(new InputEvent('input', {data: key, inputType: 'insertText', bubbles: true}));
+    element.dispatchEvent(new KeyboardEvent('keyup', init));
+    setTimeout(step, delays[index++]);
+}
+step();
+"""
 
 
 class HumanSimulator:
     """模拟人类行为"""
-    
+
+    @staticmethod
+    def key_schedule(text: str, min_delay: float = 0.05, max_delay: float = 0.2) -> List[float]:
+        """预先生成每个字符输入后的停顿（秒），分布与逐字输入时相同"""
+        return [random.uniform(min_delay, max_delay) for _ in text]
+
     @staticmethod
-    def type_text(element, text: str, min_delay: float = 0.05, max_delay: float = 0.2):
-        """模拟人类打字"""
-        for char in text:
+    def type_text(element, text: str, min_delay: float = 0.05, max_delay: float = 0.2, clear: bool = False):
+        """
+        模拟人类打字（max_delay 为 0 时一次性输入）
+
+        整段输入的按键节奏预先生成，交给页面内脚本按节奏逐字输入，与浏览器只有一次往返；
+        脚本不可用或输入结果不一致时退回逐字 send_keys。
+        """
+        if max_delay <= 0:
+            if clear:
+                element.clear()
+            element.send_keys(text)
+            return
+
+        schedule = HumanSimulator.key_schedule(text, min_delay, max_delay)
+        driver = getattr(element, 'parent', None)
+        if driver is not None and hasattr(driver, 'execute_async_script'):
+            try:
+                total = sum(schedule)
+                # 异步脚本默认 30 秒超时，长文本时放宽
+                if total > 25:
+                    driver.set_script_timeout(total + 10)
+                typed = driver.execute_async_script(
+                    TYPE_SCRIPT, element, text, [round(d * 1000) for d in schedule], clear
+                )
+                if typed is True:
+                    return
+                logger.warning("页面内输入结果与预期不一致，改为逐字输入")
+                clear = True
+            except Exception as e:
+                logger.warning(f"页面内批量输入失败，改为逐字输入: {e}")
+                clear = True
+
+        if clear:
+            element.clear()
+        for char, delay in zip(text, schedule):
             element.send_keys(char)
-            time.sleep(random.uniform(min_delay, max_delay))
-    
+            time.sleep(delay)
+
     @staticmethod
     def random_sleep(min_sec: float = 1.0, max_sec: float = 3.0):
         """随机等待"""
-        time.sleep(random.uniform(min_sec, max_sec))
\ No newline at end of file
+        time.sleep(random.uniform(min_sec, max_sec))
@@ -0,0 +1,222 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+# 标签中没有区分意义的修饰：数量词前缀（必须带数词，避免把“把手”“头盔”等名词的首字当作量词）与标点
+_PREFIX_PATTERN = re.compile(r'^(一|两|几|\d+)(个|只|辆|把|顶|朵|张|棵|架|艘|件|条|头|匹)')
+_PUNCT_PATTERN = re.compile(r'[\s"\'`“”‘’。，、,.!！?？:：;；()（）\[\]【】<>《》-]+')
+
+
+def normalize_label(label: str) -> str:
+    """统一全半角、大小写，去掉标点与量词前缀"""
+    text = unicodedata.normalize('NFKC', str(label or '')).strip().lower()
+    text = _PUNCT_PATTERN.sub('', text)
+    stripped = _PREFIX_PATTERN.sub('', text)
+    return stripped or text
+
+
+class LabelCanonicalizer:
+    """
+    标签归一化：把模型给出的近义标签映射到同一类别后再匹配
+
+    记为反例的配对直接判为不匹配，其余依次尝试：归一化后相等 → 从验证成功的结果中学到的同义词
+    → 字符级相似（包含关系或相似度）→ 可选的本地向量相似度。验证失败的非精确匹配会记为反例，之后不再使用。
+    """
+
+    def __init__(self, path: Optional[str] = None, similarity: float = 0.67,
+                 embedding_model: Optional[str] = None, embedding_threshold: float = 0.85):
+        self.path = path
+        self.similarity = similarity
+        self.embedding_model = embedding_model
+        self.embedding_threshold = embedding_threshold
+        self.lock = threading.Lock()
+        # 别名 -> {类别: 验证成功次数}
+        self.synonyms: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # "标签|标签"（按字典序）-> 验证失败次数
+        self.negatives: Dict[str, int] = {}
+        self._encoder = None
+        self._embeddings: Dict[str, object] = {}
+        self.conn = self._connect()
+        self._load()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """打开同义词库（未配置路径时只保存在内存中），打开失败时不持久化"""
+        try:
+            if self.path:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path or ":memory:", timeout=10, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS label_synonyms ("
+                " alias TEXT NOT NULL,"
+                " canonical TEXT NOT NULL,"
+                " count INTEGER NOT NULL,"
+                " PRIMARY KEY (alias, canonical))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS label_negatives ("
+                " pair TEXT PRIMARY KEY,"
+                " count INTEGER NOT NULL)"
+            )
+            conn.commit()
+            return conn
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"打开标签同义词表失败，本次不保存: {e}")
+            return None
+
+    def _load(self):
+        """读取同义词与反例（包括其他工作进程学到的）"""
+        if self.conn is None:
+            return
+        try:
+            synonyms = self.conn.execute("SELECT alias, canonical, count FROM label_synonyms").fetchall()
+            negatives = self.conn.execute("SELECT pair, count FROM label_negatives").fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"读取标签同义词表失败: {e}")
+            return
+        self.synonyms = defaultdict(dict)
+        for alias, canonical, count in synonyms:
+            self.synonyms[alias][canonical] = count
+        self.negatives = dict(negatives)
+
+    def _save(self, synonym_deltas: List[Tuple[str, str, int]], negative_deltas: List[Tuple[str, int]]):
+        """
+        把计数的增减写入同义词库后重新读取
+
+        只写增量（计数在库中累加，不低于 0），多个工作进程同时学习时不会互相覆盖。
+        """
+        if self.conn is None:
+            for alias, canonical, delta in synonym_deltas:
+                classes = self.synonyms[alias]
+                classes[canonical] = max(classes.get(canonical, 0) + delta, 0)
+                if not classes[canonical]:
+                    del classes[canonical]
+            for pair, delta in negative_deltas:
+                count = max(self.negatives.get(pair, 0) + delta, 0)
+                if count:
+                    self.negatives[pair] = count
+                else:
+                    self.negatives.pop(pair, None)
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO label_synonyms (alias, canonical, count) VALUES (?, ?, MAX(?, 0))"
+                    " ON CONFLICT (alias, canonical) DO UPDATE SET count = MAX(count + ?, 0)",
+                    [(alias, canonical, delta, delta) for alias, canonical, delta in synonym_deltas]
+                )
+                self.conn.executemany(
+                    "INSERT INTO label_negatives (pair, count) VALUES (?, MAX(?, 0))"
+                    " ON CONFLICT (pair) DO UPDATE SET count = MAX(count + ?, 0)",
+                    [(pair, delta, delta) for pair, delta in negative_deltas]
+                )
+                self.conn.execute("DELETE FROM label_synonyms WHERE count = 0")
+                self.conn.execute("DELETE FROM label_negatives WHERE count = 0")
+        except sqlite3.Error as e:
+            logger.warning(f"保存标签同义词表失败: {e}")
+            return
+        self._load()
+
+    @staticmethod
+    def _pair_key(a: str, b: str) -> str:
+        return "|".join(sorted((a, b)))
+
+    def canonical(self, label: str) -> str:
+        """标签所属的类别：学到的同义词中成功次数最多的类别，否则为归一化后的标签本身"""
+        normalized = normalize_label(label)
+        classes = self.synonyms.get(normalized)
+        if classes:
+            return max(classes.items(), key=lambda item: item[1])[0]
+        return normalized
+
+    def _char_similar(self, a: str, b: str) -> bool:
+        """字符级相似：较短标签（至少两个字）被另一方包含，或相似度达到阈值"""
+        shorter, longer = sorted((a, b), key=len)
+        if len(shorter) >= 2 and shorter in longer:
+            return True
+        return SequenceMatcher(None, a, b).ratio() >= self.similarity
+
+    def _embedding_similar(self, a: str, b: str) -> bool:
+        """本地向量模型的余弦相似度（需要 sentence-transformers 与 NumPy，模型加载失败时关闭）"""
+        if not self.embedding_model or SentenceTransformer is None or np is None:
+            return False
+        try:
+            if self._encoder is None:
+                logger.info(f"加载标签向量模型: {self.embedding_model}")
+                self._encoder = SentenceTransformer(self.embedding_model)
+            vectors = []
+            for text in (a, b):
+                if text not in self._embeddings:
+                    self._embeddings[text] = self._encoder.encode(text, normalize_embeddings=True)
+                vectors.append(self._embeddings[text])
+            return float(np.dot(vectors[0], vectors[1])) >= self.embedding_threshold
+        except Exception as e:
+            logger.warning(f"标签向量相似度不可用，已关闭: {e}")
+            self.embedding_model = None
+            return False
+
+    def match(self, item: str, target: str) -> Tuple[bool, str]:
+        """
+        判断格子标签是否属于参考图的类别
+
+        返回 (是否匹配, 依据)，依据为 exact/synonym/similar/embedding/negative/none
+        """
+        a, b = normalize_label(item), normalize_label(target)
+        if not a or not b:
+            return False, "none"
+        with self.lock:
+            if self.negatives.get(self._pair_key(a, b), 0) > 0:
+                return False, "negative"
+            if a == b:
+                return True, "exact"
+            if self.canonical(a) == self.canonical(b):
+                return True, "synonym"
+        if self._char_similar(a, b):
+            return True, "similar"
+        if self._embedding_similar(a, b):
+            return True, "embedding"
+        return False, "none"
+
+    def learn(self, decisions: List[Tuple[str, str, str]], success: bool):
+        """
+        根据验证结果更新同义词表
+
+        decisions 为本次点击所依据的 (格子标签, 参考图标签, 依据)。验证成功时非精确匹配的标签
+        记为参考图类别的同义词；验证失败时这些配对记为反例。
+        """
+        fuzzy = [(normalize_label(item), normalize_label(target), reason)
+                 for item, target, reason in decisions if reason not in ("exact", "none", "negative")]
+        if not fuzzy:
+            return
+        synonym_deltas, negative_deltas = [], []
+        with self.lock:
+            for item, target, reason in fuzzy:
+                key = self._pair_key(item, target)
+                canonical = self.canonical(target)
+                if success:
+                    synonym_deltas.append((item, canonical, 1))
+                    negative_deltas.append((key, -1))
+                    logger.info(f"标签同义词已学习: {item} -> {canonical}（依据 {reason}）")
+                else:
+                    negative_deltas.append((key, 1))
+                    synonym_deltas.append((item, canonical, -1))
+                    logger.info(f"标签配对验证失败，记为反例: {item} / {target}（依据 {reason}）")
+            self._save(synonym_deltas, negative_deltas)
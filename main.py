@@ -1,21 +1,77 @@
 from config import Config
-from automation import CheckInAutomation
+from run_log import set_account
 import logging
+import sys
 
 logger = logging.getLogger(__name__)
 
 
+def _pending_accounts(config: Config, accounts: list) -> list:
+    """查询签到台账，过滤掉今日已签到成功的账户（--force 时全部执行）"""
+    if not config.ledger_path or "--force" in sys.argv[1:]:
+        return accounts
+    from checkin_ledger import CheckInLedger
+    
+    ledger = CheckInLedger(config.ledger_path)
+    try:
+        pending = []
+        for account in accounts:
+            if ledger.done_today(account.user):
+                logger.info(f"账户 {account.user} 今日已签到（台账记录），跳过")
+                set_account(account.user)
+                logger.info("账户结果: already_signed", extra={
+                    'event': 'account_result', 'data': {'outcome': 'already_signed', 'source': 'ledger'}
+                })
+                set_account(None)
+            else:
+                pending.append(account)
+        return pending
+    finally:
+        ledger.close()
+
+
 def main():
     """主函数"""
     try:
         # 加载配置
         config = Config.from_env()
+        accounts = config.load_accounts()
+        
+        if "--daemon" in sys.argv[1:]:
+            # 常驻模式：保持浏览器常驻，按账户每日定时签到
+            from daemon import CheckInDaemon
+            CheckInDaemon(config, accounts).run()
+            return
+        
+        # 今日已完成的账户直接跳过，不导入 Selenium 与 OpenAI
+        accounts = _pending_accounts(config, accounts)
+        if not accounts:
+            logger.info("所有账户今日均已签到")
+            return
+        
+        if config.driver_backend == "cdp":
+            # 协程引擎：所有账户共享一个浏览器，各自在独立的浏览器上下文中运行
+            from async_checkin import AsyncCheckInEngine
+            AsyncCheckInEngine(config, accounts).run()
+            return
+        
+        if len(accounts) > 1:
+            # 多账户：交给调度器并发执行
+            from orchestrator import CheckInOrchestrator
+            CheckInOrchestrator(config, accounts).run()
+            return
+        
+        config = config.for_account(accounts[0])
         logger.info(f"使用账户: {config.sakurafrp_user}")
         
         # 执行自动签到
+        from automation import CheckInAutomation
         automation = CheckInAutomation(config)
         automation.run()
         
+        from metrics import export_run_metrics
+        export_run_metrics([automation.metrics.to_dict()], config.metrics_json_path, config.metrics_textfile)
+        
     except ValueError as e:
         logger.error(f"配置错误: {e}")
     except Exception as e:
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 签到流程的主要阶段（按执行顺序），recognize_click 为流式识别时识别与点击重叠的阶段
+STAGES = ["initialize", "login", "navigate", "prefetch", "get_img", "recognize", "click", "recognize_click", "verification"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩分位数，空列表返回 0"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class RunMetrics:
+    """单个账户一次运行的阶段耗时与计数器"""
+
+    def __init__(self, account: str = ""):
+        self.account = account
+        self.started = time.time()
+        self.spans: Dict[str, List[float]] = defaultdict(list)
+        self.counters = Counter()
+        self.outcome = "unknown"
+        self.peak_rss = 0  # 本次运行中浏览器进程树的内存峰值（字节）
+
+    @contextmanager
+    def span(self, name: str):
+        """记录一段代码的耗时，同一阶段多次执行时逐次记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name].append(time.perf_counter() - start)
+
+    def incr(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def record_usage(self, usage: List[Dict]):
+        """累计模型请求次数与 token 用量（RecognitionEngine.usage 的条目）"""
+        self.counters["model_requests"] += len(usage)
+        self.counters["prompt_tokens"] += sum(u["prompt_tokens"] for u in usage)
+        self.counters["completion_tokens"] += sum(u["completion_tokens"] for u in usage)
+
+    def stage_totals(self) -> Dict[str, float]:
+        return {name: sum(values) for name, values in self.spans.items()}
+
+    def to_dict(self) -> Dict:
+        return {
+            "account": self.account,
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "outcome": self.outcome,
+            "peak_rss_bytes": self.peak_rss,
+            "spans": {name: list(values) for name, values in self.spans.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    """汇总多个账户的运行：结果分布、各阶段 p50/p95 与计数器合计"""
+    stages = defaultdict(list)
+    counters = Counter()
+    for run in runs:
+        for name, values in run.get("spans", {}).items():
+            stages[name].append(sum(values))
+        counters.update(run.get("counters", {}))
+
+    ordered = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+    return {
+        "generated": time.time(),
+        "runs": len(runs),
+        "outcomes": dict(Counter(run.get("outcome", "unknown") for run in runs)),
+        "stages": {
+            name: {
+                "count": len(stages[name]),
+                "total": sum(stages[name]),
+                "p50": percentile(stages[name], 0.5),
+                "p95": percentile(stages[name], 0.95),
+            }
+            for name in ordered
+        },
+        "counters": dict(counters),
+        "peak_rss_bytes": max((run.get("peak_rss_bytes", 0) for run in runs), default=0),
+        "accounts": runs,
+    }
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(runs: List[Dict]) -> str:
+    """生成 node_exporter textfile collector 格式的指标"""
+    lines = [
+        "# HELP checkin_stage_seconds 签到各阶段耗时（秒）",
+        "# TYPE checkin_stage_seconds gauge",
+    ]
+    for run in runs:
+        account = _label(run["account"])
+        for name, values in run.get("spans", {}).items():
+            lines.append(f'checkin_stage_seconds{{account="{account}",stage="{_label(name)}"}} {sum(values):.6f}')
+
+    lines += ["# HELP checkin_run_counter 签到过程计数（尝试次数、重试、模型 token 等）",
+              "# TYPE checkin_run_counter gauge"]
+    for run in runs:
+        account = _label(run["account"])
+        for name, value in sorted(run.get("counters", {}).items()):
+            lines.append(f'checkin_run_counter{{account="{account}",name="{_label(name)}"}} {value}')
+
+    lines += ["# HELP checkin_success 最近一次签到是否成功",
+              "# TYPE checkin_success gauge"]
+    for run in runs:
+        success = 1 if run.get("outcome") in ("success", "already_signed") else 0
+        lines.append(f'checkin_success{{account="{_label(run["account"])}",outcome="{_label(run.get("outcome"))}"}} {success}')
+
+    lines += ["# HELP checkin_duration_seconds 最近一次签到总耗时（秒）",
+              "# TYPE checkin_duration_seconds gauge"]
+    for run in runs:
+        lines.append(f'checkin_duration_seconds{{account="{_label(run["account"])}"}} {run.get("duration", 0.0):.6f}')
+
+    lines += ["# HELP checkin_browser_peak_rss_bytes 最近一次签到中浏览器进程树的内存峰值（字节）",
+              "# TYPE checkin_browser_peak_rss_bytes gauge"]
+    for run in runs:
+        lines.append(f'checkin_browser_peak_rss_bytes{{account="{_label(run["account"])}"}} {run.get("peak_rss_bytes", 0)}')
+
+    lines += ["# HELP checkin_last_run_timestamp_seconds 最近一次签到开始时间",
+              "# TYPE checkin_last_run_timestamp_seconds gauge"]
+    for run in runs:
+        lines.append(f'checkin_last_run_timestamp_seconds{{account="{_label(run["account"])}"}} {run.get("started", 0.0):.0f}')
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path: str, content: str):
+    """先写临时文件再替换，避免采集端读到写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def export_run_metrics(runs: List[Dict], json_path: Optional[str], textfile_path: Optional[str]):
+    """把本次运行的指标写入 JSON 汇总与 Prometheus textfile（路径为空时跳过）"""
+    if not runs:
+        return
+    try:
+        if json_path:
+            _write_atomic(json_path, json.dumps(summarize(runs), ensure_ascii=False, indent=2))
+            logger.info(f"运行汇总已写入 {json_path}")
+        if textfile_path:
+            _write_atomic(textfile_path, prometheus_text(runs))
+            logger.info(f"Prometheus 指标已写入 {textfile_path}")
+    except OSError as e:
+        logger.warning(f"写入运行指标失败: {e}")
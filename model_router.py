@@ -0,0 +1,204 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import astuple, dataclass, fields
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EndpointStats:
+    """单个端点的持久化统计"""
+    latency_ewma: Optional[float] = None
+    requests: int = 0
+    errors: int = 0          # 超时或接口错误（计入熔断）
+    malformed: int = 0       # 输出无法解析（只降低成功率，不计入熔断）
+    verified: int = 0        # 识别结果验证成功
+    rejected: int = 0        # 识别结果验证失败
+    consecutive_errors: int = 0
+    open_until: float = 0.0  # 熔断截止时间
+
+
+_FIELDS = [f.name for f in fields(EndpointStats)]
+
+
+class ModelRouter:
+    """
+    自适应模型路由
+
+    为每个端点维护延迟 EWMA 与验证成功率，按 Thompson 采样估计“得到一次正确结果的期望耗时”
+    （延迟 / 采样成功率）排序，兼顾探索与利用。连续出错的端点熔断一段时间，冷却后放行一次试探请求。
+
+    统计保存在 SQLite 中，每次更新在写事务内读取最新值再写回，多个工作进程共用同一状态文件时不会互相覆盖。
+    """
+
+    def __init__(self, names: List[str], state_path: Optional[str] = None, alpha: float = 0.3,
+                 breaker_errors: int = 3, breaker_cooldown: float = 300.0, default_latency: float = 10.0):
+        self.names = names
+        self.state_path = state_path
+        self.alpha = alpha
+        self.breaker_errors = breaker_errors
+        self.breaker_cooldown = breaker_cooldown
+        self.default_latency = default_latency
+        self.lock = threading.Lock()
+        self.stats: Dict[str, EndpointStats] = {name: EndpointStats() for name in names}
+        self.conn = self._connect()
+        self._refresh()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """打开状态库（未配置路径时只保存在内存中），打开失败时不持久化"""
+        try:
+            if self.state_path:
+                directory = os.path.dirname(os.path.abspath(self.state_path))
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.state_path or ":memory:", timeout=10, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS endpoint_stats ("
+                " name TEXT PRIMARY KEY,"
+                " latency_ewma REAL,"
+                " requests INTEGER NOT NULL DEFAULT 0,"
+                " errors INTEGER NOT NULL DEFAULT 0,"
+                " malformed INTEGER NOT NULL DEFAULT 0,"
+                " verified INTEGER NOT NULL DEFAULT 0,"
+                " rejected INTEGER NOT NULL DEFAULT 0,"
+                " consecutive_errors INTEGER NOT NULL DEFAULT 0,"
+                " open_until REAL NOT NULL DEFAULT 0)"
+            )
+            conn.executemany("INSERT OR IGNORE INTO endpoint_stats (name) VALUES (?)", [(name,) for name in self.names])
+            conn.commit()
+            return conn
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"打开模型路由状态失败，本次不保存: {e}")
+            return None
+
+    def _refresh(self):
+        """从状态库读取所有端点的最新统计（包括其他工作进程的更新）"""
+        if self.conn is None:
+            return
+        try:
+            rows = self.conn.execute(f"SELECT name, {', '.join(_FIELDS)} FROM endpoint_stats").fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"读取模型路由状态失败: {e}")
+            return
+        for name, *values in rows:
+            if name in self.stats:
+                self.stats[name] = EndpointStats(*values)
+
+    def _update(self, name: str, change: Callable[[EndpointStats], None]):
+        """在写事务中读取端点的最新统计、修改并写回"""
+        if self.conn is None:
+            change(self.stats[name])
+            return
+        try:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute(
+                    f"SELECT {', '.join(_FIELDS)} FROM endpoint_stats WHERE name = ?", (name,)
+                ).fetchone()
+                stats = EndpointStats(*row) if row else EndpointStats()
+                change(stats)
+                self.conn.execute(
+                    f"UPDATE endpoint_stats SET {', '.join(f'{field} = ?' for field in _FIELDS)} WHERE name = ?",
+                    (*astuple(stats), name)
+                )
+            self.stats[name] = stats
+        except sqlite3.Error as e:
+            logger.warning(f"保存模型路由状态失败: {e}")
+            change(self.stats[name])
+
+    def _expected_cost(self, stats: EndpointStats, known_latency: float) -> float:
+        """采样一次“期望耗时 / 成功率”，成功率来自 Beta(验证成功+1, 验证失败+输出无法解析+出错+1)"""
+        latency = stats.latency_ewma if stats.latency_ewma is not None else known_latency
+        accuracy = random.betavariate(stats.verified + 1, stats.rejected + stats.malformed + stats.errors + 1)
+        return latency / max(accuracy, 1e-3)
+
+    def order(self) -> List[int]:
+        """本次识别的端点顺序：可用端点按采样代价升序，熔断中的端点排在最后"""
+        now = time.time()
+        with self.lock:
+            self._refresh()
+            latencies = [s.latency_ewma for s in self.stats.values() if s.latency_ewma is not None]
+            known = sum(latencies) / len(latencies) if latencies else self.default_latency
+            available, tripped = [], []
+            for index, name in enumerate(self.names):
+                stats = self.stats[name]
+                if stats.open_until > now:
+                    tripped.append((stats.open_until, index))
+                else:
+                    available.append((self._expected_cost(stats, known), index))
+        ranked = [index for _, index in sorted(available)] + [index for _, index in sorted(tripped)]
+        if tripped and not available:
+            logger.warning("所有模型端点均处于熔断状态，仍按恢复时间依次尝试")
+        return ranked
+
+    def all_open(self) -> bool:
+        """所有端点是否都处于熔断状态（模型服务整体不可用）"""
+        now = time.time()
+        with self.lock:
+            self._refresh()
+            return all(stats.open_until > now for stats in self.stats.values())
+
+    def record_request(self, index: int, latency: Optional[float], ok: bool, valid: bool = True):
+        """
+        记录一次请求
+
+        ok 为请求是否得到响应：成功时更新延迟 EWMA，超时或接口错误时累计并在连续出错后熔断。
+        valid 为输出能否解析：无法解析说明端点可用但结果质量差，只计入成功率，不触发熔断。
+        """
+        name = self.names[index]
+
+        def change(stats: EndpointStats):
+            stats.requests += 1
+            if ok:
+                stats.consecutive_errors = 0
+                stats.open_until = 0.0
+                if not valid:
+                    stats.malformed += 1
+                if latency is not None:
+                    stats.latency_ewma = latency if stats.latency_ewma is None else (
+                        self.alpha * latency + (1 - self.alpha) * stats.latency_ewma
+                    )
+            else:
+                stats.errors += 1
+                stats.consecutive_errors += 1
+                if stats.consecutive_errors >= self.breaker_errors:
+                    stats.open_until = time.time() + self.breaker_cooldown
+                    logger.warning(
+                        f"模型端点 {name} 连续出错 {stats.consecutive_errors} 次，熔断 {self.breaker_cooldown:.0f} 秒"
+                    )
+
+        with self.lock:
+            self._update(name, change)
+
+    def record_verification(self, indexes: List[int], success: bool):
+        """记录识别结果的验证结果（GeeTest 返回的成功/失败）"""
+        if not indexes:
+            return
+
+        def change(stats: EndpointStats):
+            if success:
+                stats.verified += 1
+            else:
+                stats.rejected += 1
+
+        with self.lock:
+            for index in indexes:
+                self._update(self.names[index], change)
+
+    def summary(self) -> str:
+        with self.lock:
+            parts = []
+            for name, stats in self.stats.items():
+                judged = stats.verified + stats.rejected
+                rate = f"{stats.verified / judged:.0%}" if judged else "-"
+                latency = f"{stats.latency_ewma:.2f}s" if stats.latency_ewma is not None else "-"
+                state = "熔断" if stats.open_until > time.time() else "正常"
+                parts.append(
+                    f"{name}: 延迟 {latency}, 验证成功率 {rate}, 出错 {stats.errors}/{stats.requests}, "
+                    f"无法解析 {stats.malformed}, {state}"
+                )
+        return "; ".join(parts)
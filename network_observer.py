@@ -0,0 +1,197 @@
+import base64
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class NetworkResponse:
+    """捕获到的网络响应"""
+    url: str
+    status: int
+    body: bytes
+
+    def text(self) -> str:
+        return self.body.decode('utf-8', errors='replace')
+
+
+@dataclass
+class NetworkStats:
+    """本次运行的网络请求统计"""
+    requests: int = 0
+    bytes: int = 0
+    blocked: Counter = field(default_factory=Counter)
+    bytes_by_type: Counter = field(default_factory=Counter)
+    requests_by_type: Counter = field(default_factory=Counter)
+
+    def estimated_saved_bytes(self) -> int:
+        """按同类型已加载请求的平均大小估算被屏蔽请求节省的字节数"""
+        saved = 0
+        for resource_type, count in self.blocked.items():
+            loaded = self.requests_by_type.get(resource_type, 0)
+            average = self.bytes_by_type[resource_type] / loaded if loaded else 0
+            saved += int(average * count)
+        return saved
+
+    def report(self) -> str:
+        blocked_total = sum(self.blocked.values())
+        blocked_detail = ", ".join(f"{t}: {c}" for t, c in self.blocked.most_common()) or "无"
+        return (
+            f"已加载 {self.requests} 个请求 / {self.bytes / 1024:.1f} KB，"
+            f"屏蔽 {blocked_total} 个请求（{blocked_detail}），"
+            f"估算节省 {self.estimated_saved_bytes() / 1024:.1f} KB"
+        )
+
+
+class NetworkObserver:
+    """
+    基于 Chrome DevTools Network 事件（performance 日志）的轻量网络监听
+
+    只有匹配 URL 过滤规则的响应才会读取响应体并放入队列，其余事件直接丢弃，
+    不经过任何代理，也不缓存页面其他资源。
+    """
+
+    def __init__(self, driver, url_filters: Iterable[str] = ()):
+        self.driver = driver
+        self.url_filters = list(url_filters)
+        self._pending = {}
+        self._types = {}
+        self._responses = deque()
+        self._lock = threading.Lock()
+        self.stats = NetworkStats()
+
+    def watch(self, url_filter: str):
+        """增加一个 URL 过滤规则"""
+        if url_filter not in self.url_filters:
+            self.url_filters.append(url_filter)
+
+    def _matches(self, url: str) -> bool:
+        return any(url_filter in url for url_filter in self.url_filters)
+
+    def pump(self):
+        """读取 performance 日志中的新事件，把匹配的响应体放入队列"""
+        with self._lock:
+            try:
+                entries = self.driver.get_log('performance')
+            except Exception as e:
+                logger.debug(f"读取 performance 日志失败: {e}")
+                return
+
+            for entry in entries:
+                try:
+                    message = json.loads(entry['message'])['message']
+                except (KeyError, ValueError):
+                    continue
+                self._handle_event(message.get('method', ''), message.get('params', {}))
+
+    def _handle_event(self, method: str, params: dict):
+        """处理单个 DevTools 事件"""
+        if method == 'Network.requestWillBeSent':
+            self._types[params.get('requestId')] = params.get('type', 'Other')
+
+        elif method == 'Network.responseReceived':
+            response = params.get('response', {})
+            url = response.get('url', '')
+            if self._matches(url):
+                self._pending[params['requestId']] = (url, response.get('status', 0))
+
+        elif method == 'Network.loadingFinished':
+            resource_type = self._types.pop(params.get('requestId'), 'Other')
+            size = int(params.get('encodedDataLength', 0))
+            self.stats.requests += 1
+            self.stats.bytes += size
+            self.stats.requests_by_type[resource_type] += 1
+            self.stats.bytes_by_type[resource_type] += size
+
+            pending = self._pending.pop(params.get('requestId'), None)
+            if pending:
+                self._responses.append(self._fetch_body(params['requestId'], *pending))
+
+        elif method == 'Network.loadingFailed':
+            resource_type = self._types.pop(params.get('requestId'), params.get('type', 'Other'))
+            if params.get('blockedReason'):
+                self.stats.blocked[resource_type] += 1
+            self._pending.pop(params.get('requestId'), None)
+
+    def _fetch_body(self, request_id: str, url: str, status: int) -> NetworkResponse:
+        """通过 Network.getResponseBody 读取响应体"""
+        try:
+            result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            body = result.get('body', '')
+            data = base64.b64decode(body) if result.get('base64Encoded') else body.encode('utf-8')
+        except Exception as e:
+            logger.debug(f"读取响应体失败 ({url}): {e}")
+            data = b''
+        return NetworkResponse(url, status, data)
+
+    def poll(self, url_filter: str) -> Optional[NetworkResponse]:
+        """取出队列中第一个匹配的响应，没有则返回 None（不阻塞）"""
+        self.pump()
+        with self._lock:
+            for response in self._responses:
+                if url_filter in response.url:
+                    self._responses.remove(response)
+                    return response
+        return None
+
+    def wait_for(self, url_filter: str, timeout: float, poll: float = 0.1) -> Optional[NetworkResponse]:
+        """阻塞等待匹配的响应，超时返回 None"""
+        deadline = time.time() + timeout
+        while True:
+            response = self.poll(url_filter)
+            if response or time.time() >= deadline:
+                return response
+            time.sleep(poll)
+
+    def reset(self):
+        """丢弃已有的事件和响应，只关注之后的请求"""
+        self.pump()
+        with self._lock:
+            self._pending.clear()
+            self._responses.clear()
+
+
+class WireNetworkObserver:
+    """selenium-wire 后端的兼容实现（通过代理捕获的请求记录）"""
+
+    def __init__(self, driver, url_filters: Iterable[str] = ()):
+        self.driver = driver
+        self.url_filters = list(url_filters)
+        self._seen = set()
+        self.stats = NetworkStats()
+
+    def watch(self, url_filter: str):
+        """增加一个 URL 过滤规则"""
+        if url_filter not in self.url_filters:
+            self.url_filters.append(url_filter)
+
+    def pump(self):
+        """selenium-wire 自动记录所有请求，无需主动读取"""
+
+    def poll(self, url_filter: str) -> Optional[NetworkResponse]:
+        """取出第一个未读取过的匹配响应"""
+        for request in self.driver.requests:
+            if request.response and url_filter in request.url and request.id not in self._seen:
+                self._seen.add(request.id)
+                return NetworkResponse(request.url, request.response.status_code, request.response.body)
+        return None
+
+    def wait_for(self, url_filter: str, timeout: float, poll: float = 0.1) -> Optional[NetworkResponse]:
+        """阻塞等待匹配的响应，超时返回 None"""
+        deadline = time.time() + timeout
+        while True:
+            response = self.poll(url_filter)
+            if response or time.time() >= deadline:
+                return response
+            time.sleep(poll)
+
+    def reset(self):
+        """清除已捕获的请求记录"""
+        del self.driver.requests
+        self._seen.clear()
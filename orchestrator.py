@@ -0,0 +1,145 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import Account, Config
+from metrics import RunMetrics, export_run_metrics
+from process_memory import MemoryLimiter
+from run_log import attach_worker, start_worker_listener
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AccountResult:
+    """单个账户的签到结果"""
+    user: str
+    success: bool
+    duration: float
+    error: Optional[str] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    metrics: Dict = field(default_factory=dict)
+
+
+def _run_account(config: Config, account: Account) -> AccountResult:
+    """在工作进程中执行单个账户的签到（每个进程独立的 WebDriver 与验证码处理器）"""
+    from automation import CheckInAutomation
+
+    start = time.time()
+    automation = None
+    try:
+        automation = CheckInAutomation(config.for_account(account))
+        success = automation.run()
+        return AccountResult(account.user, success, time.time() - start,
+                             stages=automation.timing_summary(), metrics=automation.metrics.to_dict())
+    except Exception as e:
+        logger.error(f"账户 {account.user} 执行失败: {e}", exc_info=True)
+        return AccountResult(account.user, False, time.time() - start, str(e))
+    finally:
+        if automation:
+            automation.driver_manager.close()
+
+
+class CheckInOrchestrator:
+    """多账户签到调度器，将账户分发到有界的工作进程池"""
+
+    def __init__(self, config: Config, accounts: List[Account]):
+        self.config = config
+        self.accounts = accounts
+        self.max_workers = max(1, min(config.max_workers, len(accounts)))
+        self.limiter = MemoryLimiter(config.memory_budget_mb, config.browser_rss_estimate_mb)
+
+    def run(self) -> List[AccountResult]:
+        """执行所有账户的签到，返回按账户顺序排列的结果"""
+        logger.info(f"共 {len(self.accounts)} 个账户，工作进程数: {self.max_workers}")
+        start = time.time()
+
+        if self.max_workers == 1:
+            results = [_run_account(self.config, account) for account in self.accounts]
+        else:
+            results = self._run_pool()
+
+        self._log_summary(results, time.time() - start)
+        export_run_metrics(
+            [r.metrics or self._error_metrics(r) for r in results],
+            self.config.metrics_json_path,
+            self.config.metrics_textfile
+        )
+        return results
+
+    def _run_pool(self) -> List[AccountResult]:
+        """
+        使用进程池并发执行
+        
+        账户逐个提交：同时运行的账户不超过 MAX_WORKERS，配置 MEMORY_BUDGET_MB 时，
+        只有主机内存预计仍在预算内才启动新的浏览器。工作进程的日志经队列交给主进程写入。
+        """
+        results = {}
+        queued = list(enumerate(self.accounts))
+        running = {}
+        throttled = False
+        log_queue, log_listener = start_worker_listener()
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=attach_worker,
+                                     initargs=(log_queue,)) as executor:
+                while queued or running:
+                    while queued and len(running) < self.max_workers:
+                        if not self.limiter.admit(len(running)):
+                            if not throttled:
+                                logger.info(f"主机内存接近预算，暂缓启动新的浏览器（运行中 {len(running)} 个）")
+                                throttled = True
+                            break
+                        throttled = False
+                        index, account = queued.pop(0)
+                        running[executor.submit(_run_account, self.config, account)] = index
+                        self.limiter.started()
+                    
+                    done, _ = wait(running, timeout=2, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = running.pop(future)
+                        account = self.accounts[index]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # 工作进程异常退出（如崩溃）时仍记录结果
+                            logger.error(f"账户 {account.user} 的工作进程异常: {e}")
+                            result = AccountResult(account.user, False, 0.0, str(e))
+                        results[index] = result
+                        self.limiter.observe(result.metrics.get("peak_rss_bytes", 0))
+                        status = "成功" if result.success else "失败"
+                        logger.info(f"账户 {account.user} 签到{status}，耗时 {result.duration:.1f}s")
+        finally:
+            log_listener.stop()
+
+        return [results[index] for index in range(len(self.accounts))]
+
+    @staticmethod
+    def _error_metrics(result: AccountResult) -> Dict:
+        """工作进程异常、没有运行指标的账户"""
+        metrics = RunMetrics(result.user)
+        metrics.outcome = "error"
+        data = metrics.to_dict()
+        data["duration"] = result.duration
+        return data
+
+    @staticmethod
+    def _log_summary(results: List[AccountResult], elapsed: float):
+        """输出每个账户的结果表"""
+        width = max([len("账户")] + [len(r.user) for r in results])
+        lines = [
+            f"{'账户'.ljust(width)}  状态  耗时(s)  错误",
+            "-" * (width + 24),
+        ]
+        for r in results:
+            status = "成功" if r.success else "失败"
+            lines.append(f"{r.user.ljust(width)}  {status}  {r.duration:7.1f}  {r.error or ''}")
+
+        succeeded = sum(1 for r in results if r.success)
+        lines.append("-" * (width + 24))
+        lines.append(f"成功 {succeeded}/{len(results)}，总耗时 {elapsed:.1f}s")
+        logger.info("签到结果汇总:\n" + "\n".join(lines), extra={
+            'event': 'run_summary',
+            'data': {'accounts': len(results), 'succeeded': succeeded}
+        })
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+def _children_from_proc(pid: int) -> List[int]:
+    """从 /proc 读取子进程（Linux，没有 psutil 时使用）"""
+    children = []
+    task_dir = f"/proc/{pid}/task"
+    try:
+        for tid in os.listdir(task_dir):
+            with open(f"{task_dir}/{tid}/children", encoding='ascii') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def _rss_from_proc(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree_rss(pid: Optional[int]) -> int:
+    """进程及其全部子进程的常驻内存合计（字节），无法读取时返回 0"""
+    if not pid:
+        return 0
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return 0
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += _rss_from_proc(current)
+        pending.extend(_children_from_proc(current))
+    return total
+
+
+def driver_rss(driver) -> int:
+    """chromedriver 及其启动的 Chrome 进程树的内存占用（字节）"""
+    try:
+        return process_tree_rss(driver.service.process.pid)
+    except AttributeError:
+        return 0
+
+
+def host_memory_used() -> Optional[int]:
+    """主机已用内存（总内存减可用内存，字节），无法读取时返回 None"""
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.total - memory.available
+    try:
+        values = {}
+        with open("/proc/meminfo", encoding='ascii') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                values[name] = int(value.split()[0]) * 1024
+        return values['MemTotal'] - values['MemAvailable']
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class PeakRssSampler:
+    """后台线程定期采样浏览器进程树的内存，记录一次运行中的峰值"""
+
+    def __init__(self, sample: Callable[[], int], interval: float = 0.5):
+        self.sample = sample
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _take(self):
+        try:
+            self.peak = max(self.peak, self.sample())
+        except Exception as e:
+            logger.debug(f"采样浏览器内存失败: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._take()
+
+    def start(self) -> 'PeakRssSampler':
+        self._take()
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> int:
+        """停止采样并返回峰值（字节）"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+        self._take()
+        return self.peak
+
+
+class MemoryLimiter:
+    """
+    按主机内存预算决定是否启动新的浏览器
+
+    单个浏览器的内存按已完成运行的峰值估计（没有样本时用配置的估计值）；刚启动、内存尚未涨到峰值
+    的浏览器按估计值预留。没有浏览器在运行时总是放行，保证调度能继续。
+    """
+
+    def __init__(self, budget_mb: int, estimate_mb: int = 400, warmup: float = 20.0):
+        self.budget = budget_mb * 1024 * 1024
+        self.estimate = estimate_mb * 1024 * 1024
+        self.warmup = warmup
+        self.launches: List[float] = []
+        self._observed = False
+
+    def observe(self, peak_bytes: int):
+        """用已完成运行的峰值更新单个浏览器的内存估计"""
+        if peak_bytes <= 0:
+            return
+        self.estimate = peak_bytes if not self._observed else max(self.estimate, peak_bytes)
+        self._observed = True
+
+    def started(self):
+        self.launches.append(time.time())
+
+    def admit(self, running: int) -> bool:
+        if not self.budget or running == 0:
+            return True
+        used = host_memory_used()
+        if used is None:
+            return True
+        now = time.time()
+        self.launches = [t for t in self.launches if now - t < self.warmup]
+        reserved = self.estimate * len(self.launches)
+        return used + reserved + self.estimate <= self.budget
@@ -0,0 +1,436 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from model_router import ModelRouter
+
+logger = logging.getLogger(__name__)
+
+PROMPT = (
+    '这是一个九宫格验证码，请按从左到右、从上到下的顺序识别每个格子里的物品名称，'
+    '最后识别左下角的参考图。输出格式为JSON：{"1":"名称", "2":"名称", ..., "10":"参考图名称"}。'
+    '名称要简洁，参考图名称必须是九宫格里已有的名称。若有类似物品（如气球与热气球），请统一名称。'
+)
+
+# 流式模式先输出参考图，再按顺序输出格子，收到参考图后即可边生成边点击
+STREAM_PROMPT = (
+    '这是一个九宫格验证码。请先识别左下角的参考图，再按从左到右、从上到下的顺序识别每个格子里的物品名称。'
+    '输出格式为JSON，参考图放在最前：{"10":"参考图名称", "1":"名称", "2":"名称", ..., "9":"名称"}。'
+    '名称要简洁，参考图名称必须是九宫格里已有的名称。若有类似物品（如气球与热气球），请统一名称。'
+)
+
+RECOGNITION_KEYS = [str(position) for position in range(1, 11)]
+
+# 宽松匹配 "键": "值" 对，兼容单引号、全角冒号、代码块与前后的说明文字
+_PAIR_PATTERN = re.compile(r'["\']?(10|[1-9])["\']?\s*[:：]\s*["\']([^"\'\n{}]*)["\']')
+
+
+class IncrementalLabelParser:
+    """增量解析模型输出中的格子标签，每个标签完整到达后立即返回"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.labels = {}
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """追加一段输出，返回新解析出的 (位置, 标签) 列表"""
+        self.buffer += text
+        pairs = []
+        for match in _PAIR_PATTERN.finditer(self.buffer, self.position):
+            key, label = match.group(1), match.group(2).strip()
+            self.position = match.end()
+            if label and key not in self.labels:
+                self.labels[key] = label
+                pairs.append((key, label))
+        return pairs
+
+
+@dataclass
+class ModelEndpoint:
+    """OpenAI 兼容的模型端点"""
+    base_url: str
+    api_key: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}@{self.base_url}"
+
+
+def endpoints_from_config(config) -> List[ModelEndpoint]:
+    """主端点（BASE_URL/API_KEY/MODEL）在前，MODEL_ENDPOINTS 中的额外端点在后"""
+    endpoints = [ModelEndpoint(config.base_url, config.api_key, config.model)]
+    for entry in config.model_endpoints:
+        endpoints.append(ModelEndpoint(
+            base_url=entry.get("base_url", config.base_url),
+            api_key=entry.get("api_key", config.api_key),
+            model=entry["model"]
+        ))
+    return endpoints
+
+
+def parse_recognition(content: str) -> Optional[Dict]:
+    """解析模型输出的识别结果 JSON，格式不完整时返回 None"""
+    # 清理并解析 JSON
+    cleaned_str = content.strip().replace("'", '"')
+    try:
+        result = json.loads(cleaned_str) if cleaned_str.startswith('{') else None
+    except json.JSONDecodeError as e:
+        logger.warning(f"JSON 解析失败，尝试宽松解析: {e}")
+        result = None
+
+    if not isinstance(result, dict):
+        # 模型用代码块或说明文字包裹答案时，逐对提取标签
+        parser = IncrementalLabelParser()
+        parser.feed(content)
+        result = parser.labels or None
+
+    if not isinstance(result, dict) or not str(result.get("10", "")).strip():
+        logger.error("无法从模型输出中提取有效 JSON")
+        return None
+    return result
+
+
+def majority_vote(results: List[Dict]) -> Dict:
+    """按格子对多个识别结果进行多数投票，平票时取最先返回的结果"""
+    voted = {}
+    for key in RECOGNITION_KEYS:
+        labels = [str(r.get(key, "")).strip() for r in results if str(r.get(key, "")).strip()]
+        if labels:
+            counts = Counter(labels)
+            top = max(counts.values())
+            voted[key] = next(label for label in labels if counts[label] == top)
+    return voted
+
+
+@dataclass
+class TracedRecognition:
+    """一次识别的结果及其来源端点、失败类别与模型用量"""
+    result: Optional[Dict] = None
+    sources: List[int] = field(default_factory=list)
+    failure: Optional[str] = None
+    usage: List[Dict] = field(default_factory=list)
+
+
+# 当前识别的追踪记录（每次 recognize_traced 在自己的任务上下文中设置）
+_trace: contextvars.ContextVar = contextvars.ContextVar('recognition_trace', default=None)
+
+
+class RecognitionEngine:
+    """
+    异步视觉模型识别引擎
+
+    模式:
+        single: 单次请求（失败时换下一个端点重试一次）
+        hedge: 主请求超过延迟分位数仍未返回时，向下一个端点发出对冲请求
+        race: 同时请求所有端点，取第一个格式正确的结果
+        vote: 同时发出多个请求，对每个格子的标签多数投票
+
+    端点的先后顺序由 ModelRouter 按延迟与验证成功率动态决定。
+    """
+
+    def __init__(self, endpoints: List[ModelEndpoint], mode: str = "single", timeout: float = 30.0,
+                 hedge_delay: float = 8.0, hedge_percentile: float = 0.9, votes: int = 3,
+                 router: Optional[ModelRouter] = None):
+        if not endpoints:
+            raise ValueError("至少需要配置一个模型端点")
+        self.endpoints = endpoints
+        self.mode = mode
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.votes = votes
+        self.latencies = deque(maxlen=50)
+        self.usage = []  # 每次请求的端点、耗时与 token 用量
+        self.router = router or ModelRouter([e.name for e in endpoints], default_latency=timeout / 3)
+        self.last_sources: List[int] = []  # 最近一次识别结果来自哪些端点，用于回填验证结果
+        self.last_failure: Optional[str] = None  # 最近一次识别的失败类别（model_api_error/malformed_output）
+        self._clients = {}
+
+        # 在独立线程中运行常驻事件循环，客户端连接池可跨多次识别复用
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="recognition-loop", daemon=True)
+        self._thread.start()
+
+    def stream_sync(self, image_url: str) -> Iterator[Tuple[str, str]]:
+        """流式识别，按到达顺序同步产出 (位置, 标签)；只使用路由排在最前的端点"""
+        pairs = queue.Queue()
+        done = object()
+        index = self.router.order()[0]
+        self.last_sources = [index]
+        self.last_failure = None
+
+        async def produce():
+            try:
+                await self._stream_guarded(index, image_url, pairs.put)
+            finally:
+                pairs.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self.loop)
+        try:
+            while True:
+                item = pairs.get()
+                if item is done:
+                    return
+                yield item
+        finally:
+            # 调用方提前结束时取消生成
+            future.cancel()
+
+    def stream_traced(self, image_url: str, emit: Callable[[Tuple[str, str]], None]) -> concurrent.futures.Future:
+        """
+        开始一次带追踪的流式识别，标签到达时在识别线程中调用 emit((位置, 标签))
+
+        Future 的结果为 TracedRecognition（有参考图标签时 result 为已到达的全部标签），
+        用量与失败类别只记录本次识别，供协程引擎中多个账户共享识别引擎时使用。
+        """
+        async def traced():
+            trace = TracedRecognition()
+            _trace.set(trace)
+            index = self.router.order()[0]
+            trace.sources = [index]
+            labels = {}
+
+            def collect(pair: Tuple[str, str]):
+                labels[pair[0]] = pair[1]
+                emit(pair)
+
+            await self._stream_guarded(index, image_url, collect)
+            trace.result = labels if "10" in labels else None
+            return trace
+
+        return asyncio.run_coroutine_threadsafe(traced(), self.loop)
+
+    async def _stream_guarded(self, index: int, image_url: str, emit):
+        """带超时的流式请求，超时或接口错误时记录失败（不抛出）"""
+        try:
+            await asyncio.wait_for(self._stream(index, image_url, emit), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"流式识别超时 ({self.timeout}秒)")
+            self._note_failure("model_api_error")
+            self.router.record_request(index, None, False)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"流式识别失败: {e}")
+            self._note_failure("model_api_error")
+            self.router.record_request(index, None, False)
+
+    async def _stream(self, index: int, image_url: str, emit):
+        """发出流式请求，把增量解析出的标签交给 emit"""
+        endpoint = self.endpoints[index]
+        start = time.time()
+        parser = IncrementalLabelParser()
+        stream = await self._client(index).chat.completions.create(
+            model=endpoint.model,
+            messages=[{
+                'role': 'user',
+                'content': [
+                    {'type': 'text', 'text': STREAM_PROMPT},
+                    {'type': 'image_url', 'image_url': {'url': image_url}}
+                ]
+            }],
+            stream=True,
+            stream_options={'include_usage': True}
+        )
+        first_label = None
+        usage = None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            for pair in parser.feed(chunk.choices[0].delta.content or ""):
+                if first_label is None:
+                    first_label = time.time() - start
+                emit(pair)
+
+        latency = time.time() - start
+        self.latencies.append(latency)
+        self.router.record_request(index, latency, True, "10" in parser.labels)
+        if "10" not in parser.labels:
+            self._note_failure("malformed_output")
+        entry = {
+            'endpoint': endpoint.name,
+            'latency': latency,
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        }
+        self.usage.append(entry)
+        trace = _trace.get()
+        if trace is not None:
+            trace.usage.append(entry)
+        first = f"{first_label:.2f}s" if first_label is not None else "无"
+        logger.info(f"流式识别完成 ({endpoint.name}): 首个标签 {first}, 总耗时 {latency:.2f}s, 输出: {parser.buffer}")
+
+    def recognize_async(self, image_url: str) -> concurrent.futures.Future:
+        """在后台事件循环中开始识别，立即返回 Future（供流水线提前识别）"""
+        return asyncio.run_coroutine_threadsafe(self.recognize(image_url), self.loop)
+
+    async def recognize(self, image_url: str) -> Optional[Dict]:
+        """按配置的模式识别验证码"""
+        order = self.router.order()
+        self.last_sources = []
+        self.last_failure = None
+        if self.mode == "hedge":
+            return await self._first_valid(image_url, self._hedge_schedule(order))
+        if self.mode == "race":
+            return await self._first_valid(image_url, [(i, 0.0) for i in order])
+        if self.mode == "vote":
+            return await self._vote(image_url, order)
+        for index in order[:2]:
+            result = await self._request(index, image_url)
+            if result:
+                self.last_sources = [index]
+                return result
+        return None
+
+    def _note_failure(self, kind: str):
+        self.last_failure = kind
+        trace = _trace.get()
+        if trace is not None:
+            trace.failure = kind
+
+    async def _recognize_traced(self, image_url: str) -> 'TracedRecognition':
+        trace = TracedRecognition()
+        _trace.set(trace)
+        trace.result = await self.recognize(image_url)
+        # 来源在识别返回的同一步读取，不会被并发的其他识别覆盖
+        trace.sources = list(self.last_sources)
+        return trace
+
+    def recognize_traced(self, image_url: str) -> concurrent.futures.Future:
+        """
+        开始一次带追踪的识别，Future 的结果为 TracedRecognition
+
+        用量、失败类别与结果来源只记录本次识别的请求（请求任务继承本次识别的上下文），
+        供多个账户共享同一个识别引擎并发识别时使用。
+        """
+        return asyncio.run_coroutine_threadsafe(self._recognize_traced(image_url), self.loop)
+
+    def record_verification(self, success: bool, sources: Optional[List[int]] = None):
+        """把识别结果的验证结果反馈给路由（默认为最近一次识别）"""
+        self.router.record_verification(self.last_sources if sources is None else sources, success)
+
+    def _client(self, index: int) -> AsyncOpenAI:
+        """按端点惰性创建客户端（在事件循环线程内创建）"""
+        if index not in self._clients:
+            endpoint = self.endpoints[index]
+            self._clients[index] = AsyncOpenAI(
+                base_url=endpoint.base_url,
+                api_key=endpoint.api_key,
+                max_retries=0
+            )
+        return self._clients[index]
+
+    def _hedge_schedule(self, order: List[int]) -> List:
+        """对冲请求计划：主请求立即发出，第二个请求在延迟分位数后发出"""
+        delay = self.hedge_delay
+        if len(self.latencies) >= 5:
+            ordered = sorted(self.latencies)
+            delay = ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+        backup = order[1 % len(order)]
+        return [(order[0], 0.0), (backup, delay)]
+
+    async def _request(self, index: int, image_url: str, delay: float = 0.0) -> Optional[Dict]:
+        """向指定端点发出一次识别请求（带超时）"""
+        if delay:
+            await asyncio.sleep(delay)
+            logger.info(f"发出对冲请求: {self.endpoints[index].name}")
+
+        endpoint = self.endpoints[index]
+        start = time.time()
+        try:
+            response = await asyncio.wait_for(
+                self._client(index).chat.completions.create(
+                    model=endpoint.model,
+                    messages=[{
+                        'role': 'user',
+                        'content': [
+                            {'type': 'text', 'text': PROMPT},
+                            {'type': 'image_url', 'image_url': {'url': image_url}}
+                        ]
+                    }],
+                    stream=False
+                ),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"模型请求超时 ({self.timeout}秒): {endpoint.name}")
+            self._note_failure("model_api_error")
+            self.router.record_request(index, None, False)
+            return None
+        except asyncio.CancelledError:
+            logger.info(f"已取消落后的模型请求: {endpoint.name}")
+            raise
+        except Exception as e:
+            logger.error(f"验证码识别失败 ({endpoint.name}): {e}")
+            self._note_failure("model_api_error")
+            self.router.record_request(index, None, False)
+            return None
+
+        latency = time.time() - start
+        self.latencies.append(latency)
+        result_content = response.choices[0].message.content or ""
+        logger.info(f"模型原始输出 ({endpoint.name}, {latency:.2f}s): {result_content}")
+        entry = {
+            'endpoint': endpoint.name,
+            'latency': latency,
+            'prompt_tokens': getattr(response.usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(response.usage, 'completion_tokens', 0) or 0,
+        }
+        self.usage.append(entry)
+        trace = _trace.get()
+        if trace is not None:
+            trace.usage.append(entry)
+        if response.usage:
+            logger.info(f"模型 token 用量: {response.usage.total_tokens}")
+        result = parse_recognition(result_content)
+        self.router.record_request(index, latency, True, result is not None)
+        if result is None:
+            self._note_failure("malformed_output")
+        return result
+
+    async def _first_valid(self, image_url: str, schedule: List) -> Optional[Dict]:
+        """按计划发出请求，返回第一个格式正确的结果并取消其余请求"""
+        tasks = {
+            asyncio.ensure_future(self._request(index, image_url, delay)): index
+            for index, delay in schedule
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    result = task.result()
+                    if result:
+                        self.last_sources = [tasks[task]]
+                        return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _vote(self, image_url: str, order: List[int]) -> Optional[Dict]:
+        """并发请求后按格子多数投票"""
+        indexes = [order[i % len(order)] for i in range(max(self.votes, len(order)))]
+        results = await asyncio.gather(*(self._request(i, image_url) for i in indexes))
+        valid = [r for r in results if r]
+        if not valid:
+            return None
+        self.last_sources = sorted({index for index, r in zip(indexes, results) if r})
+        voted = majority_vote(valid)
+        logger.info(f"多数投票结果（{len(valid)}/{len(results)} 个有效）: {voted}")
+        return voted
@@ -0,0 +1,92 @@
+import logging
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# 资源类型对应的 URL 后缀（Network.setBlockedURLs 只支持 URL 通配符）
+RESOURCE_TYPE_EXTENSIONS = {
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico'],
+    'media': ['mp4', 'webm', 'mp3', 'ogg'],
+    'stylesheet': ['css'],
+}
+
+# 签到流程用不到的统计、字体与头像服务
+DEFAULT_BLOCK_URLS = [
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*hm.baidu.com*',
+    '*clarity.ms*',
+    '*fonts.googleapis.com*',
+    '*fonts.gstatic.com*',
+    '*gravatar.com*',
+    '*cravatar.cn*',
+]
+DEFAULT_BLOCK_RESOURCE_TYPES = ['font', 'media']
+# 资源类型屏蔽只作用于这些站点，GeeTest 的脚本与 geetest_tip_img 图片不受影响
+DEFAULT_RESOURCE_TYPE_HOSTS = ['*natfrp.com']
+DEFAULT_ALLOW_URLS = ['*geetest.com*', '*geevisit.com*']
+
+
+@dataclass
+class RequestPolicy:
+    """请求屏蔽策略：URL 黑名单、按资源类型屏蔽，以及优先级更高的白名单"""
+    block_urls: List[str] = field(default_factory=lambda: list(DEFAULT_BLOCK_URLS))
+    block_resource_types: List[str] = field(default_factory=lambda: list(DEFAULT_BLOCK_RESOURCE_TYPES))
+    resource_type_hosts: List[str] = field(default_factory=lambda: list(DEFAULT_RESOURCE_TYPE_HOSTS))
+    allow_urls: List[str] = field(default_factory=lambda: list(DEFAULT_ALLOW_URLS))
+
+    @classmethod
+    def from_config(cls, config) -> 'RequestPolicy':
+        """配置项为 None 时使用默认规则"""
+        policy = cls()
+        if config.block_urls is not None:
+            policy.block_urls = config.block_urls
+        if config.block_resource_types is not None:
+            policy.block_resource_types = config.block_resource_types
+        if config.block_resource_hosts is not None:
+            policy.resource_type_hosts = config.block_resource_hosts
+        if config.allow_urls is not None:
+            policy.allow_urls = config.allow_urls
+        return policy
+
+    def _allowed(self, pattern: str) -> bool:
+        """屏蔽规则是否可能命中白名单（白名单优先）"""
+        extensions = [ext for exts in RESOURCE_TYPE_EXTENSIONS.values() for ext in exts]
+        for allow in self.allow_urls:
+            core = allow.strip('*')
+            samples = [core, f"https://{core}/"] + [f"https://{core}/static/x.{ext}" for ext in extensions]
+            if pattern.strip('*') in core or any(fnmatch(sample, pattern) for sample in samples):
+                return True
+        return False
+
+    def blocked_patterns(self) -> List[str]:
+        """生成传给 Network.setBlockedURLs 的 URL 通配符列表"""
+        patterns = list(self.block_urls)
+        for resource_type in self.block_resource_types:
+            extensions = RESOURCE_TYPE_EXTENSIONS.get(resource_type)
+            if not extensions:
+                logger.warning(f"不支持屏蔽的资源类型: {resource_type}")
+                continue
+            for host in self.resource_type_hosts:
+                patterns.extend(f"{host}/*.{extension}*" for extension in extensions)
+
+        allowed = [p for p in patterns if not self._allowed(p)]
+        for pattern in patterns:
+            if pattern not in allowed:
+                logger.warning(f"屏蔽规则 {pattern} 与白名单冲突，已忽略")
+        return allowed
+
+    def apply(self, driver):
+        """在浏览器中启用屏蔽规则"""
+        patterns = self.blocked_patterns()
+        if not patterns:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            logger.info(f"已启用请求屏蔽策略（{len(patterns)} 条规则）")
+        except Exception as e:
+            logger.warning(f"启用请求屏蔽策略失败: {e}")
@@ -0,0 +1,151 @@
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 失败类别
+IMAGE_FETCH = "image_fetch"
+MALFORMED_OUTPUT = "malformed_output"
+NO_MATCH = "no_match"
+VERIFY_FAIL = "verify_fail"
+MODEL_API_ERROR = "model_api_error"
+PAGE_ERROR = "page_error"
+
+# 重试动作
+REFRESH_CAPTCHA = "refresh_captcha"  # 在验证码窗口内换一张图
+RELOAD_PAGE = "reload_page"          # 重新加载页面并再次点击签到
+ABORT = "abort"                      # 放弃当前账户
+
+# CaptchaHandler._solve_once 的返回值对应的失败类别
+SOLVE_OUTCOME_CLASSES = {
+    "no_image": IMAGE_FETCH,
+    "no_result": MALFORMED_OUTPUT,
+    "model_error": MODEL_API_ERROR,
+    "no_click": NO_MATCH,
+    "fail": VERIFY_FAIL,
+    "timeout": VERIFY_FAIL,
+    "page_error": PAGE_ERROR,
+}
+
+
+@dataclass
+class RetryRule:
+    """单个失败类别的重试规则"""
+    action: str
+    backoff: float = 0.0      # 首次重试前的等待（秒），之后每次翻倍
+    max_backoff: float = 0.0
+    max_count: int = 3        # 每个账户允许的该类失败次数，超过后放弃
+
+
+DEFAULT_RULES: Dict[str, RetryRule] = {
+    # 图片取不到多半是页面或网络状态异常，重新加载页面
+    IMAGE_FETCH: RetryRule(RELOAD_PAGE, backoff=2.0, max_backoff=10.0, max_count=3),
+    # 模型输出无法解析：换一张图重新识别
+    MALFORMED_OUTPUT: RetryRule(REFRESH_CAPTCHA, max_count=4),
+    # 没有格子与参考图匹配：换一张图
+    NO_MATCH: RetryRule(REFRESH_CAPTCHA, max_count=5),
+    # 验证失败：换一张图，稍作等待避免触发风控
+    VERIFY_FAIL: RetryRule(REFRESH_CAPTCHA, backoff=0.5, max_backoff=3.0, max_count=6),
+    # 模型接口超时或报错：指数退避，连续出错由模型路由熔断
+    MODEL_API_ERROR: RetryRule(REFRESH_CAPTCHA, backoff=3.0, max_backoff=30.0, max_count=3),
+    # 页面元素缺失或脚本异常：重新加载页面
+    PAGE_ERROR: RetryRule(RELOAD_PAGE, backoff=2.0, max_backoff=15.0, max_count=3),
+}
+
+
+@dataclass
+class RetryDecision:
+    """一次失败后的处理方式"""
+    action: str
+    delay: float = 0.0
+    reason: str = ""
+
+
+class RetryPolicy:
+    """
+    按失败类别决定重试动作与退避时间，并对每个账户的总耗时与模型开销设置预算
+
+    spend 返回本账户目前的 (模型请求次数, token 数)；model_outage 返回所有模型端点是否都已熔断。
+    """
+
+    def __init__(self, rules: Optional[Dict[str, RetryRule]] = None, max_seconds: float = 300.0,
+                 max_model_requests: int = 20, max_tokens: int = 0,
+                 spend: Optional[Callable[[], Tuple[int, int]]] = None,
+                 model_outage: Optional[Callable[[], bool]] = None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        self.max_seconds = max_seconds
+        self.max_model_requests = max_model_requests
+        self.max_tokens = max_tokens
+        self.spend = spend or (lambda: (0, 0))
+        self.model_outage = model_outage or (lambda: False)
+        self.started = time.time()
+        self.failures = Counter()
+        self.history: List[str] = []
+        self.abort_reason: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, config, spend=None, model_outage=None) -> 'RetryPolicy':
+        return cls(
+            max_seconds=config.retry_max_seconds,
+            max_model_requests=config.retry_max_model_requests,
+            max_tokens=config.retry_max_tokens,
+            spend=spend,
+            model_outage=model_outage
+        )
+
+    @staticmethod
+    def classify(outcome: str) -> str:
+        """把验证码处理结果归类，未知结果按页面错误处理"""
+        return SOLVE_OUTCOME_CLASSES.get(outcome, PAGE_ERROR)
+
+    def budget_exceeded(self) -> Optional[str]:
+        """检查时间与模型开销预算，返回超出的原因"""
+        elapsed = time.time() - self.started
+        if self.max_seconds and elapsed > self.max_seconds:
+            return f"耗时 {elapsed:.0f}s 超过预算 {self.max_seconds:.0f}s"
+        requests, tokens = self.spend()
+        if self.max_model_requests and requests >= self.max_model_requests:
+            return f"模型请求 {requests} 次达到预算 {self.max_model_requests} 次"
+        if self.max_tokens and tokens >= self.max_tokens:
+            return f"模型 token {tokens} 达到预算 {self.max_tokens}"
+        return None
+
+    def on_failure(self, failure_class: str) -> RetryDecision:
+        """记录一次失败并给出处理方式"""
+        self.failures[failure_class] += 1
+        self.history.append(failure_class)
+        count = self.failures[failure_class]
+        rule = self.rules.get(failure_class, self.rules[PAGE_ERROR])
+
+        reason = None
+        if failure_class in (MODEL_API_ERROR, MALFORMED_OUTPUT) and self.model_outage():
+            reason = "所有模型端点均已熔断"
+        elif count > rule.max_count:
+            reason = f"{failure_class} 失败 {count} 次，超过上限 {rule.max_count}"
+        else:
+            reason = self.budget_exceeded()
+        if reason:
+            self.abort_reason = reason
+            logger.warning(f"放弃当前账户: {reason}")
+            return RetryDecision(ABORT, reason=reason)
+
+        delay = 0.0
+        if rule.backoff:
+            delay = min(rule.max_backoff or rule.backoff, rule.backoff * 2 ** (count - 1))
+            delay *= random.uniform(0.8, 1.2)
+        logger.info(f"失败类别 {failure_class}（第 {count} 次）→ {rule.action}，等待 {delay:.1f}s")
+        return RetryDecision(rule.action, delay, failure_class)
+
+    @property
+    def aborted(self) -> bool:
+        return self.abort_reason is not None
+
+    def summary(self) -> str:
+        if not self.failures:
+            return "无失败"
+        return ", ".join(f"{name} {count}" for name, count in self.failures.most_common())
@@ -0,0 +1,207 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+# 子进程继承父进程的运行 ID，同一次运行的所有记录可以按 run_id 归并
+RUN_ID_ENV = "CHECKIN_RUN_ID"
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_account: Optional[str] = None
+# 协程引擎中多个账户在同一线程并发执行，每个任务有自己的账户上下文
+_task_account: contextvars.ContextVar = contextvars.ContextVar('checkin_account', default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_handlers: List[logging.Handler] = []  # 主进程的控制台与文件输出
+
+
+def run_id() -> str:
+    return os.environ.get(RUN_ID_ENV, "")
+
+
+def set_account(account: Optional[str]):
+    """
+    设置后续日志记录所属的账户
+
+    同时写入当前任务的上下文（asyncio 任务之间互不影响）与进程级的默认值（供其他线程使用）。
+    """
+    global _account
+    _account = account
+    _task_account.set(account)
+
+
+class _ContextFilter(logging.Filter):
+    """为每条记录附加运行 ID 与账户"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = run_id()
+        record.account = _task_account.get() or _account
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", ""),
+            "account": getattr(record, "account", None),
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+            entry["data"] = getattr(record, "data", {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _file_handler(path: str) -> logging.Handler:
+    """LOG_ROTATE=time 时每天零点轮转，否则按 LOG_MAX_BYTES 大小轮转"""
+    backups = int(os.environ.get("LOG_BACKUP_COUNT") or 5)
+    if (os.environ.get("LOG_ROTATE") or "size").lower() == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when="midnight", backupCount=backups, encoding='utf-8'
+        )
+    else:
+        max_bytes = int(os.environ.get("LOG_MAX_BYTES") or 5 * 1024 * 1024)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+        )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def _pointer_path(path: str) -> str:
+    return f"{path}.run"
+
+
+def _start_listener(handlers: List[logging.Handler]):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener:
+        _listener.stop()
+
+
+def setup_logging(path: Optional[str] = None, level: int = logging.INFO):
+    """
+    配置日志：控制台输出文本，文件输出 JSON lines（带运行 ID 与账户，按大小或时间轮转）
+
+    日志记录经队列交给后台线程写入，调用方不会因磁盘 IO 阻塞。主进程启动时记录本次运行在
+    日志文件中的起始位置，报告时直接定位到本次运行的记录。
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+    path = path or os.environ.get("LOG_FILE") or "checkin.jsonl"
+
+    if not os.environ.get(RUN_ID_ENV):
+        os.environ[RUN_ID_ENV] = uuid.uuid4().hex[:12]
+        file_handler = _file_handler(path)
+        # 轮转检查放在写入起始位置之前，保证位置指向当前文件
+        if isinstance(file_handler, logging.handlers.RotatingFileHandler) and file_handler.maxBytes > 0:
+            file_handler.stream.seek(0, os.SEEK_END)
+            if file_handler.stream.tell() >= file_handler.maxBytes:
+                file_handler.doRollover()
+        try:
+            with open(_pointer_path(path), 'w', encoding='utf-8') as f:
+                json.dump({"run_id": run_id(), "offset": os.path.getsize(path), "started": time.time()}, f)
+        except OSError:
+            pass
+    else:
+        file_handler = _file_handler(path)
+
+    global _handlers
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = _handlers = [console, file_handler]
+
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(_ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+    _start_listener(handlers)
+    atexit.register(_stop_listener)
+
+
+def start_worker_listener():
+    """
+    为工作进程池创建日志队列，返回 (队列, 监听器)
+
+    工作进程通过 attach_worker 把记录发往该队列，由主进程的监听线程写入控制台与日志文件，
+    日志文件只有主进程一个写入者。进程池关闭后调用监听器的 stop() 写完剩余记录。
+    """
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *_handlers, respect_handler_level=True)
+    listener.start()
+    return log_queue, listener
+
+
+def attach_worker(log_queue):
+    """
+    工作进程初始化（ProcessPoolExecutor 的 initializer）：日志只发往主进程的队列
+
+    多个进程各自轮转同一个日志文件会丢失或交错记录，也会使本次运行的起始位置失效，
+    因此工作进程不打开日志文件。fork 继承的监听线程在子进程中不存在，直接丢弃。
+    """
+    global _queue_handler, _listener
+    root = logging.getLogger()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _queue_handler.addFilter(_ContextFilter())
+    root.setLevel(logging.INFO)
+    root.addHandler(_queue_handler)
+
+
+def flush():
+    """等待队列中的记录全部写入（发送报告前调用）"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _start_listener(list(_listener.handlers))
+
+
+def current_run_records(path: Optional[str] = None) -> Iterator[Dict]:
+    """读取本次运行的日志记录：从起始位置开始读，并按运行 ID 过滤"""
+    path = path or os.environ.get("LOG_FILE") or "checkin.jsonl"
+    try:
+        with open(_pointer_path(path), 'r', encoding='utf-8') as f:
+            pointer = json.load(f)
+    except (OSError, ValueError):
+        return
+    if not os.path.exists(path):
+        return
+
+    # 运行期间发生了轮转时，当前文件只包含轮转后的记录
+    offset = pointer.get("offset", 0)
+    if offset > os.path.getsize(path):
+        offset = 0
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("run_id") == pointer.get("run_id"):
+                yield entry
@@ -1,3 +1,4 @@
+import json
 import smtplib
 import os
 from email.mime.text import MIMEText
@@ -6,13 +7,35 @@ from email.mime.base import MIMEBase
 from email import encoders
 from datetime import datetime
 
+from run_log import current_run_records, flush
 
-def send_log_email(log_file='checkin.log'):
+DONE_OUTCOMES = ("success", "already_signed")
+
+
+def _run_status(records):
+    """根据结构化的账户结果记录判断本次运行是否成功"""
+    outcomes = [r['data'].get('outcome') for r in records if r.get('event') == 'account_result']
+    summaries = [r['data'] for r in records if r.get('event') == 'run_summary']
+    if not outcomes:
+        return False
+    if summaries and summaries[-1].get('succeeded') != summaries[-1].get('accounts'):
+        return False
+    return all(outcome in DONE_OUTCOMES for outcome in outcomes)
+
+
+def _format_record(record):
+    """把一条 JSON 日志记录还原为文本行"""
+    time_text = datetime.fromtimestamp(record.get('ts', 0)).strftime('%Y-%m-%d %H:%M:%S')
+    account = f"[{record['account']}] " if record.get('account') else ""
+    return f"{time_text} - {record.get('level', '')} - {account}{record.get('message', '')}"
+
+
+def send_log_email(log_file=None):
     """
-    发送签到日志邮件
+    发送签到日志邮件（只包含本次运行的日志记录）
     
     Args:
-        log_file: 日志文件路径
+        log_file: 日志文件路径，默认使用 LOG_FILE 或 checkin.jsonl
     """
     # 从环境变量读取配置
     smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
@@ -27,16 +50,16 @@ def send_log_email(log_file='checkin.log'):
         return False
     
     try:
-        # 读取日志内容
-        log_content = ""
-        if os.path.exists(log_file):
-            with open(log_file, 'r', encoding='utf-8') as f:
-                log_content = f.read()
+        # 在同一进程中调用时先写完队列中的记录，再直接定位到本次运行的日志记录
+        flush()
+        records = list(current_run_records(log_file))
+        if records:
+            log_content = "\n".join(_format_record(r) for r in records)
         else:
-            log_content = "日志文件不存在"
+            log_content = "未找到本次运行的日志记录"
         
-        # 判断签到是否成功（根据日志内容）
-        is_success = "签到流程完成" in log_content or "验证码验证成功" in log_content
+        # 判断签到是否成功（根据记录的账户结果）
+        is_success = _run_status(records)
         status_emoji = "✅" if is_success else "❌"
         status_text = "成功" if is_success else "失败"
         
@@ -65,13 +88,12 @@ SakuraFrp 自动签到报告
         
         msg.attach(MIMEText(body, 'plain', 'utf-8'))
         
-        # 添加日志附件
-        if os.path.exists(log_file):
-            with open(log_file, 'rb') as f:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(f.read())
+        # 添加本次运行的日志附件
+        if records:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload("\n".join(json.dumps(r, ensure_ascii=False) for r in records).encode('utf-8'))
             encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename= {os.path.basename(log_file)}')
+            part.add_header('Content-Disposition', f"attachment; filename= checkin-{records[0].get('run_id', 'run')}.jsonl")
             msg.attach(part)
         
         # 发送邮件
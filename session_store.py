@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# setCookies 接受的字段
+_COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+
+# 在每个新文档中按 origin 回填 localStorage（不覆盖页面已有的值）
+_LOCAL_STORAGE_SCRIPT = """
+(function(storage) {
+    var items = storage[location.origin];
+    if (!items) { return; }
+    try {
+        Object.keys(items).forEach(function(key) {
+            if (window.localStorage.getItem(key) === null) {
+                window.localStorage.setItem(key, items[key]);
+            }
+        });
+    } catch (e) {}
+})(%s);
+"""
+
+
+class SessionStore:
+    """按账户持久化浏览器会话（Cookie 与 localStorage）"""
+
+    def __init__(self, session_dir: str, max_age_days: int = 7):
+        self.session_dir = session_dir
+        self.max_age = max_age_days * 86400
+        self.script_ids = []  # 已注入的 localStorage 回填脚本，复用浏览器时移除
+
+    def _path(self, account: str) -> str:
+        """账户对应的会话文件路径（文件名使用哈希，避免泄露用户名）"""
+        digest = hashlib.sha256(account.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.session_dir, f"{digest}.json")
+
+    def load(self, account: str) -> Optional[Dict]:
+        """读取账户会话，不存在或已过期时返回 None"""
+        path = self._path(account)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取会话文件失败: {e}")
+            return None
+
+        if time.time() - session.get('saved_at', 0) > self.max_age:
+            logger.info("本地会话已超过最大保存时间，忽略")
+            return None
+        return session
+
+    def save(self, driver, account: str):
+        """保存当前浏览器的 Cookie 与当前页面 origin 的 localStorage"""
+        try:
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get('cookies', [])
+            origin = driver.execute_script("return location.origin;")
+            items = driver.execute_script("return Object.assign({}, window.localStorage);") or {}
+            self.save_data(account, cookies, origin, items)
+        except Exception as e:
+            logger.warning(f"保存会话失败: {e}")
+
+    def save_data(self, account: str, cookies: List[Dict], origin: Optional[str], items: Dict):
+        """写入会话文件：Cookie 整体替换，localStorage 按 origin 合并"""
+        try:
+            previous = self.load(account) or {}
+            local_storage = previous.get('local_storage', {})
+            if origin and origin.startswith('http'):
+                local_storage[origin] = items
+
+            os.makedirs(self.session_dir, exist_ok=True)
+            path = self._path(account)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'saved_at': time.time(),
+                    'cookies': cookies,
+                    'local_storage': local_storage,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            logger.info(f"已保存会话（{len(cookies)} 个 Cookie）")
+        except Exception as e:
+            logger.warning(f"保存会话失败: {e}")
+
+    def restore_payload(self, account: str) -> Tuple[List[Dict], Optional[str]]:
+        """
+        账户会话中仍有效的 Cookie（Network.setCookies 格式）与 localStorage 回填脚本
+
+        没有可用会话时返回 ([], None)
+        """
+        session = self.load(account)
+        if not session:
+            return [], None
+
+        now = time.time()
+        cookies = []
+        for cookie in session.get('cookies', []):
+            # 跳过已过期的持久 Cookie（expires <= 0 表示会话 Cookie）
+            expires = cookie.get('expires', -1)
+            if 0 < expires < now:
+                continue
+            cookies.append({k: cookie[k] for k in _COOKIE_FIELDS if k in cookie})
+
+        if not cookies:
+            logger.info("本地会话中没有有效 Cookie")
+            return [], None
+        local_storage = session.get('local_storage', {})
+        script = _LOCAL_STORAGE_SCRIPT % json.dumps(local_storage) if local_storage else None
+        return cookies, script
+
+    def restore(self, driver, account: str) -> bool:
+        """在浏览器启动后恢复账户会话，返回是否有可用会话"""
+        cookies, script = self.restore_payload(account)
+        if not cookies:
+            return False
+
+        try:
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+            if script:
+                result = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+                    "source": script
+                })
+                if result and result.get('identifier'):
+                    self.script_ids.append(result['identifier'])
+            logger.info(f"已恢复本地会话（{len(cookies)} 个 Cookie）")
+            return True
+        except Exception as e:
+            logger.warning(f"恢复会话失败: {e}")
+            return False
+
+    def remove_scripts(self, driver):
+        """移除之前账户注入的 localStorage 回填脚本"""
+        for identifier in self.script_ids:
+            try:
+                driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": identifier})
+            except Exception as e:
+                logger.warning(f"移除会话脚本失败: {e}")
+        self.script_ids = []
+
+    def clear(self, account: str):
+        """删除账户会话"""
+        path = self._path(account)
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info("已删除失效的本地会话")
@@ -0,0 +1,235 @@
+import io
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 验证码图片布局：上方为 3×3 九宫格（边长等于图片宽度的正方形），
+# 下方剩余区域的左下角为参考图（边长等于剩余区域高度的正方形）
+GRID_SIZE = 3
+FEATURE_SIDE = 12
+HIST_BINS = 4
+
+
+def split_captcha(image_bytes: bytes) -> Optional[List['Image.Image']]:
+    """将验证码图片切分为 9 个格子与参考图，按位置 1~10 排列"""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = img.convert('RGB')
+        width, height = img.size
+        grid_side = min(width, height)
+        tile = grid_side // GRID_SIZE
+        ref_side = height - grid_side
+        if tile == 0 or ref_side < tile // 4:
+            logger.debug(f"验证码图片尺寸 {width}x{height} 不符合九宫格布局")
+            return None
+
+        crops = []
+        for row in range(GRID_SIZE):
+            for col in range(GRID_SIZE):
+                box = (col * tile, row * tile, (col + 1) * tile, (row + 1) * tile)
+                crops.append(img.crop(box))
+        crops.append(img.crop((0, grid_side, min(ref_side, width), height)))
+        return crops
+
+
+def tile_features(crop: 'Image.Image') -> 'np.ndarray':
+    """计算格子的紧凑特征：归一化灰度缩略图 + RGB 联合颜色直方图，L2 归一化"""
+    small = crop.resize((FEATURE_SIDE, FEATURE_SIDE), Image.BILINEAR)
+    rgb = np.asarray(small, dtype=np.float32)
+
+    gray = rgb.mean(axis=2).ravel()
+    gray -= gray.mean()
+    gray /= np.linalg.norm(gray) + 1e-6
+
+    quantized = (rgb // (256 // HIST_BINS)).astype(np.int32).reshape(-1, 3)
+    codes = quantized[:, 0] * HIST_BINS * HIST_BINS + quantized[:, 1] * HIST_BINS + quantized[:, 2]
+    hist = np.bincount(codes, minlength=HIST_BINS ** 3).astype(np.float32)
+    hist /= np.linalg.norm(hist) + 1e-6
+
+    vector = np.concatenate([gray, hist])
+    return vector / (np.linalg.norm(vector) + 1e-6)
+
+
+class TileIndex:
+    """
+    由历史验证成功的格子组成的最近邻索引，高置信度时可替代视觉模型
+
+    样本保存在 SQLite 中，只追加新行，多个工作进程同时学习时不会互相覆盖；查询与添加前读取
+    其他进程新增的样本。协程引擎中多个账户在工作线程中同时查询与添加，内存中的向量与标签数组
+    在锁内读取与替换。
+    """
+
+    def __init__(self, path: str, threshold: float = 0.92, max_entries: int = 20000):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.available = np is not None
+        self.lock = threading.Lock()
+        self.conn = None
+        self.vectors = None
+        self.labels = None
+        self._last_id = 0  # 已读入内存的最大样本 ID
+        if not self.available:
+            logger.info("未安装 numpy/Pillow，禁用本地格子索引")
+            return
+
+        self.dim = FEATURE_SIDE * FEATURE_SIDE + HIST_BINS ** 3
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.labels = np.zeros((0,), dtype=str)
+        self.conn = self._connect()
+        self._refresh()
+        if len(self.labels):
+            logger.info(f"已加载本地格子索引，共 {len(self.labels)} 个样本")
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """打开样本库，打开失败时只在内存中学习"""
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tile_samples ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " label TEXT NOT NULL,"
+                " vector BLOB NOT NULL)"
+            )
+            conn.commit()
+            return conn
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"打开本地格子索引失败，本次不保存: {e}")
+            return None
+
+    def _refresh(self):
+        """读入其他进程新增的样本（调用方持有锁或在初始化中）"""
+        if self.conn is None:
+            return
+        try:
+            rows = self.conn.execute(
+                "SELECT id, label, vector FROM tile_samples WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"读取本地格子索引失败: {e}")
+            return
+        if not rows:
+            return
+        self._last_id = rows[-1][0]
+        # 向量按 float32 原始字节保存，只接受维度一致的样本
+        rows = [(label, vector) for _, label, vector in rows if len(vector) == self.dim * 4]
+        if not rows:
+            return
+        vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector in rows])
+        labels = np.array([label for label, _ in rows], dtype=str)
+        self.vectors = np.concatenate([self.vectors, vectors])[-self.max_entries:]
+        self.labels = np.concatenate([self.labels, labels])[-self.max_entries:]
+
+    def _lookup(self, vectors: 'np.ndarray') -> List[Tuple[str, float]]:
+        """返回每个向量的最近邻标签与相似度"""
+        similarities = vectors @ self.vectors.T
+        best = similarities.argmax(axis=1)
+        return [(str(self.labels[j]), float(similarities[i, j])) for i, j in enumerate(best)]
+
+    def recognize(self, image_bytes: bytes) -> Optional[Dict]:
+        """尝试用本地索引识别验证码，所有格子都达到置信度阈值时返回与模型相同格式的结果"""
+        if not self.available:
+            return None
+        try:
+            crops = split_captcha(image_bytes)
+        except Exception as e:
+            logger.debug(f"切分验证码图片失败: {e}")
+            return None
+        if not crops:
+            return None
+
+        vectors = np.stack([tile_features(crop) for crop in crops])
+        with self.lock:
+            self._refresh()
+            if len(self.labels) == 0:
+                return None
+            matches = self._lookup(vectors)
+        weakest = min(similarity for _, similarity in matches)
+        if weakest < self.threshold:
+            logger.info(f"本地格子索引置信度不足 ({weakest:.3f} < {self.threshold})，回退到视觉模型")
+            return None
+
+        result = {str(position): label for position, (label, _) in enumerate(matches, start=1)}
+        if not any(result[str(position)] == result["10"] for position in range(1, 10)):
+            logger.info("本地格子索引未找到与参考图匹配的格子，回退到视觉模型")
+            return None
+
+        logger.info(f"本地格子索引命中，最低相似度 {weakest:.3f}")
+        return result
+
+    def add(self, image_bytes: bytes, recognition_result: Dict):
+        """将验证成功的识别结果按格子加入索引"""
+        if not self.available:
+            return
+        try:
+            crops = split_captcha(image_bytes)
+        except Exception as e:
+            logger.debug(f"切分验证码图片失败: {e}")
+            return
+        if not crops:
+            return
+
+        vectors, labels = [], []
+        for position, crop in enumerate(crops, start=1):
+            label = str(recognition_result.get(str(position), "")).strip()
+            if label:
+                vectors.append(tile_features(crop))
+                labels.append(label)
+        if not vectors:
+            return
+
+        new_vectors = np.stack(vectors).astype(np.float32)
+        with self.lock:
+            self._refresh()
+            if len(self.labels):
+                # 跳过与已有同标签样本几乎相同的格子
+                keep = [
+                    i for i, (label, similarity) in enumerate(self._lookup(new_vectors))
+                    if not (label == labels[i] and similarity > 0.995)
+                ]
+                new_vectors = new_vectors[keep]
+                labels = [labels[i] for i in keep]
+            if not labels:
+                return
+
+            if not self._save(new_vectors, labels):
+                self.vectors = np.concatenate([self.vectors, new_vectors])[-self.max_entries:]
+                self.labels = np.concatenate([self.labels, np.array(labels, dtype=str)])[-self.max_entries:]
+            logger.info(f"本地格子索引新增 {len(labels)} 个样本，共 {len(self.labels)} 个")
+
+    def _save(self, vectors: 'np.ndarray', labels: List[str]) -> bool:
+        """
+        追加样本并淘汰超出容量的最早样本，再读入库中的新样本（包括刚写入的）
+
+        调用方持有锁；写入失败时只记录日志并返回 False，由调用方只加入内存。
+        """
+        if self.conn is None:
+            return False
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO tile_samples (label, vector) VALUES (?, ?)",
+                    [(label, vector.tobytes()) for label, vector in zip(labels, vectors)]
+                )
+                self.conn.execute(
+                    "DELETE FROM tile_samples WHERE id IN ("
+                    " SELECT id FROM tile_samples ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"保存本地格子索引失败: {e}")
+            return False
+        self._refresh()
+        return True
@@ -0,0 +1,131 @@
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TimingProfile:
+    """人类行为节奏配置，每项为随机抖动区间（秒）"""
+    name: str
+    after_login: Tuple[float, float]
+    after_click: Tuple[float, float]
+    between_tiles: Tuple[float, float]
+    captcha_exit: Tuple[float, float]
+    typing: Tuple[float, float]
+
+
+PROFILES = {
+    "human": TimingProfile(
+        name="human",
+        after_login=(1.0, 2.0),
+        after_click=(1.0, 2.0),
+        between_tiles=(0.3, 0.6),
+        captcha_exit=(1.0, 2.0),
+        typing=(0.05, 0.2),
+    ),
+    "fast": TimingProfile(
+        name="fast",
+        after_login=(0.0, 0.0),
+        after_click=(0.0, 0.0),
+        between_tiles=(0.0, 0.0),
+        captcha_exit=(0.0, 0.0),
+        typing=(0.0, 0.0),
+    ),
+}
+
+
+def get_profile(name: str) -> TimingProfile:
+    """按名称获取节奏配置"""
+    if name not in PROFILES:
+        raise ValueError(f"TIMING_PROFILE 不支持: {name}")
+    return PROFILES[name]
+
+
+class WaitEngine:
+    """基于真实页面条件的等待，并记录每次等待的耗时"""
+
+    def __init__(self, profile: TimingProfile, timeout: float = 20.0, poll: float = 0.1):
+        self.profile = profile
+        self.timeout = timeout
+        self.poll = poll
+        self.timings = defaultdict(list)
+
+    def _record(self, name: str, start: float):
+        self.timings[name].append(time.time() - start)
+
+    def until(self, driver, name: str, condition: Callable, timeout: Optional[float] = None):
+        """等待任意条件成立并记录耗时，超时抛出 TimeoutException"""
+        start = time.time()
+        try:
+            return WebDriverWait(driver, timeout or self.timeout, poll_frequency=self.poll).until(condition)
+        finally:
+            self._record(name, start)
+
+    def dom_ready(self, driver, timeout: Optional[float] = None):
+        """等待文档可交互（eager 加载策略下不必等所有资源加载完）"""
+        return self.until(
+            driver, "dom_ready",
+            lambda d: d.execute_script("return document.readyState") in ("interactive", "complete"),
+            timeout
+        )
+
+    def visible(self, driver, locator, name: str, timeout: Optional[float] = None):
+        """等待元素可见"""
+        return self.until(driver, name, EC.visibility_of_element_located(locator), timeout)
+
+    def gone(self, driver, locator, name: str, timeout: Optional[float] = None) -> bool:
+        """等待元素消失，超时返回 False"""
+        try:
+            self.until(driver, name, EC.invisibility_of_element_located(locator), timeout)
+            return True
+        except TimeoutException:
+            return False
+
+    def commit_enabled(self, driver, timeout: Optional[float] = None):
+        """等待验证码确认按钮去掉 geetest_disable 状态"""
+        def enabled(d):
+            buttons = d.find_elements(By.CLASS_NAME, "geetest_commit")
+            if buttons and "geetest_disable" not in (buttons[0].get_attribute("class") or ""):
+                return buttons[0]
+            return False
+        return self.until(driver, "commit_enabled", enabled, timeout)
+
+    def schedule(self, name: str, count: int) -> List[float]:
+        """预先生成 count 次抖动（秒），供页面内脚本按节奏执行"""
+        low, high = getattr(self.profile, name)
+        if high <= 0:
+            return [0.0] * count
+        return [random.uniform(low, high) for _ in range(count)]
+
+    def record(self, name: str, seconds: float):
+        """记录在页面内完成的等待"""
+        self.timings[name].append(seconds)
+
+    def jitter(self, name: str):
+        """按节奏配置插入人类行为抖动"""
+        low, high = getattr(self.profile, name)
+        if high <= 0:
+            return
+        start = time.time()
+        time.sleep(random.uniform(low, high))
+        self._record(f"jitter:{name}", start)
+
+    def log_summary(self):
+        """输出各类等待的次数与总耗时"""
+        if not self.timings:
+            return
+        lines = [
+            f"{name}: {len(values)} 次, 共 {sum(values):.2f}s, 最长 {max(values):.2f}s"
+            for name, values in sorted(self.timings.items())
+        ]
+        logger.info(f"等待耗时统计（{self.profile.name}）:\n" + "\n".join(lines))
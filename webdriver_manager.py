@@ -2,17 +2,25 @@ import logging
 import os
 import time
 import random
-from typing import Optional
+from urllib.parse import urlparse
 
-from seleniumwire import webdriver
+from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
+from chrome_flags import LEAN_ARGS, find_headless_shell
+from config import USER_AGENT
+from network_observer import NetworkObserver, WireNetworkObserver
+from request_policy import RequestPolicy
+from session_store import SessionStore
 
 logger = logging.getLogger(__name__)
 
+# 需要读取响应体的请求（GeeTest 验证结果接口与验证码图片）
+VERIFY_URL_FILTER = 'api.geevisit.com/ajax.php'
+CAPTCHA_IMAGE_URL_FILTER = 'static.geetest.com'
 
 class WebDriverManager:
     """WebDriver 管理器"""
@@ -20,51 +28,86 @@ class WebDriverManager:
     def __init__(self, config):
         self.config = config
         self.driver = None
+        self.network = None
+        self.session_store = SessionStore(config.session_dir, config.session_max_age_days)
+        self.session_restored = False
+        self.runs = 0  # 当前浏览器已执行的签到次数（常驻模式下复用浏览器）
+        self.headless = False
     
-    def initialize(self, headless: bool = False):
-        """初始化 Selenium-Wire WebDriver"""
-        logger.info("正在初始化 Selenium-Wire WebDriver...")
+    def initialize(self, headless: bool = False, prepare: bool = True):
+        """
+        初始化 WebDriver（已有可用的浏览器时清空状态后复用）
+
+        prepare=False 时只启动浏览器，不为账户准备网络监听与会话（常驻模式预热），
+        下一次 initialize 会按复用流程为账户准备。
+        """
+        use_wire = self.config.network_backend == "wire"
+        if self.driver and self.alive():
+            return self._reuse(use_wire) if prepare else self.driver
+        self.headless = headless
+        
+        logger.info(f"正在初始化 WebDriver（网络监听: {self.config.network_backend}）...")
         
-        # 配置 selenium-wire 以捕获请求
-        wire_options = {
-            'disable_capture': False,  # 启用请求捕获
-            'disable_encoding': True,   # 禁用内容编码以便读取响应
-        }
+        driver_kwargs = {}
+        if use_wire:
+            # 配置 selenium-wire 以捕获请求
+            driver_kwargs['seleniumwire_options'] = {
+                'disable_capture': False,  # 启用请求捕获
+                'disable_encoding': True,   # 禁用内容编码以便读取响应
+            }
         
         ops = Options()
+        ops.page_load_strategy = self.config.page_load_strategy
         ops.add_experimental_option("detach", not headless)
-        ops.add_argument('--window-size=1280,800')
+        lean = self.config.browser_profile == "lean"
+        if lean:
+            for argument in LEAN_ARGS:
+                ops.add_argument(argument)
+        else:
+            ops.add_argument('--window-size=1280,800')
         ops.add_argument('--disable-blink-features=AutomationControlled')
         ops.add_argument('--no-proxy-server')
         ops.add_argument('--lang=zh-CN')
         ops.add_argument('--disable-gpu')
         ops.add_argument('--no-sandbox')
         ops.add_argument('--disable-dev-shm-usage')  # 解决 Docker/CI 环境内存问题
-
-        ops.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
         
-        # 2. 只有在非 CI 环境才禁用这些 (CI环境有时候禁用 sandbox 会导致崩溃，但 try it)
-        ops.add_argument('--no-sandbox')
-        ops.add_argument('--disable-dev-shm-usage')
+        if not use_wire:
+            # 通过 performance 日志接收 DevTools Network 事件，不经过代理
+            ops.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+            ops.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+        ops.add_argument(f'--user-agent={USER_AGENT}')
         
         # GitHub Actions 环境必须使用 headless 模式
+        headless_shell = None
         if headless or os.getenv('CI') == 'true':
             logger.info("检测到 CI 环境或 headless 模式，启用无头浏览器")
-            ops.add_argument('--headless=new')  # 使用新的 headless 模式
+            headless_shell = find_headless_shell(self.config) if lean else None
+            # chrome-headless-shell 本身就是无头浏览器，只支持旧版 headless 参数
+            ops.add_argument('--headless' if headless_shell else '--headless=new')
             ops.add_argument('--disable-software-rasterizer')
         
         # 设置自定义 Chrome 路径
-        if self.config.chrome_binary_path and os.path.exists(self.config.chrome_binary_path):
+        if headless_shell:
+            logger.info(f"使用 chrome-headless-shell: {headless_shell}")
+            ops.binary_location = headless_shell
+        elif self.config.chrome_binary_path and os.path.exists(self.config.chrome_binary_path):
             logger.info(f"使用自定义 Chrome 路径: {self.config.chrome_binary_path}")
             ops.binary_location = self.config.chrome_binary_path
         
         try:
+            chrome = webdriver.Chrome
+            if use_wire:
+                from seleniumwire import webdriver as wire_webdriver
+                chrome = wire_webdriver.Chrome
+            
             # 在 CI 环境中，chromedriver 通常已安装在系统路径
             if os.getenv('CI') == 'true':
                 logger.info("CI 环境中使用系统 ChromeDriver")
-                self.driver = webdriver.Chrome(
+                self.driver = chrome(
                     options=ops,
-                    seleniumwire_options=wire_options
+                    **driver_kwargs
                 )
             else:
                 # 本地环境使用项目目录中的 chromedriver
@@ -75,10 +118,10 @@ class WebDriverManager:
                 
                 logger.info(f"使用本地驱动: {local_driver_path}")
                 service = Service(executable_path=local_driver_path)
-                self.driver = webdriver.Chrome(
+                self.driver = chrome(
                     service=service,
                     options=ops,
-                    seleniumwire_options=wire_options
+                    **driver_kwargs
                 )
             
             if self.driver:
@@ -89,6 +132,8 @@ class WebDriverManager:
                         });
                     """
                 })
+                if prepare:
+                    self._prepare_run(use_wire)
 
             logger.info("WebDriver 初始化成功")
             return self.driver
@@ -97,8 +142,85 @@ class WebDriverManager:
             logger.error(f"WebDriver 初始化失败: {e}", exc_info=True)
             return None
     
+    def _prepare_run(self, use_wire: bool):
+        """为当前账户准备浏览器：网络监听、请求屏蔽与会话恢复"""
+        self.runs += 1
+        observer = WireNetworkObserver if use_wire else NetworkObserver
+        self.network = observer(self.driver, [VERIFY_URL_FILTER, CAPTCHA_IMAGE_URL_FILTER])
+        
+        # 屏蔽签到流程用不到的资源
+        if self.config.request_blocking:
+            RequestPolicy.from_config(self.config).apply(self.driver)
+        
+        # 恢复账户的持久化会话，后续可跳过完整登录
+        self.session_restored = self.session_store.restore(
+            self.driver, self.config.sakurafrp_user
+        )
+    
+    def _reuse(self, use_wire: bool):
+        """复用已启动的浏览器：清空上一个账户的 Cookie、存储与注入脚本"""
+        try:
+            self.driver.get("about:blank")
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            self.driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            origin = "{0.scheme}://{0.netloc}".format(urlparse(self.config.login_url))
+            self.driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": origin, "storageTypes": "all"
+            })
+            self.session_store.remove_scripts(self.driver)
+            if use_wire:
+                del self.driver.requests
+            self._prepare_run(use_wire)
+            logger.info(f"复用已启动的浏览器（第 {self.runs} 次签到）")
+            return self.driver
+        except Exception as e:
+            logger.warning(f"复用浏览器失败，重新启动: {e}")
+            self.close()
+            return self.initialize(headless=self.headless)
+    
+    def alive(self) -> bool:
+        """浏览器是否仍可响应"""
+        try:
+            self.driver.execute_cdp_cmd("Browser.getVersion", {})
+            return True
+        except Exception:
+            return False
+    
+    def inject_cookies(self, cookies):
+        """注入 HTTP 客户端登录得到的 Cookie，浏览器无需再次登录"""
+        if not self.driver or not cookies:
+            return
+        try:
+            self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+            self.session_restored = True
+            logger.info(f"已注入 HTTP 会话 Cookie（{len(cookies)} 个）")
+        except Exception as e:
+            logger.warning(f"注入 Cookie 失败: {e}")
+    
+    def save_session(self):
+        """保存当前账户的会话"""
+        if self.driver:
+            self.session_store.save(self.driver, self.config.sakurafrp_user)
+    
+    def clear_session(self):
+        """删除当前账户的会话"""
+        self.session_store.clear(self.config.sakurafrp_user)
+        self.session_restored = False
+    
+    def log_network_report(self):
+        """输出本次运行的网络请求统计"""
+        if self.network and self.config.network_backend == "cdp":
+            self.network.pump()
+            logger.info(f"网络请求统计（加载策略 {self.config.page_load_strategy}）: {self.network.stats.report()}")
+    
     def close(self):
         """关闭 WebDriver"""
         if self.driver:
-            self.driver.quit()
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logger.warning(f"关闭 WebDriver 出错: {e}")
+            self.driver = None
+            self.network = None
+            self.runs = 0
             logger.info("WebDriver 已关闭")
\ No newline at end of file